@@ -0,0 +1,232 @@
+"""End-to-end benchmark of starting, gracefully reloading and stopping Galaxy with supervisor.
+
+Generates a fake Galaxy root, whose job handler ``lib/galaxy/main.py`` is a stub, and a fake virtualenv with stub
+``gunicorn``, ``celery`` and ``tusd`` executables, so that no Galaxy clone or network access is needed. Each stub
+accepts the command line that Gravity runs it with, sleeps for ``--boot-time`` seconds, allocates ``--memory`` MB, and
+then runs until it is terminated: the gunicorn stub answers HTTP requests on its bind address (so that its health check
+passes), the tusd stub accepts connections on its port, and the job handler stub writes its pid file.
+
+For each combination of ``--instances`` and ``--handlers`` (job handler processes per instance), the instances are
+registered in a fresh state dir, and ``galaxyctl start``, ``galaxyctl graceful`` and ``galaxyctl stop`` are run
+``--repeat`` times through the supervisor process manager, reporting percentiles of the wall-clock time of each.
+
+supervisord only considers a program running once it has stayed up for its ``startsecs``, which Gravity sets to 10-20
+seconds and which would dominate the results, so the ``startsecs`` of every program are set to ``--startsecs``.
+
+Usage::
+
+    python benchmarks/lifecycle.py [--instances 1,2,4] [--handlers 1,4] [--repeat 3] [--boot-time 0.5] [--memory 20]
+                                   [--startsecs 1] [--base-port 18080]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+
+from gravity.cli import galaxyctl
+from gravity.io import error, info
+from gravity.process_manager import supervisor_manager
+
+OPERATIONS = ("start", "graceful", "stop")
+PERCENTILES = (50, 90, 100)
+
+STUB_TEMPLATE = """#!{python}
+# Fake {kind} generated by Gravity's lifecycle benchmark
+BOOT_TIME = {boot_time!r}
+MEMORY_MB = {memory!r}
+KIND = {kind!r}
+"""
+STUB_BODY = '''
+import os
+import signal
+import socket
+import sys
+import time
+
+HTTP_RESPONSE = b"HTTP/1.1 200 OK\\r\\nContent-Type: application/json\\r\\nContent-Length: 2\\r\\nConnection: close\\r\\n\\r\\n{}"
+
+
+def listen_address(args):
+    """Return the address that gunicorn (``-b HOST:PORT``) or tusd (``-host=HOST -port=PORT``) would listen on"""
+    if "-b" in args:
+        host, _, port = args[args.index("-b") + 1].rpartition(":")
+        return host, int(port)
+    options = dict(arg.lstrip("-").split("=", 1) for arg in args if arg.startswith("-") and "=" in arg)
+    if "port" in options:
+        return options.get("host", "localhost"), int(options["port"])
+    return None
+
+
+def main():
+    args = sys.argv[1:]
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGHUP, lambda signum, frame: print(f"{KIND}: reloading", flush=True))
+    print(f"{KIND}: booting", flush=True)
+    time.sleep(BOOT_TIME)
+    # held until the process exits
+    ballast = b"\\x01" * (MEMORY_MB * 1024 * 1024)
+    for arg in args:
+        if arg.startswith("--pid-file="):
+            with open(arg.split("=", 1)[1], "w") as fh:
+                fh.write(str(os.getpid()))
+    address = listen_address(args)
+    if address is None:
+        print(f"{KIND}: running", flush=True)
+        while True:
+            signal.pause()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(64)
+    print(f"{KIND}: listening on {address[0]}:{address[1]}", flush=True)
+    while True:
+        conn, _ = sock.accept()
+        with conn:
+            if KIND == "gunicorn":
+                conn.recv(65536)
+                conn.sendall(HTTP_RESPONSE)
+
+
+main()
+'''
+
+
+def write_stub(path, kind, boot_time, memory):
+    with open(path, "w") as fh:
+        fh.write(STUB_TEMPLATE.format(python=sys.executable, kind=kind, boot_time=boot_time, memory=memory) + STUB_BODY)
+    os.chmod(path, 0o755)
+
+
+def generate_galaxy(root, boot_time, memory):
+    """Write the fake Galaxy root and virtualenv under ``root`` and return their paths"""
+    galaxy_root = os.path.join(root, "galaxy")
+    virtualenv = os.path.join(root, "venv")
+    bin_dir = os.path.join(virtualenv, "bin")
+    os.makedirs(os.path.join(galaxy_root, "lib", "galaxy"))
+    os.makedirs(bin_dir)
+    write_stub(os.path.join(galaxy_root, "lib", "galaxy", "main.py"), "handler", boot_time, memory)
+    for kind in ("gunicorn", "celery", "tusd"):
+        write_stub(os.path.join(bin_dir, kind), kind, boot_time, memory)
+    # job handlers are run with the virtualenv's python
+    os.symlink(sys.executable, os.path.join(bin_dir, "python"))
+    return galaxy_root, virtualenv
+
+
+def generate_configs(root, galaxy_root, virtualenv, instances, handlers, base_port):
+    """Write the configs of ``instances`` instances with ``handlers`` job handlers each and return their paths"""
+    config_files = []
+    for index in range(instances):
+        config_dir = os.path.join(root, f"config{index}")
+        os.makedirs(config_dir)
+        config_file = os.path.join(config_dir, "galaxy.yml")
+        with open(config_file, "w") as fh:
+            fh.write("\n".join([
+                "galaxy:",
+                f"  galaxy_infrastructure_url: http://localhost:{base_port + 2 * index}",
+                "gravity:",
+                f"  instance_name: instance{index}",
+                f"  galaxy_root: {galaxy_root}",
+                f"  virtualenv: {virtualenv}",
+                f"  log_dir: {config_dir}/log",
+                "  gunicorn:",
+                f"    bind: localhost:{base_port + 2 * index}",
+                "  tusd:",
+                "    enable: true",
+                f"    tusd_path: {virtualenv}/bin/tusd",
+                f"    port: {base_port + 2 * index + 1}",
+                f"    upload_dir: {config_dir}/tus",
+                "  handlers:",
+                "    handler:",
+                f"      processes: {handlers}",
+                "      pools:",
+                "        - job-handlers",
+                "        - workflow-schedulers",
+            ]) + "\n")
+        config_files.append(config_file)
+    return config_files
+
+
+def set_startsecs(startsecs):
+    for service_type, template in supervisor_manager.SUPERVISORD_SERVICE_TEMPLATES.items():
+        supervisor_manager.SUPERVISORD_SERVICE_TEMPLATES[service_type] = re.sub(
+            r"^startsecs(\s*)= \d+$", rf"startsecs\g<1>= {startsecs}", template, flags=re.MULTILINE
+        )
+
+
+def run_galaxyctl(state_dir, *args):
+    """Run ``galaxyctl`` in this process, so that it uses the modified supervisor templates, and return its wall-clock
+    time in seconds. Gravity's output is only shown if the command fails.
+    """
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            galaxyctl.main(args=["--state-dir", state_dir, "--process-manager", "supervisor"] + list(args), standalone_mode=False)
+    except BaseException:
+        sys.stderr.write(output.getvalue())
+        raise
+    return time.perf_counter() - start
+
+
+def run(root, instances, handlers, repeat, boot_time, memory, base_port):
+    """Return a dict of the wall-clock times in seconds of each run of each operation"""
+    galaxy_root, virtualenv = generate_galaxy(root, boot_time, memory)
+    config_files = generate_configs(root, galaxy_root, virtualenv, instances, handlers, base_port)
+    state_dir = os.path.join(root, "state")
+    run_galaxyctl(state_dir, "register", *config_files)
+    times = {operation: [] for operation in OPERATIONS}
+    try:
+        for _ in range(repeat):
+            for operation in OPERATIONS:
+                times[operation].append(run_galaxyctl(state_dir, operation))
+    finally:
+        # don't leave supervisord and the stubs running if an operation failed
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            galaxyctl.main(args=["--state-dir", state_dir, "shutdown"], standalone_mode=False)
+    return times
+
+
+def percentile(values, percent):
+    """Return the nearest-rank ``percent`` percentile of ``values``"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", default="1,2,4", help="Comma-separated numbers of Galaxy instances")
+    parser.add_argument("--handlers", default="1,4", help="Comma-separated numbers of job handler processes of each instance")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times each operation is run")
+    parser.add_argument("--boot-time", type=float, default=0.5, help="Seconds each stub service takes to start")
+    parser.add_argument("--memory", type=int, default=20, help="MB of memory each stub service allocates")
+    parser.add_argument("--startsecs", type=int, default=1, help="startsecs of the supervisor programs")
+    parser.add_argument("--base-port", type=int, default=18080, help="First of the ports that the stub services listen on")
+    args = parser.parse_args()
+    set_startsecs(args.startsecs)
+    sizes = itertools.product(
+        [int(n) for n in args.instances.split(",")], [int(n) for n in args.handlers.split(",")]
+    )
+    results = []
+    for instances, handlers in sizes:
+        with tempfile.TemporaryDirectory() as root:
+            try:
+                times = run(root, instances, handlers, args.repeat, args.boot_time, args.memory, args.base_port)
+            except Exception as exc:
+                error(f"{instances} instance(s) with {handlers} handler(s) failed: {exc}")
+                sys.exit(1)
+        results.extend((instances, handlers, operation, operation_times) for operation, operation_times in times.items())
+    header = "  ".join(f"{f'p{percent}' if percent < 100 else 'max':>8}" for percent in PERCENTILES)
+    info(f"%9s  %8s  %-9s  {header}  (seconds)", "INSTANCES", "HANDLERS", "OPERATION")
+    for instances, handlers, operation, operation_times in results:
+        row = "  ".join(f"{percentile(operation_times, percent):8.2f}" for percent in PERCENTILES)
+        info(f"%9d  %8d  %-9s  {row}", instances, handlers, operation)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark the cost of selecting a process manager.
+
+Times ``process_manager_class(NAME)`` for each process manager in a fresh interpreter, so that the time includes
+importing the process manager's module and its dependencies, and counts the modules that selecting it imports. Selecting
+a process manager should only import that process manager.
+
+Usage::
+
+    python benchmarks/process_manager_select.py [--managers asyncio,supervisor,systemd] [--repeat 5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from gravity.io import info
+from gravity.process_manager import available_process_managers
+
+SELECT_SCRIPT = """
+import json, sys, time
+from gravity import process_manager
+before = set(sys.modules)
+start = time.perf_counter()
+process_manager.process_manager_class(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"time": elapsed, "modules": sorted(set(sys.modules) - before)}))
+"""
+
+
+def select(name):
+    output = subprocess.check_output([sys.executable, "-c", SELECT_SCRIPT, name], universal_newlines=True)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--managers", default=",".join(available_process_managers()), help="Comma-separated process manager names")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing runs, the best is reported")
+    args = parser.parse_args()
+    results = []
+    for name in args.managers.split(","):
+        runs = [select(name) for _ in range(args.repeat)]
+        modules = runs[0]["modules"]
+        others = [
+            other for other in available_process_managers()
+            if other != name and f"gravity.process_manager.{other}_manager" in modules
+        ]
+        assert not others, f"selecting {name} imported other process managers: {', '.join(others)}"
+        results.append((name, min(run["time"] for run in runs), len(modules)))
+    info("%-12s  %12s  %8s", "MANAGER", "SELECT (ms)", "MODULES")
+    for name, select_time, modules_count in results:
+        info("%-12s  %12.2f  %8d", name, select_time * 1000, modules_count)
+
+
+if __name__ == "__main__":
+    main()
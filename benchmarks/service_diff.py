@@ -0,0 +1,82 @@
+"""Benchmark service change detection with large numbers of dynamic handlers.
+
+Times ``ConfigManager.diff_services()`` alone and ``ConfigManager.determine_config_changes()`` for a single config with
+N handler services, one of which has changed. Per-service times should stay roughly constant as N grows.
+
+Usage::
+
+    python benchmarks/service_diff.py [--sizes 500,1000,2000,5000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import tempfile
+import timeit
+
+from gravity.config_manager import ConfigManager
+from gravity.io import info
+
+
+def galaxy_config(handlers, changed_pool=None):
+    pools = ["job-handlers", "workflow-schedulers"]
+    return {
+        "galaxy": {},
+        "gravity": {
+            "handlers": {
+                "handler": {"processes": handlers - 1, "pools": pools},
+                "special_handler0": {"processes": 1, "pools": [changed_pool or pools[0]]},
+            },
+        },
+    }
+
+
+def setup(root, handlers):
+    galaxy_root = os.path.join(root, "galaxy")
+    os.makedirs(os.path.join(galaxy_root, "lib", "galaxy"))
+    os.makedirs(os.path.join(galaxy_root, "config"))
+    config_file = os.path.join(galaxy_root, "config", "galaxy.yml")
+    with open(config_file, "w") as fh:
+        json.dump(galaxy_config(handlers), fh)
+    cm = ConfigManager(state_dir=os.path.join(root, "state"))
+    cm.add([config_file])
+    cm.register_config_changes(*cm.determine_config_changes())
+    # change a single handler, so the config is not skipped as unchanged
+    with open(config_file, "w") as fh:
+        json.dump(galaxy_config(handlers, changed_pool="job-handlers.special"), fh)
+    return cm, config_file
+
+
+def best(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="500,1000,2000,5000", help="Comma-separated numbers of handlers")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing runs, the best is reported")
+    args = parser.parse_args()
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as root:
+            cm, config_file = setup(root, size)
+            stored_services = cm.get_registered_config(config_file)["services"]
+            services = cm.get_config(config_file, defaults=cm.get_registered_config(config_file).defaults)["services"]
+            update, remove = cm.diff_services(stored_services, services)
+            assert len(update) == 1 and not remove, (update, remove)
+            diff_time = best(lambda: cm.diff_services(stored_services, services), args.repeat)
+            determine_time = best(cm.determine_config_changes, args.repeat)
+            results.append((len(services), diff_time, determine_time))
+    info("%8s  %12s  %14s  %18s  %20s", "SERVICES", "DIFF (ms)", "DIFF (us/svc)", "DETERMINE (ms)", "DETERMINE (us/svc)")
+    for services_count, diff_time, determine_time in results:
+        info(
+            "%8d  %12.2f  %14.2f  %18.2f  %20.2f",
+            services_count,
+            diff_time * 1000,
+            diff_time * 1e6 / services_count,
+            determine_time * 1000,
+            determine_time * 1e6 / services_count,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark the cold-start import time of galaxyctl against a budget.
+
+Runs ``python -X importtime`` in a fresh interpreter for each scenario, importing what the corresponding ``galaxyctl``
+invocation imports before it does any work, and reports the total import time (excluding interpreter startup) and the
+slowest top-level imports. Scenarios that take longer than their budget, or that import a module they should not need,
+fail the benchmark with a nonzero exit code. The budgets are set for a typical development machine, use ``--budget`` to
+adjust them for slower ones.
+
+Usage::
+
+    python benchmarks/startup.py [--repeat 5] [--budget configs=150] [--top 5]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+from gravity.io import error, info
+
+# name: (code run in the fresh interpreter, budget in milliseconds, modules that must not be imported)
+SCENARIOS = {
+    # shell completion and `galaxyctl --version`-style invocations only load the CLI
+    "cli": ("import gravity.cli", 60, ("pydantic", "ruamel.yaml", "jsonref", "supervisor", "yaml", "http.client")),
+    # commands that only read the registered configs
+    "configs": (
+        "import gravity.cli, gravity.commands.cmd_configs",
+        100,
+        ("pydantic", "ruamel.yaml", "jsonref", "supervisor", "http.client"),
+    ),
+    # commands that talk to the process manager, including selecting the default one
+    "status": (
+        "import gravity.cli, gravity.commands.cmd_status; gravity.process_manager.process_manager_class('supervisor')",
+        175,
+        ("pydantic", "ruamel.yaml", "jsonref", "supervisor.supervisorctl"),
+    ),
+}
+# imports done by the interpreter itself, not by galaxyctl
+STARTUP_MODULES = ("site", "encodings", "io", "_signal", "_frozen_importlib_external", "zipimport", "_io", "marshal", "posix", "winreg")
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(code):
+    """Run ``code`` with ``-X importtime`` and return a dict of the cumulative time in microseconds of each top-level
+    import, and the set of all imported modules
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    top_level = {}
+    modules = set()
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, module = match.groups()
+        modules.add(module)
+        if not indent and not module.startswith(STARTUP_MODULES) and not module.startswith("__editable__"):
+            top_level[module] = int(cumulative)
+    return top_level, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing runs, the best is reported")
+    parser.add_argument("--budget", action="append", default=[], metavar="SCENARIO=MS", help="Override the budget of a scenario")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest top-level imports to report")
+    args = parser.parse_args()
+    budgets = {name: budget for name, (_, budget, _) in SCENARIOS.items()}
+    for override in args.budget:
+        name, _, budget = override.partition("=")
+        budgets[name] = float(budget)
+    failures = []
+    info("%-10s  %10s  %10s  %s", "SCENARIO", "TIME (ms)", "BUDGET", "SLOWEST IMPORTS (ms)")
+    for name, (code, _, forbidden) in SCENARIOS.items():
+        runs = [import_times(code) for _ in range(args.repeat)]
+        top_level, modules = min(runs, key=lambda run: sum(run[0].values()))
+        total = sum(top_level.values()) / 1000
+        slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        info(
+            "%-10s  %10.1f  %10g  %s", name, total, budgets[name], ", ".join(f"{module} {us / 1000:.1f}" for module, us in slowest)
+        )
+        if total > budgets[name]:
+            failures.append(f"{name} took {total:.1f}ms, over its budget of {budgets[name]:g}ms")
+        imported = sorted(module for module in forbidden if module in modules)
+        if imported:
+            failures.append(f"{name} imported {', '.join(imported)}")
+    for failure in failures:
+        error(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Micro-benchmarks of Gravity's config and state hot paths.
+
+Generates N synthetic Galaxy instances, each with M job handler processes and a config split over K include files, and
+times:
+
+- ``ConfigManager.get_config`` with a cold and a warm config cache
+- ``ConfigManager.determine_config_changes`` with one changed config
+- ``ConfigManager.register_config_changes`` of all instances
+- ``GravityState.open`` and ``GravityState.dump`` of the state file
+- ``ConfigManager.expand_handlers``
+- ``SupervisorProcessManager._process_config_changes`` generating the supervisor confs of all instances
+
+The best of ``--repeat`` runs of each is reported, and can be saved as a JSON baseline with ``--save``. ``--compare``
+compares the results with a saved baseline and exits with a nonzero code if any benchmark is slower than the baseline by
+more than ``--threshold``. Baselines are only comparable with runs of the same sizes on the same machine.
+
+Usage::
+
+    python benchmarks/suite.py [--instances 10] [--handlers 50] [--includes 5] [--repeat 5]
+                               [--save baseline.json] [--compare baseline.json] [--threshold 0.2]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from gravity.config_manager import ConfigManager
+from gravity.io import error, info, warn
+from gravity.process_manager.supervisor_manager import SupervisorProcessManager
+from gravity.settings import Settings
+from gravity.state import ConfigFile, GravityState
+
+# port of the first instance's gunicorn, each instance gets its own
+BASE_PORT = 18080
+
+
+def galaxy_config(index, handlers, includes, changed=False):
+    """Return the YAML text of the config of instance ``index``, whose Galaxy options are spread over ``includes`` files"""
+    lines = ["galaxy:"]
+    lines.extend(f"  include_{i}: !include include_{i}.yml" for i in range(includes))
+    lines.extend([
+        "gravity:",
+        f"  instance_name: instance{index}",
+        f"  galaxy_root: galaxy{index}",
+        "  gunicorn:",
+        f"    bind: localhost:{BASE_PORT + index}",
+        "  handlers:",
+        "    handler:",
+        f"      processes: {handlers}",
+        "      pools:",
+        "        - job-handlers",
+        f"        - {'workflow-schedulers.changed' if changed else 'workflow-schedulers'}",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def generate(root, instances, handlers, includes):
+    """Write the configs of ``instances`` instances under ``root`` and return their paths"""
+    config_files = []
+    for index in range(instances):
+        os.makedirs(os.path.join(root, f"galaxy{index}", "lib", "galaxy"))
+        config_dir = os.path.join(root, f"config{index}")
+        os.makedirs(config_dir)
+        for i in range(includes):
+            with open(os.path.join(config_dir, f"include_{i}.yml"), "w") as fh:
+                fh.write("".join(f"option_{i}_{j}: value_{j}\n" for j in range(20)))
+        config_file = os.path.join(config_dir, "galaxy.yml")
+        with open(config_file, "w") as fh:
+            fh.write(galaxy_config(index, handlers, includes).replace(f"galaxy_root: galaxy{index}", f"galaxy_root: {root}/galaxy{index}"))
+        config_files.append(config_file)
+    return config_files
+
+
+def change(config_file):
+    """Change a handler pool of ``config_file``, so that all of its handler services change"""
+    with open(config_file) as fh:
+        text = fh.read()
+    with open(config_file, "w") as fh:
+        fh.write(text.replace("workflow-schedulers\n", "workflow-schedulers.changed\n"))
+
+
+def best(func, repeat, setup=None):
+    """Return the shortest time in seconds of ``repeat`` calls of ``func``, each after an untimed call of ``setup``"""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(root, instances, handlers, includes, repeat):
+    results = {}
+    config_files = generate(root, instances, handlers, includes)
+    state_dir = os.path.join(root, "state")
+    cm = ConfigManager(state_dir=state_dir)
+    cm.add(config_files)
+    config_file = config_files[0]
+
+    def clear_cache():
+        shutil.rmtree(os.path.join(state_dir, "cache"), ignore_errors=True)
+
+    results["get_config (cold)"] = best(lambda _: cm.get_config(config_file), repeat, setup=clear_cache)
+    results["get_config (warm)"] = best(lambda: cm.get_config(config_file), repeat)
+
+    results["register_config_changes"] = best(lambda changes: cm.register_config_changes(*changes), repeat, setup=cm.determine_config_changes)
+    cm.register_config_changes(*cm.determine_config_changes())
+    change(config_file)
+    results["determine_config_changes"] = best(cm.determine_config_changes, repeat)
+
+    state_file = cm.state_store.path
+    results["GravityState.open"] = best(lambda: GravityState.open(state_file), repeat)
+    state = GravityState.open(state_file)
+    results["GravityState.dump"] = best(lambda: state.dump(io.StringIO()), repeat)
+
+    gravity_config = Settings(handlers={"handler": {"processes": handlers * instances, "pools": ["job-handlers"]}})
+    config = ConfigFile(instance_name="instance0")
+    results["expand_handlers"] = best(lambda: ConfigManager.expand_handlers(gravity_config, config), repeat)
+
+    pm_state_dir = os.path.join(root, "pm_state")
+    pm = SupervisorProcessManager(state_dir=pm_state_dir, start_daemon=False)
+    pm.config_manager.add(config_files)
+
+    def new_changes():
+        # register every instance as new again, so that the confs of all of their services are generated
+        shutil.rmtree(pm.supervisord_conf_dir)
+        os.makedirs(pm.supervisord_conf_dir)
+        pm.config_manager.state_store.remove()
+        pm.config_manager.invalidate_state()
+        pm.config_manager.add(config_files)
+        return pm.config_manager.determine_config_changes()
+
+    results["SupervisorProcessManager._process_config_changes"] = best(
+        lambda changes: pm._process_config_changes(*changes), repeat, setup=new_changes
+    )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Output the change of each result from ``baseline`` and return the names of the benchmarks that regressed"""
+    regressions = []
+    info("%-52s  %12s  %12s  %8s", "BENCHMARK", "BASELINE (ms)", "TIME (ms)", "CHANGE")
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name] if baseline[name] else 1.0
+        info("%-52s  %12.3f  %12.3f  %+7.1f%%", name, baseline[name] * 1000, seconds * 1000, (ratio - 1) * 100)
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, default=10, help="Number of Galaxy instances")
+    parser.add_argument("--handlers", type=int, default=50, help="Number of job handler processes of each instance")
+    parser.add_argument("--includes", type=int, default=5, help="Number of include files of each instance's config")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing runs, the best is reported")
+    parser.add_argument("--save", metavar="FILE", help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Compare the results with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Fraction by which a benchmark may be slower than the baseline")
+    args = parser.parse_args()
+    parameters = {"instances": args.instances, "handlers": args.handlers, "includes": args.includes}
+    with tempfile.TemporaryDirectory() as root:
+        # Gravity reports everything it does, which is not what is being measured
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            results = run(root, args.instances, args.handlers, args.includes, args.repeat)
+    info("%-52s  %12s", "BENCHMARK", "TIME (ms)")
+    for name, seconds in results.items():
+        info("%-52s  %12.3f", name, seconds * 1000)
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump({"parameters": parameters, "python": platform.python_version(), "results": results}, fh, indent=2)
+        info(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline["parameters"] != parameters:
+            warn(f"Baseline sizes {baseline['parameters']} differ from {parameters}, the results are not comparable")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            error(f"Slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+""" Persistent cache of parsed Galaxy config files, keyed on the content hashes of the files they were parsed from.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from os.path import exists, isabs, join
+
+from gravity import __version__
+from gravity.io import debug
+from gravity.state import ConfigFile
+from gravity.util.resources import host_resources
+
+# environment variables that change the result of parsing a config
+ENVIRONMENT_PREFIXES = ("gravity_",)
+ENVIRONMENT_VARIABLES = ("GALAXY_ROOT_DIR",)
+
+
+def stat_signature(path):
+    st = os.stat(path)
+    return [st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_environment():
+    """Return the environment variables that parsing a config depends on"""
+    environment = {
+        k: v for k, v in os.environ.items()
+        if k in ENVIRONMENT_VARIABLES or k.lower().startswith(ENVIRONMENT_PREFIXES)
+    }
+    if not isabs(environment.get("GALAXY_ROOT_DIR", "/")):
+        # a relative root dir is resolved against the working directory
+        environment["PWD"] = os.getcwd()
+    return environment
+
+
+def config_digest(config):
+    """Return a digest of the persisted fields of ``config``"""
+    config = _public(config)
+    config["services"] = [_public(service) for service in config.get("services", [])]
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ConfigDependencies(object):
+    """Records the files read and the paths checked for existence while parsing a config"""
+
+    def __init__(self):
+        self.files = {}
+        self.paths = {}
+        # the CPUs and memory that ``auto`` sizes were resolved for, if any
+        self.resources = None
+
+    def add_file(self, path):
+        """Record that the contents of ``path`` are about to be read.
+
+        The file is stat()ed and hashed before it is read, so that a change to the file while it is being parsed can only
+        cause a cache miss on the next lookup, never a stale hit.
+        """
+        path = os.path.abspath(path)
+        if path not in self.files:
+            stat = stat_signature(path)
+            self.files[path] = [file_digest(path), stat]
+
+    def exists(self, path):
+        """Check whether ``path`` exists, recording the result."""
+        rval = exists(path)
+        self.paths[path] = rval
+        return rval
+
+    def add_resources(self, resources):
+        """Record that the config was sized for ``resources``, as returned by :func:`host_resources`"""
+        self.resources = list(resources)
+
+    def as_dict(self):
+        return {"files": self.files, "paths": self.paths, "resources": self.resources}
+
+
+class ConfigCache(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def __entry_path(self, conf):
+        return join(self.cache_dir, hashlib.sha256(conf.encode("utf-8")).hexdigest() + ".json")
+
+    @staticmethod
+    def key(conf, defaults, state_dir):
+        """Return the key of everything other than file contents that parsing ``conf`` depends on"""
+        key = {
+            "gravity_version": __version__,
+            "conf": conf,
+            "defaults": defaults,
+            "state_dir": state_dir,
+            "environment": config_environment(),
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def __read_entry(self, conf):
+        try:
+            with open(self.__entry_path(conf)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __check_dependencies(entry):
+        """Check whether any dependency of ``entry`` has changed.
+
+        Configs with ``auto`` sizes depend on the host's CPUs and memory as well. Files are only hashed if their stat
+        signature has changed, in which case the entry's stat signature is refreshed if
+        the contents are unchanged. Returns a tuple of whether the dependencies are unchanged, and whether the entry was
+        refreshed.
+        """
+        refreshed = False
+        resources = entry["dependencies"].get("resources")
+        if resources is not None and resources != list(host_resources()):
+            return False, False
+        for path, path_exists in entry["dependencies"]["paths"].items():
+            if exists(path) != path_exists:
+                return False, False
+        files = entry["dependencies"]["files"]
+        for path, (digest, stat) in files.items():
+            try:
+                current_stat = stat_signature(path)
+                if current_stat == stat:
+                    continue
+                if file_digest(path) != digest:
+                    return False, False
+            except OSError:
+                return False, False
+            files[path] = [digest, current_stat]
+            refreshed = True
+        return True, refreshed
+
+    def __valid_entry(self, conf, key):
+        """Return the cache entry for ``conf`` if it is valid for ``key`` and its dependencies are unchanged"""
+        entry = self.__read_entry(conf)
+        try:
+            if entry is None or entry["key"] != key:
+                return None
+            unchanged, refreshed = self.__check_dependencies(entry)
+        except (KeyError, TypeError, ValueError):
+            # entry in an unknown format
+            return None
+        if not unchanged:
+            return None
+        if refreshed:
+            self.__write_entry(conf, entry)
+        return entry
+
+    def get(self, conf, key):
+        """Return the cached :class:`ConfigFile` for ``conf`` if none of its dependencies have changed, else ``None``."""
+        entry = self.__valid_entry(conf, key)
+        if entry is None:
+            debug(f"Config cache miss: {conf}")
+            return None
+        debug(f"Config cache hit: {conf}")
+        return ConfigFile(entry["config"])
+
+    def is_registered(self, conf, key, digest):
+        """Return whether the config with digest ``digest`` was registered from ``conf`` and none of the dependencies of
+        ``conf`` have changed since, in which case it does not need to be parsed at all.
+        """
+        entry = self.__valid_entry(conf, key)
+        return entry is not None and entry.get("registered") == digest
+
+    def set_registered(self, conf, digest):
+        """Record that the most recently parsed config for ``conf`` has been registered as the config with digest
+        ``digest``.
+        """
+        entry = self.__read_entry(conf)
+        if entry is not None and entry.get("registered") != digest:
+            entry["registered"] = digest
+            self.__write_entry(conf, entry)
+
+    def remove(self, conf):
+        """Remove the cache entry for ``conf``, if any"""
+        try:
+            os.unlink(self.__entry_path(conf))
+        except FileNotFoundError:
+            pass
+
+    def put(self, conf, key, dependencies, config):
+        entry = {
+            "key": key,
+            "conf": conf,
+            "dependencies": dependencies.as_dict(),
+            "config": _public(config),
+        }
+        entry["config"]["services"] = [_public(service) for service in config["services"]]
+        self.__write_entry(conf, entry)
+
+    def __write_entry(self, conf, entry):
+        try:
+            data = json.dumps(entry)
+        except (TypeError, ValueError) as exc:
+            debug(f"Not caching config {conf}: {exc}")
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=".", suffix=".json", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "w") as fh:
+                fh.write(data)
+            os.replace(tmp_name, self.__entry_path(conf))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+
+def _public(d):
+    # AttributeDicts carry private (underscore-prefixed) items that are not persisted
+    return {k: v for k, v in d.items() if not k.startswith("_")}
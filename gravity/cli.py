@@ -67,12 +67,16 @@ class GravityCLI(click.MultiCommand):
 @click.command(context_settings=CONTEXT_SETTINGS)
 @options.debug_option()
 @options.state_dir_option()
+@options.state_backend_option()
+@options.process_manager_option()
 @options.no_log_option()
 @click.pass_context
-def galaxy(ctx, debug, state_dir, quiet):
+def galaxy(ctx, debug, state_dir, state_backend, process_manager, quiet):
     """Run Galaxy server in the foreground"""
     set_debug(debug)
     ctx.state_dir = state_dir
+    ctx.state_backend = state_backend
+    ctx.process_manager = process_manager
     mod = __import__("gravity.commands.cmd_start", None, None, ["cli"])
     return ctx.invoke(mod.cli, foreground=True, quiet=quiet)
 
@@ -80,8 +84,12 @@ def galaxy(ctx, debug, state_dir, quiet):
 @click.command(cls=GravityCLI, context_settings=CONTEXT_SETTINGS)
 @options.debug_option()
 @options.state_dir_option()
+@options.state_backend_option()
+@options.process_manager_option()
 @click.pass_context
-def galaxyctl(ctx, debug, state_dir):
+def galaxyctl(ctx, debug, state_dir, state_backend, process_manager):
     """Manage Galaxy server configurations and processes."""
     set_debug(debug)
     ctx.state_dir = state_dir
+    ctx.state_backend = state_backend
+    ctx.process_manager = process_manager
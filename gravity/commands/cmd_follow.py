@@ -6,13 +6,18 @@ from gravity import process_manager
 
 @click.command("follow")
 @options.required_instance_arg()
+@options.grep_option()
+@options.since_option()
+@click.option("--rate", type=click.IntRange(min=1), metavar="N", help="Output at most N lines per second from each log.")
 @click.pass_context
-def cli(ctx, instance):
+def cli(ctx, instance, grep, since, rate):
     """Follow log files of configured instances.
 
     If INSTANCE matches an instance name, logs of all services configured for the instance are followed.
 
     If INSTANCE does not match an instance name, it is assumed to be a service and only logs of the listed service(s)
     are followed."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, start_daemon=False) as pm:
-        pm.follow(instance)
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, start_daemon=False,
+    ) as pm:
+        pm.follow(instance, grep=grep, since=since, rate=rate)
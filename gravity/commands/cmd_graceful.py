@@ -6,13 +6,27 @@ from gravity import process_manager
 
 @click.command("graceful")
 @options.required_instance_arg()
+@options.parallel_option()
+@click.option(
+    "--batch-size", type=click.IntRange(min=1), metavar="N",
+    help="Number of job handlers to restart at once. Defaults to a quarter of the handlers being restarted."
+)
+@options.health_timeout_option()
 @click.pass_context
-def cli(ctx, instance):
+def cli(ctx, instance, parallel, batch_size, health_timeout):
     """Gracefully reload configured services.
 
     If INSTANCE matches an instance name, all services configured for the instance are restarted.
 
     If INSTANCE does not match an instance name, it is assumed to be a service and only the listed service(s) are
-    restarted."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir) as pm:
+    restarted.
+
+    Job handlers are restarted in batches, waiting for each batch to be running before restarting the next. Batches
+    never include every handler of a server pool (e.g. job-handlers or workflow-schedulers).
+
+    Waits for services that have health checks to pass them."""
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, parallel=parallel, batch_size=batch_size,
+        health_timeout=health_timeout,
+    ) as pm:
         pm.graceful(instance)
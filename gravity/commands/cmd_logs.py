@@ -0,0 +1,27 @@
+import click
+
+from gravity import options
+from gravity import process_manager
+
+
+@click.command("logs")
+@options.required_instance_arg()
+@options.grep_option()
+@options.since_option()
+@options.until_option()
+@click.option("-n", "--lines", type=click.IntRange(min=1), metavar="N", help="Only output the last N lines.")
+@click.pass_context
+def cli(ctx, instance, grep, since, until, lines):
+    """Search log files of configured instances.
+
+    Lines from the logs of all services are merged in timestamp order. Logs are searched by timestamp, so only the part
+    of each log between --since and --until is read.
+
+    If INSTANCE matches an instance name, logs of all services configured for the instance are searched.
+
+    If INSTANCE does not match an instance name, it is assumed to be a service and only logs of the listed service(s)
+    are searched."""
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, start_daemon=False,
+    ) as pm:
+        pm.logs(instance, grep=grep, since=since, until=until, lines=lines)
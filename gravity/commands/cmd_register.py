@@ -13,8 +13,8 @@ def cli(ctx, config):
 
     aliases: add
     """
-    with config_manager.config_manager(state_dir=ctx.parent.state_dir) as cm:
+    with config_manager.config_manager(state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend) as cm:
         try:
             cm.add(config)
         except Exception as exc:
-            exception("Caught exception: %s", exc)
+            exception(f"Caught exception: {exc}")
@@ -6,13 +6,22 @@ from gravity import process_manager
 
 @click.command("restart")
 @options.required_instance_arg()
+@options.parallel_option()
+@options.wave_size_option()
+@options.health_timeout_option()
 @click.pass_context
-def cli(ctx, instance):
+def cli(ctx, instance, parallel, wave_size, health_timeout):
     """Restart configured services.
 
     If INSTANCE matches an instance name, all services configured for the instance are restarted.
 
     If INSTANCE does not match an instance name, it is assumed to be a service and only the listed service(s) are
-    restarted."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir) as pm:
+    restarted.
+
+    The services of instances are stopped and then started again in waves, as with `start`, and services that have
+    health checks are waited for until they pass them."""
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, parallel=parallel,
+        health_timeout=health_timeout, wave_size=wave_size,
+    ) as pm:
         pm.restart(instance)
@@ -7,5 +7,7 @@ from gravity import process_manager
 @click.pass_context
 def cli(ctx):
     """Shut down process manager."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, start_daemon=False) as pm:
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, start_daemon=False,
+    ) as pm:
         pm.shutdown()
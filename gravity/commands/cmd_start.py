@@ -7,29 +7,44 @@ from gravity.io import info, exception
 
 @click.command("start")
 @options.required_instance_arg()
+@options.parallel_option()
 @click.option("-f", "--foreground", is_flag=True, default=False, help="Run in foreground")
 @options.no_log_option()
+@options.wave_size_option()
+@options.health_timeout_option()
 @click.pass_context
-def cli(ctx, foreground, instance, quiet=False):
+def cli(ctx, foreground, instance, parallel, wave_size, health_timeout, quiet=False):
     """Start configured services.
 
     If INSTANCE matches an instance name, all services configured for the instance are started.
 
     If INSTANCE does not match an instance name, it is assumed to be a service and only the listed service(s) are
-    started."""
+    started.
+
+    Unless running in the foreground, the services of instances are started in waves in dependency order (e.g. job
+    handlers after gunicorn and celery), waiting for each wave to be ready before starting the next, and services that
+    have health checks are waited for until they pass them.
+
+    To run services as child processes of Gravity itself in the foreground, select the asyncio process manager with
+    --process-manager or $GRAVITY_PROCESS_MANAGER."""
     if not instance:
-        with config_manager.config_manager(state_dir=ctx.parent.state_dir) as cm:
+        with config_manager.config_manager(state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend) as cm:
             # If there are no configs registered, we will attempt to auto-register one
             cm.auto_register()
         if not cm.instance_count:
             exception(
                 "Nothing to start: no Galaxy instances configured and no Galaxy configuration files found, "
                 "see `galaxyctl register --help`")
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, foreground=foreground) as pm:
-        pm.start(instance)
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, foreground=foreground, parallel=parallel,
+        # in the foreground, logs are followed as soon as the services are started
+        health_timeout=None if foreground else health_timeout, wave_size=wave_size,
+    ) as pm:
         if foreground:
-            pm.follow(instance, quiet=quiet)
-        elif pm.config_manager.single_instance:
+            pm.run_foreground(instance, quiet=quiet)
+            return
+        pm.start(instance)
+        if pm.config_manager.single_instance:
             config = list(pm.config_manager.get_registered_configs().values())[0]
             info(f"Log files are in {config.attribs['log_dir']}")
         else:
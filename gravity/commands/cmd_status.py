@@ -4,8 +4,11 @@ from gravity import process_manager
 
 
 @click.command("status")
+@click.option("--json", "json_output", is_flag=True, default=False, help="Output status and resource usage as JSON")
 @click.pass_context
-def cli(ctx):
+def cli(ctx, json_output):
     """Display server status."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, start_daemon=False) as pm:
-        pm.status()
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, start_daemon=False,
+    ) as pm:
+        pm.status(json_output=json_output)
@@ -6,13 +6,16 @@ from gravity import process_manager
 
 @click.command("stop")
 @options.required_instance_arg()
+@options.parallel_option()
 @click.pass_context
-def cli(ctx, instance):
+def cli(ctx, instance, parallel):
     """Stop configured services.
 
     If INSTANCE matches an instance name, all services configured for the instance are stopped.
 
     If INSTANCE does not match an instance name, it is assumed to be a service and only the listed service(s) are
     stopped."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, start_daemon=False) as pm:
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, parallel=parallel, start_daemon=False,
+    ) as pm:
         pm.stop(instance)
@@ -1,6 +1,7 @@
 import click
 
 from gravity import process_manager
+from gravity.io import exception
 
 
 NO_START_COMMANDS = (
@@ -15,5 +16,9 @@ NO_START_COMMANDS = (
 def cli(ctx, supervisorctl_arg):
     """Invoke supervisorctl directly."""
     start_daemon = (supervisorctl_arg and supervisorctl_arg[0] not in NO_START_COMMANDS)
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, start_daemon=start_daemon) as pm:
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, start_daemon=start_daemon,
+    ) as pm:
+        if not hasattr(pm, "supervisorctl"):
+            exception("The supervisorctl command requires the supervisor process manager")
         pm.supervisorctl(*supervisorctl_arg)
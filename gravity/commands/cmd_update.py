@@ -4,9 +4,11 @@ from gravity import process_manager
 
 
 @click.command("update")
-@click.option("--force", is_flag=True, help="Force rewriting of process config files")
+@click.option("--force", is_flag=True, help="Force rewriting of process config files and updating of all process groups")
 @click.pass_context
 def cli(ctx, force):
     """Update process manager from config changes."""
-    with process_manager.process_manager(state_dir=ctx.parent.state_dir, start_daemon=False) as pm:
+    with process_manager.process_manager(
+        manager=ctx.parent.process_manager, state_dir=ctx.parent.state_dir, state_backend=ctx.parent.state_backend, start_daemon=False,
+    ) as pm:
         pm.update(force)
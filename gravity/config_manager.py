@@ -5,22 +5,31 @@ import errno
 import hashlib
 import logging
 import os
-import xml.etree.ElementTree as elementtree
 from os import pardir
 from os.path import abspath, dirname, exists, expanduser, isabs, join
-from typing import Union
+from typing import Optional, TYPE_CHECKING, Union
 
 from yaml import safe_load
 
 from gravity import __version__
-from gravity.settings import Settings
+from gravity.cache import ConfigCache, ConfigDependencies, config_digest
 from gravity.io import debug, error, exception, info, warn
 from gravity.state import (
     ConfigFile,
+    DEFAULT_STATE_BACKEND,
     GravityState,
     service_for_service_type,
+    state_lock,
+    state_store_for_backend,
+    STATE_STORE_CLASS_MAP,
+    YAMLStateStore,
 )
 from gravity.util import recursive_update, yaml_safe_load_with_include
+from gravity.util.resources import auto_size, host_resources
+
+if TYPE_CHECKING:
+    # pydantic is slow to import, so the settings are only imported by the commands that load Galaxy configs
+    from gravity.settings import Settings
 
 log = logging.getLogger(__name__)
 
@@ -31,50 +40,100 @@ if "XDG_CONFIG_HOME" in os.environ:
 
 
 @contextlib.contextmanager
-def config_manager(state_dir=None, python_exe=None):
-    yield ConfigManager(state_dir=state_dir, python_exe=python_exe)
+def config_manager(state_dir=None, python_exe=None, state_backend=None):
+    yield ConfigManager(state_dir=state_dir, python_exe=python_exe, state_backend=state_backend)
 
 
 class ConfigManager(object):
     galaxy_server_config_section = "galaxy"
     gravity_config_section = "gravity"
 
-    def __init__(self, state_dir=None, python_exe=None):
+    def __init__(self, state_dir=None, python_exe=None, state_backend=None):
         if state_dir is None:
             state_dir = DEFAULT_STATE_DIR
         self.state_dir = abspath(expanduser(state_dir))
         debug(f"Gravity state dir: {self.state_dir}")
-        self.config_state_path = join(self.state_dir, "configstate.yaml")
         self.python_exe = python_exe
+        self.__state = None
+        self.__state_signature = None
+        self.__transaction_state = None
         try:
             os.makedirs(self.state_dir)
         except OSError as exc:
             if exc.errno != errno.EEXIST:
                 raise
         self.__convert_config()
+        self.state_store = self.__convert_state_store(state_backend)
+        self.config_state_path = self.state_store.path
+        debug(f"Gravity state backend: {self.state_store.name}")
+        self.config_cache = ConfigCache(join(self.state_dir, "cache", "configs"))
 
-    def __copy_config(self, old_path):
+    def __copy_config(self, old_path, new_path):
         with GravityState.open(old_path) as state:
-            state.set_name(self.config_state_path)
+            state.set_name(new_path)
         # copies on __exit__
 
     def __convert_config(self):
         config_state_json = join(self.state_dir, "configstate.json")
-        if exists(config_state_json) and not exists(self.config_state_path):
-            warn(f"Converting {config_state_json} to {self.config_state_path}")
+        config_state_yaml = join(self.state_dir, YAMLStateStore.filename)
+        stores = [store_class(self.state_dir) for store_class in STATE_STORE_CLASS_MAP.values()]
+        if exists(config_state_json) and not any(store.exists() for store in stores):
+            warn(f"Converting {config_state_json} to {config_state_yaml}")
             json_state = GravityState.open(config_state_json)
-            self.__copy_config(config_state_json)
-            assert exists(self.config_state_path), f"Conversion failed ({self.config_state_path} does not exist)"
-            yaml_state = GravityState.open(self.config_state_path)
-            assert json_state == yaml_state, f"Converted config differs from previous config, remove {self.config_state_path} to retry"
+            self.__copy_config(config_state_json, config_state_yaml)
+            assert exists(config_state_yaml), f"Conversion failed ({config_state_yaml} does not exist)"
+            yaml_state = GravityState.open(config_state_yaml)
+            assert json_state == yaml_state, f"Converted config differs from previous config, remove {config_state_yaml} to retry"
             os.unlink(config_state_json)
 
+    def __convert_state_store(self, state_backend):
+        """Return the state store for ``state_backend``, migrating the state from any other existing store to it.
+
+        If ``state_backend`` is not set, the existing store is used, or the default store if no state exists yet.
+        """
+        stores = {name: store_class(self.state_dir) for name, store_class in STATE_STORE_CLASS_MAP.items()}
+        if state_backend is None:
+            existing = [store for store in stores.values() if store.exists()]
+            return existing[0] if existing else stores[DEFAULT_STATE_BACKEND]
+        store = state_store_for_backend(state_backend)(self.state_dir)
+        with state_lock(self.state_dir):
+            existing = [old_store for old_store in stores.values() if old_store.name != store.name and old_store.exists()]
+            if not store.exists() and existing:
+                old_store = existing[0]
+                warn(f"Converting {old_store.path} to {store.path}")
+                old_state = old_store.load()
+                store.save(old_state)
+                new_state = store.load()
+                if not old_state == new_state:
+                    store.remove()
+                    exception(f"Converted state differs from previous state, {old_store.path} has not been changed")
+                old_store.remove()
+        return store
+
     def get_config(self, conf, defaults=None):
+        """Parse the config file ``conf``.
+
+        Parsed configs are cached in the state dir, the cached config is returned if neither ``defaults``, the relevant
+        environment, nor the contents of ``conf`` or any files it depends on (includes, job config) have changed.
+        """
         defaults = defaults or {}
+        key = self.config_cache.key(conf, defaults, self.state_dir)
+        config = self.config_cache.get(conf, key)
+        if config is None:
+            dependencies = ConfigDependencies()
+            config = self.__parse_config(conf, defaults, dependencies)
+            if config is not None:
+                self.config_cache.put(conf, key, dependencies, config)
+        return config
+
+    def __parse_config(self, conf, defaults, dependencies):
         server_section = self.galaxy_server_config_section
+        dependencies.add_file(conf)
         with open(conf) as config_fh:
-            config_dict = yaml_safe_load_with_include(config_fh)
+            config_dict = yaml_safe_load_with_include(config_fh, on_include=dependencies.add_file)
         _gravity_config = config_dict.get(self.gravity_config_section) or {}
+        from gravity.settings import Settings
+
         gravity_config = Settings(**recursive_update(defaults, _gravity_config))
         if gravity_config.log_dir is None:
             gravity_config.log_dir = join(expanduser(self.state_dir), "log")
@@ -90,12 +149,15 @@ class ConfigManager(object):
         config.services = []
         config.instance_name = gravity_config.instance_name
         config.config_type = server_section
+        self.resolve_auto_sizes(gravity_config, dependencies=dependencies)
         config.attribs["galaxy_infrastructure_url"] = app_config.get("galaxy_infrastructure_url", "").rstrip("/")
         if gravity_config.tusd.enable and not config.attribs["galaxy_infrastructure_url"]:
             exception("To run the tusd server you need to set galaxy_infrastructure_url in the galaxy section of galaxy.yml")
         config.attribs["app_server"] = gravity_config.app_server
         config.attribs["log_dir"] = gravity_config.log_dir
         config.attribs["virtualenv"] = gravity_config.virtualenv
+        config.attribs["galaxy_user"] = gravity_config.galaxy_user
+        config.attribs["galaxy_group"] = gravity_config.galaxy_group
         config.attribs["gunicorn"] = gravity_config.gunicorn.dict()
         config.attribs["tusd"] = gravity_config.tusd.dict()
         config.attribs["celery"] = gravity_config.celery.dict()
@@ -109,7 +171,7 @@ class ConfigManager(object):
         if config.attribs["galaxy_root"] is None:
             if os.environ.get("GALAXY_ROOT_DIR"):
                 config.attribs["galaxy_root"] = abspath(os.environ["GALAXY_ROOT_DIR"])
-            elif exists(join(dirname(conf), pardir, "lib", "galaxy")):
+            elif dependencies.exists(join(dirname(conf), pardir, "lib", "galaxy")):
                 config.attribs["galaxy_root"] = abspath(join(dirname(conf), pardir))
             elif conf.endswith(join('galaxy', 'config', 'sample', 'galaxy.yml.sample')):
                 config.attribs["galaxy_root"] = abspath(join(dirname(conf), pardir, pardir, pardir, pardir))
@@ -119,6 +181,9 @@ class ConfigManager(object):
         if gravity_config.gunicorn.enable:
             if config.attribs["gunicorn"]["preload"] is None:
                 config.attribs["gunicorn"]["preload"] = config.attribs["app_server"] != "unicornherder"
+            if config.attribs["gunicorn"]["health_check_path"] is None:
+                url_prefix = (app_config.get("galaxy_url_prefix") or "/").rstrip("/")
+                config.attribs["gunicorn"]["health_check_path"] = f"{url_prefix}/api/version"
             config.services.append(service_for_service_type(config.attribs["app_server"])(config_type=config.config_type))
         if gravity_config.celery.enable:
             config.services.append(service_for_service_type("celery")(config_type=config.config_type))
@@ -137,9 +202,11 @@ class ConfigManager(object):
             if not isabs(job_config):
                 # FIXME: relative to root
                 job_config = abspath(join(config.attribs["galaxy_root"], job_config))
-                if not exists(job_config):
+                if not dependencies.exists(job_config):
                     job_config = None
         if config.config_type == "galaxy" and job_config:
+            if isinstance(job_config, str):
+                dependencies.add_file(job_config)
             for service_name in [x["service_name"] for x in ConfigManager.get_job_config(job_config) if x["service_name"] not in webapp_service_names]:
                 config.services.append(service_for_service_type("standalone")(config_type=config.config_type, service_name=service_name))
 
@@ -153,14 +220,19 @@ class ConfigManager(object):
         self.create_gxit_services(gravity_config, app_config, config)
         return config
 
-    def create_handler_services(self, gravity_config: Settings, config):
+    def create_handler_services(self, gravity_config: "Settings", config):
+        from gravity.settings import ResourceSettings
+
         expanded_handlers = self.expand_handlers(gravity_config, config)
         for service_name, handler_settings in expanded_handlers.items():
             pools = handler_settings.get('pools')
+            kwargs = {}
+            if handler_settings.get('resources'):
+                kwargs["resources"] = ResourceSettings(**handler_settings['resources']).dict()
             config.services.append(
-                service_for_service_type("standalone")(config_type=config.config_type, service_name=service_name, server_pools=pools))
+                service_for_service_type("standalone")(config_type=config.config_type, service_name=service_name, server_pools=pools, **kwargs))
 
-    def create_gxit_services(self, gravity_config: Settings, app_config, config):
+    def create_gxit_services(self, gravity_config: "Settings", app_config, config):
         if app_config.get("interactivetools_enable") and gravity_config.gx_it_proxy.enable:
             # TODO: resolve against data_dir, or bring in galaxy-config ?
             # CWD in supervisor template is galaxy_root, so this should work for simple cases as is
@@ -171,7 +243,34 @@ class ConfigManager(object):
         config.attribs["gx_it_proxy"] = gravity_config.gx_it_proxy.dict()
 
     @staticmethod
-    def expand_handlers(gravity_config: Settings, config):
+    def resolve_auto_sizes(gravity_config: "Settings", dependencies: Optional[ConfigDependencies] = None):
+        """Replace ``auto`` process counts in ``gravity_config`` with counts sized for the CPUs and memory available.
+
+        Handlers with ``auto`` processes share the memory and CPUs available to handlers equally. If any counts are
+        ``auto``, the resources they were sized for are recorded in ``dependencies``.
+        """
+        from gravity.settings import AUTO
+
+        auto_handlers = [name for name, handler_config in gravity_config.handlers.items() if handler_config.get("processes") == AUTO]
+        if gravity_config.gunicorn.workers != AUTO and gravity_config.celery.concurrency != AUTO and not auto_handlers:
+            return
+        cpus, memory = host_resources()
+        if dependencies is not None:
+            dependencies.add_resources((cpus, memory))
+        available = f"{cpus:g} CPU(s) and {'unknown' if memory is None else f'{memory / 1024 ** 3:.1f}G'} memory"
+        if gravity_config.gunicorn.workers == AUTO:
+            gravity_config.gunicorn.workers = auto_size("gunicorn", cpus, memory)
+            info(f"Sized gunicorn workers for {available}: {gravity_config.gunicorn.workers}")
+        if gravity_config.celery.concurrency == AUTO:
+            gravity_config.celery.concurrency = auto_size("celery", cpus, memory)
+            info(f"Sized celery concurrency for {available}: {gravity_config.celery.concurrency}")
+        for name in auto_handlers:
+            processes = auto_size("handlers", cpus, memory, share=1 / len(auto_handlers))
+            gravity_config.handlers[name] = dict(gravity_config.handlers[name], processes=processes)
+            info(f"Sized processes of handler {name} for {available}: {processes}")
+
+    @staticmethod
+    def expand_handlers(gravity_config: "Settings", config):
         handlers = gravity_config.handlers or {}
         expanded_handlers = {}
         default_name_template = "{name}_{process}"
@@ -197,6 +296,8 @@ class ConfigManager(object):
         rval = []
         if isinstance(conf, str):
             if conf.endswith('.xml'):
+                import xml.etree.ElementTree as elementtree
+
                 root = elementtree.parse(conf).getroot()
                 for handler in (root.find("handlers") or []):
                     rval.append({"service_name": handler.attrib["id"]})
@@ -213,18 +314,41 @@ class ConfigManager(object):
                 rval.append({"service_name": handler})
         return rval
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """Open the persisted state for modification.
+
+        All changes made within the transaction are committed in a single atomic write of the state file on exit, and
+        discarded if an exception is raised. The state dir is locked for the duration of the transaction so that
+        concurrent gravity processes cannot clobber each other's changes. Transactions can be nested, in which case only
+        the outermost transaction commits.
+        """
+        if self.__transaction_state is not None:
+            yield self.__transaction_state
+            return
+        with state_lock(self.state_dir):
+            # the cached state may predate changes made by another process before we acquired the lock
+            self.invalidate_state()
+            self.__transaction_state = self.state
+            try:
+                yield self.__transaction_state
+                self.state_store.save(self.__transaction_state)
+            finally:
+                self.__transaction_state = None
+                self.invalidate_state()
+
     def _register_config_file(self, key, val):
         """Persist a newly added config file, or update (overwrite) the value
         of a previously persisted config.
         """
-        with self.state as state:
+        with self.transaction() as state:
             state.config_files[key] = val
 
     def _deregister_config_file(self, key):
         """Deregister a previously registered config file.  The caller should
         ensure that it was previously registered.
         """
-        with self.state as state:
+        with self.transaction() as state:
             if "remove_configs" not in state:
                 state.remove_configs = {}
             state.remove_configs[key] = state.config_files.pop(key)
@@ -233,7 +357,7 @@ class ConfigManager(object):
         """Forget a previously deregister config file.  The caller should
         ensure that it was previously deregistered.
         """
-        with self.state as state:
+        with self.transaction() as state:
             del state.remove_configs[key]
             if not state.remove_configs:
                 del state["remove_configs"]
@@ -246,15 +370,30 @@ class ConfigManager(object):
         # 'update' here is synonymous with 'add or update'
         instances = set()
         new_configs = {}
-        meta_changes = {"changed_instances": set(), "remove_instances": [], "remove_configs": self.get_remove_configs()}
+        meta_changes = {
+            "changed_instances": set(),
+            "remove_instances": [],
+            "remove_configs": self.get_remove_configs(),
+            "skipped_configs": set(),
+        }
         for config_file, stored_config in self.get_registered_configs().items():
-            new_config = stored_config
+            key = self.config_cache.key(config_file, stored_config.defaults, self.state_dir)
+            if self.config_cache.is_registered(config_file, key, config_digest(stored_config)):
+                debug(f"No dependencies of {config_file} have changed since it was registered")
+                # copy, the stored config belongs to the cached state
+                new_configs[config_file] = ConfigFile(stored_config)
+                instances.add(stored_config["instance_name"])
+                meta_changes["skipped_configs"].add(config_file)
+                continue
+            # copy, the stored config belongs to the cached state
+            new_config = ConfigFile(stored_config)
             try:
                 ini_config = self.get_config(config_file, defaults=stored_config.defaults)
             except OSError as exc:
                 warn("Unable to read %s (hint: use `rename` or `remove` to fix): %s", config_file, exc)
-                new_configs[config_file] = stored_config
+                new_configs[config_file] = new_config
                 instances.add(stored_config["instance_name"])
+                meta_changes["skipped_configs"].add(config_file)
                 continue
             if ini_config["instance_name"] is not None:
                 # instance name is explicitly set in the config
@@ -263,7 +402,7 @@ class ConfigManager(object):
                     # instance name has changed
                     # (removal of old instance will happen later if no other config references it)
                     new_config["update_instance_name"] = instance_name
-                meta_changes["changed_instances"].add(instance_name)
+                    meta_changes["changed_instances"].add(instance_name)
             else:
                 # instance name is dynamically generated
                 instance_name = stored_config["instance_name"]
@@ -272,26 +411,14 @@ class ConfigManager(object):
                 meta_changes["changed_instances"].add(instance_name)
             # make sure this instance isn't removed
             instances.add(instance_name)
-            services = []
-            for service in ini_config["services"]:
-                for stored_service in stored_config["services"]:
-                    if service.full_match(stored_service):
-                        # service is configured and has no changes
-                        break
-                else:
-                    # instance has a new service or service has config change
-                    if "update_services" not in new_config:
-                        new_config["update_services"] = []
-                    new_config["update_services"].append(service)
-                    meta_changes["changed_instances"].add(instance_name)
-                # make sure this service isn't removed
-                services.append(service)
-            for service in stored_config["services"]:
-                if service not in services:
-                    if "remove_services" not in new_config:
-                        new_config["remove_services"] = []
-                    new_config["remove_services"].append(service)
-                    meta_changes["changed_instances"].add(instance_name)
+            update_services, remove_services = self.diff_services(stored_config["services"], ini_config["services"])
+            if update_services:
+                # instance has a new service or service has config change
+                new_config["update_services"] = update_services
+                meta_changes["changed_instances"].add(instance_name)
+            if remove_services:
+                new_config["remove_services"] = remove_services
+                meta_changes["changed_instances"].add(instance_name)
             new_configs[config_file] = new_config
         # once finished processing all configs, find any instances which have been deleted
         for instance_name in self.get_registered_instances(include_removed=True):
@@ -299,32 +426,92 @@ class ConfigManager(object):
                 meta_changes["remove_instances"].append(instance_name)
         return new_configs, meta_changes
 
+    @staticmethod
+    def diff_services(stored_services, services):
+        """Compare the services of a config to its stored services.
+
+        Returns the services in ``services`` that are new or have a config change, and the services in ``stored_services``
+        that are no longer present in ``services``. Services are indexed by identity so this is linear in the number of
+        services.
+        """
+        stored_services_by_identity = {service.identity: service for service in stored_services}
+        update_services = []
+        identities = set()
+        for service in services:
+            stored_service = stored_services_by_identity.get(service.identity)
+            if stored_service is None or not service.full_match(stored_service):
+                update_services.append(service)
+            identities.add(service.identity)
+        remove_services = [service for service in stored_services if service.identity not in identities]
+        return update_services, remove_services
+
     def register_config_changes(self, configs, meta_changes):
         """Persist config changes to the JSON state file. When a config
         changes, a process manager may perform certain actions based on these
         changes. This method can be called once the actions are complete.
         """
-        for config_file in meta_changes["remove_configs"].keys():
-            self._purge_config_file(config_file)
-        for config_file, config in configs.items():
-            if "update_attribs" in config:
-                config["attribs"] = config.pop("update_attribs")
-            if "update_instance_name" in config:
-                config["instance_name"] = config.pop("update_instance_name")
-            if "update_services" in config or "remove_services" in config:
-                remove = config.pop("remove_services", [])
-                services = config.pop("update_services", [])
-                # need to prevent old service defs from overwriting new ones
-                for service in config["services"]:
-                    if service not in remove and service not in services:
-                        services.append(service)
-                config["services"] = services
-            self._register_config_file(config_file, config)
+        with self.transaction():
+            for config_file in meta_changes["remove_configs"].keys():
+                self._purge_config_file(config_file)
+            for config_file, config in configs.items():
+                if "update_attribs" in config:
+                    config["attribs"] = config.pop("update_attribs")
+                if "update_instance_name" in config:
+                    config["instance_name"] = config.pop("update_instance_name")
+                if "update_services" in config or "remove_services" in config:
+                    remove = config.pop("remove_services", [])
+                    services = config.pop("update_services", [])
+                    # need to prevent old service defs from overwriting new ones
+                    identities = {service.identity for service in remove + services}
+                    for service in config["services"]:
+                        if service.identity not in identities:
+                            services.append(service)
+                            identities.add(service.identity)
+                    config["services"] = services
+                self._register_config_file(config_file, config)
+            # under the state lock, so that the digests recorded are those of the configs committed. Configs that were not
+            # (re)parsed by determine_config_changes do not correspond to their cache entry
+            for config_file, config in configs.items():
+                if config_file not in meta_changes.get("skipped_configs", ()):
+                    self.config_cache.set_registered(config_file, config_digest(config))
+
+    def __get_state_signature(self, state=None):
+        signature = (self.state_store.signature(),)
+        if state is not None:
+            # state normalization depends on the existence of these paths, not just on the contents of the state file
+            signature += tuple(exists(path) for path in state.normalization_paths)
+        return signature
 
     @property
     def state(self):
-        """Public property to access persisted config state"""
-        return GravityState.open(self.config_state_path)
+        """Public property to access persisted config state
+
+        The parsed state is cached and reused until the signature of the state store (for the default YAML store, the stat
+        signature of the state file) changes.
+        """
+        state = self.__loaded_state()
+        if state is None:
+            state = self.state_store.load()
+            self.__state = state
+            self.__state_signature = self.__get_state_signature(state)
+        return state
+
+    def __loaded_state(self):
+        """Return the state if it is open in a transaction, or cached and unchanged since it was loaded, otherwise ``None``"""
+        if self.__transaction_state is not None:
+            return self.__transaction_state
+        if self.__state is not None and self.__get_state_signature(self.__state) == self.__state_signature:
+            return self.__state
+        return None
+
+    def __partial_load(self):
+        """Indicate whether single configs should be read from the state store rather than from the whole state"""
+        return self.state_store.partial_loads and self.__loaded_state() is None
+
+    def invalidate_state(self):
+        """Drop the cached state, it will be reread from the state file on next access."""
+        self.__state = None
+        self.__state_signature = None
 
     @property
     def instance_count(self):
@@ -338,7 +525,7 @@ class ConfigManager(object):
 
     def get_registered_configs(self, instances=None):
         """Return the persisted values of all config files registered with the config manager."""
-        configs = self.state.config_files
+        configs = dict(self.state.config_files)
         if instances is not None:
             for config_file, config in list(configs.items()):
                 if config["instance_name"] not in instances:
@@ -347,10 +534,15 @@ class ConfigManager(object):
 
     def get_remove_configs(self):
         """Return the persisted values of all config files pending removal by the process manager."""
-        return self.state.get("remove_configs", {})
+        return dict(self.state.get("remove_configs", {}))
 
     def get_registered_config(self, config_file):
         """Return the persisted value of the named config file."""
+        if self.__partial_load():
+            config = self.state_store.load_config(config_file)
+            # otherwise the path may only match once the state is normalized
+            if config is not None:
+                return config
         return self.state.config_files.get(config_file, None)
 
     def get_registered_instances(self, include_removed=False):
@@ -365,6 +557,10 @@ class ConfigManager(object):
         return rval
 
     def get_instance_config(self, instance_name):
+        if self.__partial_load():
+            config = self.state_store.load_instance_config(instance_name)
+            if config is not None:
+                return config
         for config in list(self.state.config_files.values()):
             if config["instance_name"] == instance_name:
                 return config
@@ -380,6 +576,8 @@ class ConfigManager(object):
         rval = []
         for config_file, config in self.state.config_files.items():
             for service in config["services"]:
+                # copy, the stored service belongs to the cached state
+                service = service.__class__(**service)
                 service["config_file"] = config_file
                 service["instance_name"] = config["instance_name"]
                 rval.append(service)
@@ -433,7 +631,7 @@ class ConfigManager(object):
         conf = self.get_config(new)
         if conf is None:
             exception(f"Cannot add {new}: File is unknown type")
-        with self.state as state:
+        with self.transaction() as state:
             state.config_files[new] = state.config_files.pop(old)
         info("Reregistered config %s as %s", old, new)
 
@@ -452,6 +650,9 @@ class ConfigManager(object):
                 warn("%s is not registered", config_file)
             else:
                 config_files.append(config_file)
+        with self.transaction():
+            for config_file in config_files:
+                self._deregister_config_file(config_file)
+                info("Deregistered config: %s", config_file)
         for config_file in config_files:
-            self._deregister_config_file(config_file)
-            info("Deregistered config: %s", config_file)
+            self.config_cache.remove(config_file)
@@ -0,0 +1,127 @@
+""" Health probes for checking whether services are ready to accept connections
+"""
+import functools
+import socket
+import time
+
+PROBE_TIMEOUT = 2
+# seconds to wait for services to become healthy after starting them
+DEFAULT_HEALTH_TIMEOUT = 300
+# gunicorn's default port if bind is only a host
+GUNICORN_DEFAULT_PORT = 8000
+# addresses to connect to for services bound to all addresses
+WILDCARD_ADDRESSES = {"0.0.0.0": "127.0.0.1", "::": "::1", "": "127.0.0.1"}
+
+
+def tcp_address(host, port):
+    """Return the address to connect to for a service bound to ``host`` and ``port``"""
+    host = host.strip("[]")
+    return ("tcp", WILDCARD_ADDRESSES.get(host, host), int(port))
+
+
+def parse_bind(bind, default_port=GUNICORN_DEFAULT_PORT):
+    """Parse a gunicorn-style bind string into ``("unix", path)`` or ``("tcp", host, port)``, or ``None`` if it can't be
+    connected to (e.g. ``fd://`` binds)
+    """
+    if bind.startswith("unix:"):
+        return ("unix", bind[len("unix:"):])
+    if bind.startswith("fd://"):
+        return None
+    host, sep, port = bind.rpartition(":")
+    if not sep or host.endswith(":") and not host.startswith("["):
+        # no port, or an unbracketed IPv6 address
+        host, port = bind, default_port
+    return tcp_address(host, port)
+
+
+def _connect(address, timeout):
+    if address[0] == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address[1])
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    return socket.create_connection(address[1:], timeout=timeout)
+
+
+class Probe(object):
+    """Base class of health probes. :meth:`check` returns a tuple of whether the service is healthy and a description of
+    the result.
+    """
+
+    def __init__(self, address, timeout=PROBE_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+
+    def check(self):
+        start = time.monotonic()
+        try:
+            healthy, detail = self._check()
+        except OSError as exc:
+            return False, str(exc) or exc.__class__.__name__
+        return healthy, f"{detail} in {time.monotonic() - start:.3f}s"
+
+    def _check(self):
+        raise NotImplementedError()
+
+    def __str__(self):
+        if self.address[0] == "unix":
+            return f"unix:{self.address[1]}"
+        return f"{self.address[1]}:{self.address[2]}"
+
+
+class ConnectProbe(Probe):
+    """Healthy if a TCP or unix socket connection can be established"""
+
+    def _check(self):
+        _connect(self.address, self.timeout).close()
+        return True, "connected"
+
+    def __str__(self):
+        return f"connect {super(ConnectProbe, self).__str__()}"
+
+
+@functools.lru_cache(maxsize=None)
+def _http_connection_class():
+    # http.client is slow to import, so it is only imported once an HTTP probe is checked
+    import http.client
+
+    class HTTPConnection(http.client.HTTPConnection):
+        def __init__(self, address, timeout):
+            host = address[1] if address[0] == "tcp" else "localhost"
+            super(HTTPConnection, self).__init__(host, timeout=timeout)
+            self.address = address
+
+        def connect(self):
+            self.sock = _connect(self.address, self.timeout)
+
+    return HTTPConnection
+
+
+class HTTPProbe(Probe):
+    """Healthy if a GET of ``path`` returns a 2xx or 3xx response"""
+
+    def __init__(self, address, path, timeout=PROBE_TIMEOUT):
+        super(HTTPProbe, self).__init__(address, timeout=timeout)
+        self.path = path
+
+    def _check(self):
+        import http.client
+
+        conn = _http_connection_class()(self.address, self.timeout)
+        try:
+            conn.request("GET", self.path)
+            status = conn.getresponse().status
+        except http.client.HTTPException as exc:
+            return False, str(exc) or exc.__class__.__name__
+        finally:
+            conn.close()
+        return 200 <= status < 400, f"HTTP {status}"
+
+    def __str__(self):
+        if self.address[0] == "unix":
+            return f"GET {self.path} on unix:{self.address[1]}"
+        return f"GET http://{super(HTTPProbe, self).__str__()}{self.path}"
@@ -1,7 +1,11 @@
 """ Click definitions for various shared options and arguments.
 """
+import re
+
 import click
 
+from gravity.health import DEFAULT_HEALTH_TIMEOUT
+
 
 def debug_option():
     return click.option("-d", "--debug", is_flag=True, help="Enables debug mode.")
@@ -13,9 +17,84 @@ def state_dir_option():
     )
 
 
+def state_backend_option():
+    return click.option(
+        "--state-backend", type=click.Choice(["yaml", "sqlite"]), default=None,
+        help="Backend to store process management state in. The existing state is converted if it is stored in a different backend."
+    )
+
+
+def process_manager_option():
+    return click.option(
+        "--process-manager", metavar="NAME", default=None,
+        help="Process manager to use: supervisor (the default), systemd, asyncio (runs services in the foreground), or the name of "
+             "one registered by an installed package."
+    )
+
+
+def parallel_option():
+    return click.option(
+        "--parallel", type=click.IntRange(min=1), default=1, show_default=True,
+        help="Maximum number of instances or services to operate on concurrently."
+    )
+
+
+def wave_size_option():
+    return click.option(
+        "--wave-size", type=click.IntRange(min=1), metavar="N",
+        help="Maximum number of services to start at once in each wave. Defaults to all of the services in the wave."
+    )
+
+
+def health_timeout_option():
+    return click.option(
+        "--health-timeout", type=click.IntRange(min=0), default=DEFAULT_HEALTH_TIMEOUT, show_default=True, metavar="SECONDS",
+        help="Seconds to wait for services with health checks (e.g. gunicorn, tusd) to become healthy, 0 to not wait."
+    )
+
+
+def grep_option():
+    return click.option("--grep", callback=_check_grep, metavar="REGEX", help="Only output lines matching the regular expression REGEX.")
+
+
+def since_option():
+    return click.option(
+        "--since", callback=_parse_time, metavar="TIME",
+        help="Only output lines logged since TIME, either a duration (e.g. 30s, 10m, 2h, 1d) ago or an ISO 8601 date and time."
+    )
+
+
+def until_option():
+    return click.option(
+        "--until", callback=_parse_time, metavar="TIME",
+        help="Only output lines logged until TIME, either a duration (e.g. 30s, 10m, 2h, 1d) ago or an ISO 8601 date and time."
+    )
+
+
+def _check_grep(ctx, param, value):
+    if value is not None:
+        try:
+            re.compile(value)
+        except re.error as exc:
+            raise click.BadParameter(f"{value!r} is not a valid regular expression: {exc}")
+    return value
+
+
+def _parse_time(ctx, param, value):
+    if value is None:
+        return None
+    # the log utilities are only imported by the commands that use them
+    from gravity.util.logs import parse_since
+
+    try:
+        return parse_since(value)
+    except ValueError:
+        raise click.BadParameter(f"{value!r} is not a duration or an ISO 8601 date and time")
+
+
 def no_log_option():
     return click.option(
-        '--quiet', is_flag=True, default=False, help="Only output supervisor logs, do not include process logs"
+        '--quiet', is_flag=True, default=False, help="Only output process manager logs, do not include process logs"
     )
 
 
@@ -3,41 +3,209 @@
 
 import contextlib
 import importlib
-import inspect
+import json
+import math
 import os
-import subprocess
 from abc import ABCMeta, abstractmethod
 
+import click
+
 from gravity.config_manager import ConfigManager
-from gravity.io import exception
-from gravity.util import which
+from gravity.io import exception, info, warn
+from gravity.util import wait_for
+
+
+# process manager used unless another is selected by name or with $GRAVITY_PROCESS_MANAGER
+DEFAULT_PROCESS_MANAGER = "supervisor"
+# entry point group that installed packages register process managers in, by name
+PROCESS_MANAGER_ENTRY_POINT_GROUP = "gravity.process_managers"
+# process managers included with Gravity, which are loaded without looking up the entry points of installed packages, and
+# whose names those cannot register
+BUILTIN_PROCESS_MANAGERS = {
+    "asyncio": "gravity.process_manager.asyncio_manager:AsyncioProcessManager",
+    "supervisor": "gravity.process_manager.supervisor_manager:SupervisorProcessManager",
+    "systemd": "gravity.process_manager.systemd_manager:SystemdProcessManager",
+}
+
+
+def _process_manager_entry_points():
+    """Return a dict of the names and entry points of the process managers registered by installed packages, except those
+    registered with the name of a built-in process manager
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return {}
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=PROCESS_MANAGER_ENTRY_POINT_GROUP)
+    else:
+        entry_points = entry_points.get(PROCESS_MANAGER_ENTRY_POINT_GROUP, [])
+    registered = {}
+    for entry_point in entry_points:
+        if entry_point.name in BUILTIN_PROCESS_MANAGERS:
+            warn(f"Ignoring process manager {entry_point.name} ({entry_point.value}): the name of a built-in process manager")
+            continue
+        registered[entry_point.name] = entry_point
+    return registered
+
+
+def available_process_managers():
+    """Return the sorted names of the built-in and registered process managers"""
+    return sorted(set(BUILTIN_PROCESS_MANAGERS) | set(_process_manager_entry_points()))
+
+
+def process_manager_class(name=None):
+    """Return the process manager class named ``name`` (e.g. ``supervisor`` or ``systemd``), or if ``name`` is not given,
+    the one named by ``$GRAVITY_PROCESS_MANAGER`` or else the default.
+
+    Only the module of the selected process manager is imported. Built-in process managers are found by name, others in
+    the ``gravity.process_managers`` entry point group, as ``name = module:class``.
+    """
+    name = name or os.environ.get("GRAVITY_PROCESS_MANAGER") or DEFAULT_PROCESS_MANAGER
+    if name in BUILTIN_PROCESS_MANAGERS:
+        target = BUILTIN_PROCESS_MANAGERS[name]
+        module_name, class_name = target.split(":")
+        cls = getattr(importlib.import_module(module_name), class_name)
+    else:
+        entry_point = _process_manager_entry_points().get(name)
+        if entry_point is None:
+            exception(f"Unknown process manager: {name} (available: {', '.join(available_process_managers())})")
+        target = entry_point.value
+        cls = entry_point.load()
+    if not (isinstance(cls, type) and issubclass(cls, BaseProcessManager)):
+        exception(f"Process manager {name} ({target}) is not a subclass of BaseProcessManager")
+    return cls
 
 
-# If at some point we have additional process managers we can make a factory,
-# but for the moment there's only supervisor.
 @contextlib.contextmanager
-def process_manager(*args, **kwargs):
-    # roulette!
-    for filename in os.listdir(os.path.dirname(__file__)):
-        if filename.endswith(".py") and not filename.startswith("_"):
-            mod = importlib.import_module("gravity.process_manager." + filename[: -len(".py")])
-            for name in dir(mod):
-                obj = getattr(mod, name)
-                if not name.startswith("_") and inspect.isclass(obj) and issubclass(obj, BaseProcessManager) and obj != BaseProcessManager:
-                    pm = obj(*args, **kwargs)
-                    try:
-                        yield pm
-                    finally:
-                        pm.terminate()
-                    return
+def process_manager(*args, manager=None, **kwargs):
+    pm = process_manager_class(manager)(*args, **kwargs)
+    try:
+        yield pm
+    finally:
+        pm.terminate()
+
+
+# seconds to wait for services to stop before killing them, as the stopwaitsecs of the supervisor programs
+SERVICE_STOP_TIMEOUTS = {
+    "gunicorn": 65,
+    "unicornherder": 65,
+    "standalone": 65,
+}
+DEFAULT_STOP_TIMEOUT = 10
+# types of the services that run Galaxy's code, and so need the Galaxy environment
+GALAXY_ENVIRONMENT_SERVICE_TYPES = ("gunicorn", "unicornherder", "celery", "celery-beat")
+
+# fraction of the services restarted by a rolling restart that are restarted at once, if the batch size is not set
+DEFAULT_ROLLING_BATCH_FRACTION = 0.25
+
+
+def rolling_batches(members, batch_size):
+    """Divide services into batches for a rolling restart.
+
+    ``members`` is a list of ``(key, pools)`` tuples of each service's key and the server pools it belongs to. Returns a
+    list of batches (lists of keys) that each contain at most ``batch_size`` services and leave at least one member of
+    every pool with more than one member out of the batch, so that no pool is without running services while a batch is
+    restarted.
+    """
+    pool_sizes = {}
+    for key, pools in members:
+        for pool in pools:
+            pool_sizes[pool] = pool_sizes.get(pool, 0) + 1
+    batches = []
+    remaining = list(members)
+    while remaining:
+        batch = []
+        batch_pool_counts = {}
+        deferred = []
+        for key, pools in remaining:
+            if len(batch) < batch_size and all(
+                batch_pool_counts.get(pool, 0) + 1 < pool_sizes[pool] or pool_sizes[pool] == 1 for pool in pools
+            ):
+                batch.append(key)
+                for pool in pools:
+                    batch_pool_counts[pool] = batch_pool_counts.get(pool, 0) + 1
+            else:
+                deferred.append((key, pools))
+        batches.append(batch)
+        remaining = deferred
+    return batches
+
+
+def startup_waves(members, wave_size=None):
+    """Divide services into waves for starting them in dependency order.
+
+    ``members`` is a list of ``(key, service_type, start_after)`` tuples of each service's key, type and the types of the
+    services it must be started after. Each service is placed in the wave after the last wave containing a service it
+    depends on, ignoring dependencies on types that aren't present, and waves of more than ``wave_size`` services are
+    split. Returns a list of waves (lists of keys) in the order they should be started.
+    """
+    present = {service_type for _, service_type, _ in members}
+    dependencies = {}
+    for _, service_type, start_after in members:
+        dependencies.setdefault(service_type, set()).update(dep for dep in start_after if dep in present and dep != service_type)
+    levels = {}
+
+    def level(service_type, path=()):
+        if service_type in path:
+            raise ValueError(f"Circular service dependency: {' -> '.join(path + (service_type,))}")
+        if service_type not in levels:
+            levels[service_type] = max((level(dep, path + (service_type,)) + 1 for dep in dependencies[service_type]), default=0)
+        return levels[service_type]
+
+    levelled = {}
+    for key, service_type, _ in members:
+        levelled.setdefault(level(service_type), []).append(key)
+    waves = []
+    for keys in (levelled[i] for i in sorted(levelled)):
+        size = wave_size or len(keys)
+        waves.extend(keys[i:i + size] for i in range(0, len(keys), size))
+    return waves
+
+
+def resource_control_wrappers(resources):
+    """Return a list of commands (lists of arguments) that each apply some of ``resources``, a dict of process resource
+    controls (see :class:`gravity.settings.ResourceSettings`), and then execute the command that follows them.
+    """
+    wrappers = []
+    if resources.get("cpu_affinity") is not None:
+        wrappers.append(["taskset", "-c", resources["cpu_affinity"]])
+    if resources.get("nice") is not None:
+        wrappers.append(["nice", "-n", str(resources["nice"])])
+    if resources.get("ionice_class") is not None or resources.get("ionice_priority") is not None:
+        ionice = ["ionice", "-c", resources.get("ionice_class") or "best-effort"]
+        # the idle class has no priorities
+        if resources.get("ionice_priority") is not None and ionice[-1] != "idle":
+            ionice.extend(["-n", str(resources["ionice_priority"])])
+        wrappers.append(ionice)
+    rlimits = [f"--{name}={resources['rlimit_' + name]}" for name in ("as", "nofile") if resources.get("rlimit_" + name) is not None]
+    if rlimits:
+        wrappers.append(["prlimit"] + rlimits)
+    if resources.get("oom_score_adj") is not None:
+        wrappers.append(["choom", "-n", str(resources["oom_score_adj"]), "--"])
+    return wrappers
 
 
 class BaseProcessManager(object, metaclass=ABCMeta):
 
-    def __init__(self, state_dir=None, start_daemon=True, foreground=False):
-        self.config_manager = ConfigManager(state_dir=state_dir)
+    def __init__(
+        self, state_dir=None, start_daemon=True, foreground=False, state_backend=None, parallel=1, batch_size=None, health_timeout=None,
+        wave_size=None,
+    ):
+        self.config_manager = ConfigManager(state_dir=state_dir, state_backend=state_backend)
         self.state_dir = self.config_manager.state_dir
-        self.tail = which("tail")
+        # maximum number of instances or services to operate on concurrently
+        self.parallel = parallel
+        # number of services restarted at once by a rolling restart
+        self.batch_size = batch_size
+        # seconds to wait for started services to pass their health checks, None or 0 to not wait
+        self.health_timeout = health_timeout
+        # maximum number of services started at once by each wave of a startup
+        self.wave_size = wave_size
 
     def _service_log_file(self, log_dir, program_name):
         return os.path.join(log_dir, program_name + ".log")
@@ -45,10 +213,158 @@ class BaseProcessManager(object, metaclass=ABCMeta):
     def _service_program_name(self, instance_name, service):
         return f"{instance_name}_{service['config_type']}_{service['service_type']}_{service['service_name']}"
 
+    def _service_format_vars(self, config_file, attribs, service, program_name, pid_dir):
+        """Return the variables for formatting the command template of ``service``, which has program name
+        ``program_name`` and writes its pid file (if any) to ``pid_dir``, with its formatted command as ``command``.
+        """
+        # used by the "standalone" service type
+        attach_to_pool_opt = ""
+        server_pools = service.get("server_pools")
+        if server_pools:
+            _attach_to_pool_opt = " ".join(f"--attach-to-pool={server_pool}" for server_pool in server_pools)
+            # Insert a single leading space
+            attach_to_pool_opt = f" {_attach_to_pool_opt}"
+
+        virtualenv_dir = attribs.get("virtualenv")
+        virtualenv_bin = f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}' if virtualenv_dir else ""
+        gunicorn_options = attribs["gunicorn"].copy()
+        gunicorn_options["preload"] = "--preload" if gunicorn_options["preload"] else ""
+
+        format_vars = {
+            "log_dir": attribs["log_dir"],
+            "log_file": self._service_log_file(attribs["log_dir"], program_name),
+            "config_type": service["config_type"],
+            "server_name": service["service_name"],
+            "attach_to_pool_opt": attach_to_pool_opt,
+            "gunicorn": gunicorn_options,
+            "celery": attribs["celery"],
+            "galaxy_infrastructure_url": attribs["galaxy_infrastructure_url"],
+            "tusd": attribs["tusd"],
+            "gx_it_proxy": attribs["gx_it_proxy"],
+            "galaxy_umask": service.get("umask", "022"),
+            "program_name": program_name,
+            "galaxy_conf": config_file,
+            "galaxy_root": attribs["galaxy_root"],
+            "virtualenv_bin": virtualenv_bin,
+            "supervisor_state_dir": pid_dir,
+            "state_dir": self.state_dir,
+        }
+        format_vars["command"] = service.command_template.format(**format_vars)
+        return format_vars
+
+    def _service_environment(self, config_file, attribs, service):
+        """Return a dict of the environment variables that ``service`` is run with, in addition to the inherited ones"""
+        environment = {}
+        if service["service_type"] in GALAXY_ENVIRONMENT_SERVICE_TYPES:
+            environment.update({"PYTHONPATH": "lib", "GALAXY_CONFIG_FILE": config_file})
+        if service["service_type"] == "gx-it-proxy":
+            environment["npm_config_yes"] = "true"
+        if attribs.get("virtualenv"):
+            environment["VIRTUAL_ENV"] = attribs["virtualenv"]
+            environment["PATH"] = f"{os.path.join(attribs['virtualenv'], 'bin')}:{os.environ.get('PATH', os.defpath)}"
+        return environment
+
+    def _rolling_batches(self, instance_services):
+        """Divide ``instance_services``, a list of ``(key, instance_name, service)`` tuples, into batches of keys for a
+        rolling restart. Services not in any server pool are treated as belonging to a pool of their own.
+        """
+        members = [
+            (key, [(instance_name, pool) for pool in service.get("server_pools") or [None]])
+            for key, instance_name, service in instance_services
+        ]
+        batch_size = self.batch_size or math.ceil(len(members) * DEFAULT_ROLLING_BATCH_FRACTION)
+        return rolling_batches(members, batch_size)
+
+    def _startup_waves(self, instance_services):
+        """Divide ``instance_services``, a list of ``(key, instance_name, service)`` tuples, into waves of keys to be
+        started in order.
+        """
+        members = [(key, service["service_type"], service.start_after) for key, instance_name, service in instance_services]
+        return startup_waves(members, self.wave_size)
+
+    def _health_probes(self):
+        """Yield ``(instance_name, service, probe)`` for each registered service that has a health probe"""
+        for config in self.config_manager.get_registered_configs().values():
+            for service in config["services"]:
+                probe = service.health_probe(config["attribs"])
+                if probe is not None:
+                    yield config["instance_name"], service, probe
+
+    def _wait_for_health(self, probes, failed=None):
+        """Wait for each of ``probes``, a dict of service names and probes, to pass, up to ``health_timeout`` seconds.
+
+        If given, ``failed`` is called with the names of the services that are not yet healthy and returns a list of
+        errors for any that have failed, in which case waiting stops early.
+        """
+        if not probes or not self.health_timeout:
+            return
+        pending = dict(probes)
+        details = {}
+        errors = []
+
+        def all_healthy():
+            for name, probe in list(pending.items()):
+                healthy, details[name] = probe.check()
+                if healthy:
+                    info(f"{name}: healthy ({probe}: {details[name]})")
+                    del pending[name]
+            if pending and failed:
+                errors.extend(failed(list(pending)))
+            return errors or not pending
+
+        info(f"Waiting up to {self.health_timeout} seconds for service(s) to be healthy: {', '.join(pending)}")
+        wait_for(all_healthy, self.health_timeout, initial_delay=0.1, max_delay=2)
+        if errors:
+            exception(f"Service(s) failed while waiting for them to be healthy: {', '.join(errors)}")
+        if pending:
+            exception(
+                f"Service(s) not healthy after {self.health_timeout} seconds: "
+                + ", ".join(f"{name} ({probe}: {details[name]})" for name, probe in pending.items())
+            )
+
+    @staticmethod
+    def __format_bytes(n):
+        for unit in ("B", "K", "M", "G"):
+            if n < 1024:
+                break
+            n /= 1024
+        else:
+            unit = "T"
+        return f"{n:.1f}{unit}"
+
+    def _output_status(self, statuses, json_output=False):
+        """Output ``statuses``, as returned by ``process_status``, as a table or as JSON"""
+        if json_output:
+            click.echo(json.dumps(statuses, indent=2))
+            return
+        width = max([30] + [len(status["name"]) for status in statuses]) + 3
+        for status in statuses:
+            # supervisor's description is empty for some states, e.g. STARTING
+            details = [status["description"]] if status["description"] else []
+            if status["rss"] is not None:
+                details.append(f"rss {self.__format_bytes(status['rss'])}")
+            if status["pss"] is not None:
+                details.append(f"pss {self.__format_bytes(status['pss'])}")
+            if status["cpu_time"] is not None:
+                details.append(f"cpu {status['cpu_time']:.2f}s")
+                details.append(f"threads {status['threads']}")
+                if status["processes"] > 1:
+                    details.append(f"processes {status['processes']}")
+            if status["state"] == "EXITED":
+                details.append(f"exit status {status['exit_status']}")
+            if status["health"] is not None:
+                details.append(f"{'healthy' if status['health']['healthy'] else 'unhealthy'} ({status['health']['detail']})")
+            click.echo(f"{status['name']:<{width}}{status['state']:<10}{', '.join(details)}")
+
     @abstractmethod
     def start(self, instance_names):
         """ """
 
+    def run_foreground(self, instance_names, quiet=False):
+        """Start the services of ``instance_names`` and output their logs until interrupted"""
+        self.start(instance_names)
+        self.follow(instance_names, quiet=quiet)
+
     @abstractmethod
     def _process_config_changes(self, configs, meta_changes):
         """ """
@@ -69,17 +385,12 @@ class BaseProcessManager(object, metaclass=ABCMeta):
     def reload(self, instance_names):
         """ """
 
-    def follow(self, instance_names, quiet=False):
-        # supervisor has a built-in tail command but it only works on a single log file. `galaxyctl supervisorctl tail
-        # ...` can be used if desired, though
-        if not self.tail:
-            exception("`tail` not found on $PATH, please install it")
+    def _log_files(self, instance_names, quiet=False):
+        """Return a dict of the program names and log files of the services of ``instance_names``"""
         instance_names, service_names, registered_instance_names = self.get_instance_names(instance_names)
-        log_files = []
+        log_files = {}
         if quiet:
-            cmd = [self.tail, "-f", self.log_file]
-            tail_popen = subprocess.Popen(cmd)
-            tail_popen.wait()
+            log_files["supervisord"] = self.log_file
         else:
             if not instance_names:
                 instance_names = registered_instance_names
@@ -90,12 +401,27 @@ class BaseProcessManager(object, metaclass=ABCMeta):
                     services = self.config_manager.get_instance_services(instance_name)
                     for service in services:
                         program_name = self._service_program_name(instance_name, service)
-                        log_files.append(self._service_log_file(log_dir, program_name))
+                        log_files[program_name] = self._service_log_file(log_dir, program_name)
                 else:
-                    log_files.extend([self._service_log_file(log_dir, s) for s in service_names])
-                cmd = [self.tail, "-f"] + log_files
-                tail_popen = subprocess.Popen(cmd)
-                tail_popen.wait()
+                    log_files.update({s: self._service_log_file(log_dir, s) for s in service_names})
+        return log_files
+
+    def follow(self, instance_names, quiet=False, grep=None, since=None, rate=None):
+        # supervisor has a built-in tail command but it only works on a single log file. `galaxyctl supervisorctl tail
+        # ...` can be used if desired, though
+        from gravity.util.logs import LogFollower
+
+        follower = LogFollower(self._log_files(instance_names, quiet=quiet), grep=grep, since=since, rate=rate)
+        try:
+            follower.follow()
+        except KeyboardInterrupt:
+            pass
+
+    def logs(self, instance_names, grep=None, since=None, until=None, lines=None):
+        from gravity.util.logs import search_logs
+
+        for line in search_logs(self._log_files(instance_names), since=since, until=until, grep=grep, lines=lines):
+            click.echo(line)
 
     @abstractmethod
     def graceful(self, instance_names):
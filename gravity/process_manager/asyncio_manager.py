@@ -0,0 +1,699 @@
+""" Native asyncio Process Manager
+
+Services are run directly as child processes of Gravity in the foreground, without supervisord. Their output is
+multiplexed to the terminal with each line prefixed by the service's name, they are watched with pidfds (or SIGCHLD where
+pidfds are unavailable) and restarted with exponential backoff when they exit, and signals sent to Gravity are forwarded
+to them. When Gravity runs as PID 1 (e.g. as a container's entrypoint), it also reaps orphaned processes.
+
+Other ``galaxyctl`` commands control the foreground Gravity by signalling it, and read the status that it writes to the
+state dir.
+"""
+import asyncio
+import collections
+import errno
+import json
+import os
+import shlex
+import signal
+import subprocess
+import time
+from datetime import timedelta
+from os.path import exists, join
+
+import click
+
+from gravity.io import debug, error, exception, info, warn
+from gravity.process_manager import (
+    BaseProcessManager,
+    DEFAULT_STOP_TIMEOUT,
+    resource_control_wrappers,
+    SERVICE_STOP_TIMEOUTS,
+)
+from gravity.state import GracefulMethod
+from gravity.util import wait_for, which
+from gravity.util.procfs import process_tree_usage
+
+# seconds a service must stay up for to be considered running, after which its restart backoff is reset
+START_SECONDS = 10
+# number of times a service that exits before it is running is restarted before giving up on it
+START_RETRIES = 3
+# seconds to wait before the first restart of a service that has exited, doubled for each consecutive failed start
+RESTART_BACKOFF_INITIAL = 1
+RESTART_BACKOFF_MAX = 60
+# seconds between checks of the state of the services being restarted by a rolling restart
+ROLLING_POLL_INTERVAL = 0.5
+# seconds to wait for the foreground process to exit on shutdown, longer than the stop timeout of any service
+SHUTDOWN_TIMEOUT = 90
+# bytes read from the output of a service at once, and the longest line output before it is split
+OUTPUT_CHUNK_SIZE = 65536
+MAX_LINE_LENGTH = 1024 * 1024
+# signals that are sent on to all running services as they are
+FORWARDED_SIGNALS = (signal.SIGUSR1, signal.SIGUSR2)
+# signal that stops and starts all services again, which Gravity does not otherwise use
+RESTART_SIGNAL = signal.SIGALRM
+# states of services that have a running process
+ACTIVE_STATES = ("STARTING", "RUNNING", "STOPPING")
+
+ServiceSpec = collections.namedtuple("ServiceSpec", ["name", "instance_name", "service", "args", "cwd", "env", "umask", "stop_timeout"])
+
+
+def _pidfd_open(pid):
+    """Return a pidfd for process ``pid``, or ``None`` if pidfds are not supported"""
+    try:
+        return os.pidfd_open(pid)
+    except AttributeError:
+        return None
+    except OSError as exc:
+        if exc.errno in (errno.ENOSYS, errno.EPERM):
+            return None
+        raise
+
+
+def describe_exit(returncode):
+    if returncode is None:
+        return "failed to start"
+    if returncode < 0:
+        try:
+            return f"killed by {signal.Signals(-returncode).name}"
+        except ValueError:
+            return f"killed by signal {-returncode}"
+    return f"exit status {returncode}"
+
+
+class _Process(object):
+    """The process of a service and the state of its supervision"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.popen = None
+        self.pidfd = None
+        self.state = "STOPPED"
+        # monotonic time for uptime checks, and wall clock time for status
+        self.start_time = None
+        self.started_at = None
+        self.exit_status = None
+        # consecutive exits before the service was running
+        self.failures = 0
+        # pending start, restart or kill callback
+        self.timer = None
+        # start again as soon as the process exits
+        self.restart = False
+        # no longer configured, forget once the process exits
+        self.removed = False
+
+    def cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+class _OutputReader(object):
+    """Reads the output of a process and splits it into lines"""
+
+    def __init__(self, proc, stream):
+        self.proc = proc
+        self.stream = stream
+        self.buffer = b""
+
+
+class ServiceRunner(object):
+    """Run services as child processes until shut down, restarting them when they exit.
+
+    ``specs`` is a list of :class:`ServiceSpec`. Lines of service output are passed to ``output`` (discarded if it is
+    ``None``) prefixed with the service name. If given, the state of the services is written as JSON to
+    ``status_file``, ``reload_specs`` is called on graceful reload to return the current list of specs, and
+    ``rolling_batches`` is called with a list of ``(name, instance_name, service)`` tuples to divide services that are
+    restarted by a rolling restart into batches.
+    """
+
+    def __init__(self, specs, output=click.echo, status_file=None, reload_specs=None, rolling_batches=None):
+        self.processes = collections.OrderedDict((spec.name, _Process(spec)) for spec in specs)
+        self.output = output
+        self.status_file = status_file
+        self.reload_specs = reload_specs
+        self.rolling_batches = rolling_batches or (lambda members: [[name] for name, _, _ in members])
+        # as PID 1 there is no init to reap processes orphaned by the services
+        self.reap_orphans = os.getpid() == 1
+        self.stopping = False
+        self.exit_code = 0
+        self.loop = None
+        self.done = None
+        self.readers = set()
+        self.rolling_task = None
+        self.__update_width()
+
+    def __update_width(self):
+        self.width = max([len(name) for name in self.processes] or [0])
+
+    async def run(self):
+        """Start all services and supervise them until they are shut down, returning the exit code for Gravity"""
+        self.loop = asyncio.get_event_loop()
+        self.done = asyncio.Event()
+        handled = {
+            signal.SIGINT: self.shutdown,
+            signal.SIGTERM: self.shutdown,
+            signal.SIGQUIT: self.shutdown,
+            signal.SIGHUP: self.graceful,
+            RESTART_SIGNAL: self.restart,
+            signal.SIGCHLD: self._on_sigchld,
+        }
+        handled.update({signum: lambda signum=signum: self.forward(signum) for signum in FORWARDED_SIGNALS})
+        for signum, handler in handled.items():
+            self.loop.add_signal_handler(signum, handler)
+        try:
+            for proc in self.processes.values():
+                self._spawn(proc)
+            await self.done.wait()
+        finally:
+            for signum in handled:
+                self.loop.remove_signal_handler(signum)
+            if self.rolling_task is not None:
+                self.rolling_task.cancel()
+            for reader in list(self.readers):
+                while reader in self.readers:
+                    self._read_output(reader, final=True)
+            for proc in self.processes.values():
+                proc.cancel_timer()
+            self._write_status(running=False)
+        return self.exit_code
+
+    def _spawn(self, proc):
+        spec = proc.spec
+        proc.timer = None
+        proc.restart = False
+        proc.start_time = time.monotonic()
+        proc.started_at = time.time()
+        umask = int(spec.umask, 8) if spec.umask else None
+        try:
+            # a new session keeps the terminal's signals (e.g. SIGINT on ^C) from reaching the services directly, so that
+            # they are stopped in an orderly way instead
+            popen = subprocess.Popen(
+                spec.args,
+                cwd=spec.cwd,
+                env=spec.env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+                preexec_fn=None if umask is None else lambda: os.umask(umask),
+            )
+        except OSError as exc:
+            error(f"{spec.name}: failed to start: {exc}")
+            self._exited(proc, None)
+            return
+        proc.popen = popen
+        proc.state = "STARTING"
+        debug(f"{spec.name}: started with pid {popen.pid}")
+        os.set_blocking(popen.stdout.fileno(), False)
+        reader = _OutputReader(proc, popen.stdout)
+        self.readers.add(reader)
+        self.loop.add_reader(popen.stdout.fileno(), self._read_output, reader)
+        proc.pidfd = _pidfd_open(popen.pid)
+        if proc.pidfd is not None:
+            self.loop.add_reader(proc.pidfd, self._reap, proc)
+        proc.timer = self.loop.call_later(START_SECONDS, self._running, proc)
+        self._write_status()
+
+    def _running(self, proc):
+        proc.timer = None
+        proc.state = "RUNNING"
+        proc.failures = 0
+        info(f"{proc.spec.name}: running (pid {proc.popen.pid})")
+        self._write_status()
+
+    def _read_output(self, reader, final=False):
+        try:
+            data = os.read(reader.stream.fileno(), OUTPUT_CHUNK_SIZE)
+        except BlockingIOError:
+            if not final:
+                return
+            data = b""
+        except OSError:
+            data = b""
+        lines = (reader.buffer + data).split(b"\n")
+        reader.buffer = lines.pop()
+        if len(reader.buffer) > MAX_LINE_LENGTH or (not data and reader.buffer):
+            lines.append(reader.buffer)
+            reader.buffer = b""
+        for line in lines:
+            self._output_line(reader.proc, line)
+        if not data:
+            self.loop.remove_reader(reader.stream.fileno())
+            reader.stream.close()
+            self.readers.discard(reader)
+
+    def _output_line(self, proc, line):
+        if self.output is not None:
+            text = line.decode("utf-8", "replace").rstrip("\r")
+            self.output(f"{proc.spec.name:<{self.width}} | {text}")
+
+    def _on_sigchld(self):
+        # processes watched with pidfds are reaped when their pidfds become readable, but a process may have exited before
+        # its pidfd was opened
+        for proc in list(self.processes.values()):
+            self._reap(proc)
+        self._reap_orphans()
+
+    def _reap(self, proc):
+        if self._reap_service(proc):
+            self._reap_orphans()
+
+    def _reap_service(self, proc):
+        """Reap the process of ``proc`` and handle its exit if it has exited, returning whether it had"""
+        popen = proc.popen
+        if popen is None or popen.poll() is None:
+            return False
+        if proc.pidfd is not None:
+            self.loop.remove_reader(proc.pidfd)
+            os.close(proc.pidfd)
+            proc.pidfd = None
+        proc.popen = None
+        self._exited(proc, popen.returncode)
+        return True
+
+    def _reap_orphans(self):
+        """Reap exited processes that are not services, which were orphaned and reparented to this process"""
+        if not self.reap_orphans:
+            return
+        while True:
+            # look without reaping, so that the exit status of services is left for _reap_service
+            try:
+                result = os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+            except ChildProcessError:
+                return
+            if result is None:
+                return
+            # services may be restarted as they are reaped, so their pids are looked up each time
+            services = {proc.popen.pid: proc for proc in self.processes.values() if proc.popen}
+            if result.si_pid in services:
+                # a service that exited before its exit was handled, which has to be reaped for waitid to get past it
+                if not self._reap_service(services[result.si_pid]):
+                    return
+                continue
+            try:
+                os.waitpid(result.si_pid, 0)
+            except ChildProcessError:
+                pass
+
+    def _exited(self, proc, returncode):
+        name = proc.spec.name
+        proc.cancel_timer()
+        proc.exit_status = returncode
+        if proc.removed:
+            info(f"{name}: stopped ({describe_exit(returncode)}) and removed")
+            del self.processes[name]
+            self.__update_width()
+        elif self.stopping:
+            proc.state = "STOPPED"
+            info(f"{name}: stopped ({describe_exit(returncode)})")
+        elif proc.restart:
+            info(f"{name}: stopped ({describe_exit(returncode)}), starting")
+            self._spawn(proc)
+            return
+        else:
+            if time.monotonic() - proc.start_time < START_SECONDS:
+                proc.failures += 1
+            if proc.failures > START_RETRIES:
+                proc.state = "FATAL"
+                error(f"{name}: exited too quickly ({describe_exit(returncode)}), gave up after {START_RETRIES} retries")
+            else:
+                delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_INITIAL * 2 ** max(proc.failures - 1, 0))
+                proc.state = "BACKOFF"
+                warn(f"{name}: exited ({describe_exit(returncode)}), restarting in {delay:g} seconds")
+                proc.timer = self.loop.call_later(delay, self._spawn, proc)
+        self._write_status()
+        self._check_done()
+
+    def _check_done(self):
+        if any(proc.state in ACTIVE_STATES or proc.state == "BACKOFF" for proc in self.processes.values()):
+            return
+        if not self.stopping:
+            error("All services have failed")
+            self.exit_code = 1
+        self.done.set()
+
+    def _signal(self, proc, signum):
+        if proc.popen is not None:
+            try:
+                proc.popen.send_signal(signum)
+            except ProcessLookupError:
+                pass
+
+    def _stop(self, proc):
+        proc.cancel_timer()
+        proc.state = "STOPPING"
+        self._signal(proc, signal.SIGTERM)
+        proc.timer = self.loop.call_later(proc.spec.stop_timeout, self._kill, proc)
+        self._write_status()
+
+    def _kill(self, proc):
+        proc.timer = None
+        if proc.popen is not None:
+            warn(f"{proc.spec.name}: still running, killing")
+            try:
+                # the whole session, so that no processes of the service are left behind
+                os.killpg(proc.popen.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def _restart(self, proc):
+        if proc.popen is None:
+            proc.cancel_timer()
+            proc.failures = 0
+            self._spawn(proc)
+        else:
+            proc.restart = True
+            self._stop(proc)
+
+    def shutdown(self):
+        """Stop all services, killing those still running if called again while they are stopping"""
+        if self.stopping:
+            for proc in self.processes.values():
+                self._kill(proc)
+            return
+        info("Stopping services")
+        self.stopping = True
+        for proc in self.processes.values():
+            if proc.popen is not None:
+                self._stop(proc)
+            else:
+                proc.cancel_timer()
+                if proc.state != "FATAL":
+                    proc.state = "STOPPED"
+        self._write_status()
+        self._check_done()
+
+    def forward(self, signum):
+        for proc in self.processes.values():
+            self._signal(proc, signum)
+
+    def graceful(self):
+        """Reload or restart services according to their graceful method, starting any new or failed services and
+        stopping those that have been removed
+        """
+        if self.stopping:
+            return
+        info("Gracefully reloading services")
+        if self.reload_specs:
+            self.update_specs(self.reload_specs())
+        rolling = []
+        for proc in list(self.processes.values()):
+            graceful_method = proc.spec.service.graceful_method
+            if proc.removed:
+                continue
+            elif proc.popen is None:
+                self._restart(proc)
+            elif graceful_method == GracefulMethod.SIGHUP:
+                self._signal(proc, signal.SIGHUP)
+            elif graceful_method == GracefulMethod.ROLLING:
+                rolling.append(proc)
+            else:
+                self._restart(proc)
+        if rolling:
+            if self.rolling_task is not None and not self.rolling_task.done():
+                warn("A rolling restart is already in progress")
+            else:
+                self.rolling_task = self.loop.create_task(self._rolling_restart(rolling))
+
+    def restart(self):
+        """Stop and start all services again, starting any new or failed services and stopping those that have been
+        removed
+        """
+        if self.stopping:
+            return
+        info("Restarting services")
+        if self.reload_specs:
+            self.update_specs(self.reload_specs())
+        for proc in list(self.processes.values()):
+            if not proc.removed:
+                self._restart(proc)
+
+    def update_specs(self, specs):
+        """Replace the specs of services with ``specs``, which take effect when they are next started"""
+        names = set()
+        for spec in specs:
+            names.add(spec.name)
+            if spec.name in self.processes:
+                self.processes[spec.name].spec = spec
+            else:
+                info(f"{spec.name}: added")
+                self.processes[spec.name] = _Process(spec)
+        for name, proc in list(self.processes.items()):
+            if name not in names:
+                proc.removed = True
+                if proc.popen is not None:
+                    self._stop(proc)
+                else:
+                    proc.cancel_timer()
+                    del self.processes[name]
+        self.__update_width()
+
+    async def _rolling_restart(self, procs):
+        batches = self.rolling_batches([(proc.spec.name, proc.spec.instance_name, proc.spec.service) for proc in procs])
+        for i, batch in enumerate(batches):
+            info(f"Restarting batch {i + 1} of {len(batches)}: {', '.join(batch)}")
+            for name in batch:
+                self._restart(self.processes[name])
+            while True:
+                await asyncio.sleep(ROLLING_POLL_INTERVAL)
+                procs = [self.processes.get(name) for name in batch]
+                if self.stopping or None in procs:
+                    return
+                failed = [proc.spec.name for proc in procs if proc.state in ("BACKOFF", "FATAL")]
+                if failed:
+                    remaining = [name for later_batch in batches[i + 1:] for name in later_batch]
+                    error(
+                        f"Rolling restart failed: {', '.join(failed)}"
+                        + (f", not restarted: {', '.join(remaining)}" if remaining else "")
+                    )
+                    return
+                if all(proc.state == "RUNNING" for proc in procs):
+                    break
+
+    def _write_status(self, running=True):
+        if not self.status_file:
+            return
+        status = {
+            "pid": os.getpid() if running else None,
+            "services": [
+                {
+                    "name": proc.spec.name,
+                    "group": proc.spec.instance_name,
+                    "state": proc.state,
+                    "pid": proc.popen.pid if proc.popen else None,
+                    "start_time": proc.started_at,
+                    "exit_status": proc.exit_status,
+                }
+                for proc in self.processes.values()
+            ],
+        }
+        tmp_file = f"{self.status_file}.tmp"
+        with open(tmp_file, "w") as fh:
+            json.dump(status, fh)
+        os.replace(tmp_file, self.status_file)
+
+
+class AsyncioProcessManager(BaseProcessManager):
+    def __init__(
+        self, state_dir=None, start_daemon=True, foreground=False, state_backend=None, parallel=1, batch_size=None, health_timeout=None,
+        wave_size=None,
+    ):
+        # all services are started at once in the foreground, so wave_size does not apply
+        super(AsyncioProcessManager, self).__init__(
+            state_dir=state_dir, state_backend=state_backend, parallel=parallel, batch_size=batch_size, health_timeout=health_timeout,
+        )
+        self.asyncio_state_dir = join(self.state_dir, "asyncio")
+        self.status_file = join(self.asyncio_state_dir, "status.json")
+        if not exists(self.asyncio_state_dir):
+            os.makedirs(self.asyncio_state_dir)
+
+    def _service_program_name(self, instance_name, service):
+        if self.config_manager.single_instance:
+            return service["service_name"]
+        return f"{instance_name}_{service['config_type']}_{service['service_type']}_{service['service_name']}"
+
+    def __service_spec(self, config_file, attribs, service, instance_name):
+        program_name = self._service_program_name(instance_name, service)
+        format_vars = self._service_format_vars(config_file, attribs, service, program_name, self.asyncio_state_dir)
+        wrappers = resource_control_wrappers(service.resources(attribs))
+        for wrapper in wrappers:
+            if not which(wrapper[0]):
+                warn(f"Resource controls of service {program_name} require `{wrapper[0]}`, which is not on $PATH")
+        env = dict(os.environ)
+        env.update(self._service_environment(config_file, attribs, service))
+        return ServiceSpec(
+            name=program_name,
+            instance_name=instance_name,
+            service=service,
+            args=[arg for wrapper in wrappers for arg in wrapper] + shlex.split(format_vars["command"]),
+            cwd=format_vars["galaxy_root"],
+            env=env,
+            umask=format_vars["galaxy_umask"] if service["service_type"] != "standalone" else None,
+            stop_timeout=SERVICE_STOP_TIMEOUTS.get(service["service_type"], DEFAULT_STOP_TIMEOUT),
+        )
+
+    def service_specs(self, instance_names=None):
+        """Return the specs of the services of ``instance_names``, which may also name individual services"""
+        instance_names, service_names, _ = self.get_instance_names(instance_names)
+        specs = []
+        for config_file, config in self.config_manager.get_registered_configs().items():
+            for service in config["services"]:
+                spec = self.__service_spec(config_file, config["attribs"], service, config["instance_name"])
+                if config["instance_name"] in instance_names or spec.name in service_names:
+                    specs.append(spec)
+        unknown = set(service_names) - {spec.name for spec in specs}
+        if unknown:
+            exception(f"Invalid service(s): {', '.join(sorted(unknown))}")
+        return specs
+
+    def __runner_pid(self):
+        """Return the pid of the running foreground Gravity process, or ``None`` if it is not running"""
+        try:
+            with open(self.status_file) as fh:
+                pid = json.load(fh)["pid"]
+        except (OSError, ValueError, KeyError):
+            return None
+        if pid is None:
+            return None
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return pid
+
+    def __signal_runner(self, instance_names, signum, action):
+        if instance_names:
+            exception(f"The asyncio process manager can only {action} all services")
+        pid = self.__runner_pid()
+        if pid is None:
+            exception("Gravity is not running in the foreground")
+        os.kill(pid, signum)
+        return pid
+
+    def run_foreground(self, instance_names, quiet=False):
+        self.update()
+        if self.__runner_pid():
+            exception("Gravity is already running in the foreground")
+        specs = self.service_specs(instance_names)
+        if not specs:
+            exception("No services to run")
+        runner = ServiceRunner(
+            specs,
+            output=None if quiet else click.echo,
+            status_file=self.status_file,
+            reload_specs=lambda: self.service_specs(instance_names),
+            rolling_batches=self._rolling_batches,
+        )
+        info(f"Starting {len(specs)} service(s): {', '.join(spec.name for spec in specs)}")
+        loop = asyncio.new_event_loop()
+        try:
+            exit_code = loop.run_until_complete(runner.run())
+        finally:
+            loop.close()
+        if exit_code:
+            raise click.exceptions.Exit(exit_code)
+
+    def start(self, instance_names):
+        exception("The asyncio process manager only runs services in the foreground (use `galaxy` or `galaxyctl start --foreground`)")
+
+    def stop(self, instance_names):
+        self.__signal_runner(instance_names, signal.SIGTERM, "stop")
+
+    def restart(self, instance_names):
+        self.update()
+        self.__signal_runner(instance_names, RESTART_SIGNAL, "restart")
+        info("Restarting services")
+
+    def reload(self, instance_names):
+        self.graceful(instance_names)
+
+    def graceful(self, instance_names):
+        self.update()
+        self.__signal_runner(instance_names, signal.SIGHUP, "reload")
+        info("Gracefully reloading services")
+
+    def shutdown(self):
+        pid = self.__runner_pid()
+        if pid is None:
+            warn("Gravity is not running in the foreground")
+            return
+        os.kill(pid, signal.SIGTERM)
+        if not wait_for(lambda: self.__runner_pid() is None, SHUTDOWN_TIMEOUT):
+            exception(f"Timed out after {SHUTDOWN_TIMEOUT} seconds waiting for Gravity to terminate")
+        click.echo("Shut down")
+
+    def process_status(self):
+        """Return the state, resource usage and health of each service, as the supervisor process manager's
+        ``process_status`` does for its processes.
+        """
+        if self.__runner_pid() is None:
+            return []
+        with open(self.status_file) as fh:
+            services = json.load(fh)["services"]
+        usage = process_tree_usage([service["pid"] for service in services if service["pid"]])
+        probes = {
+            self._service_program_name(instance_name, service): probe
+            for instance_name, service, probe in self._health_probes()
+        }
+        now = time.time()
+        statuses = []
+        for service in services:
+            pid = service["pid"]
+            name = service["name"]
+            uptime = now - service["start_time"] if pid else None
+            if pid:
+                description = f"pid {pid}, uptime {timedelta(seconds=int(uptime))}"
+            elif service["start_time"] is None:
+                description = "Not started"
+            else:
+                description = describe_exit(service["exit_status"])
+            health = None
+            if pid and name in probes:
+                healthy, detail = probes[name].check()
+                health = {"probe": str(probes[name]), "healthy": healthy, "detail": detail}
+            status = {
+                "name": name,
+                "group": service["group"],
+                "state": service["state"],
+                "description": description,
+                "pid": pid,
+                "uptime": uptime,
+                "exit_status": None if pid else service["exit_status"],
+                "rss": None,
+                "pss": None,
+                "cpu_time": None,
+                "threads": None,
+                "processes": None,
+                "health": health,
+            }
+            status.update(usage.get(pid, {}))
+            statuses.append(status)
+        return statuses
+
+    def status(self, json_output=False):
+        if self.__runner_pid() is None:
+            warn("Gravity is not running in the foreground")
+            if json_output:
+                click.echo("[]")
+            return
+        self._output_status(self.process_status(), json_output=json_output)
+
+    def follow(self, instance_names, quiet=False, grep=None, since=None, rate=None):
+        exception("The asyncio process manager writes service output to the terminal of the foreground Gravity process")
+
+    def logs(self, instance_names, grep=None, since=None, until=None, lines=None):
+        exception("The asyncio process manager writes service output to the terminal of the foreground Gravity process")
+
+    def terminate(self):
+        pass
+
+    def _process_config_changes(self, configs, meta_changes, force=False):
+        self.config_manager.register_config_changes(configs, meta_changes)
+
+    def update(self, force=False):
+        """Register config changes, which take effect when the services are next started or gracefully reloaded"""
+        with self.config_manager.transaction():
+            configs, meta_changes = self.config_manager.determine_config_changes()
+            self._process_config_changes(configs, meta_changes, force)
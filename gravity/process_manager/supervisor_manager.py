@@ -2,20 +2,41 @@
 """
 import errno
 import os
+import random
+import re
+import select
 import shutil
+import socket
 import subprocess
 import sys
+import threading
 import time
+import xmlrpc.client as xmlrpclib
+from concurrent.futures import as_completed, ThreadPoolExecutor
 from os.path import exists, join
 
+import click
+
 from gravity.io import debug, error, exception, info, warn
-from gravity.process_manager import BaseProcessManager
+from gravity.process_manager import BaseProcessManager, resource_control_wrappers
 from gravity.state import GracefulMethod
-from gravity.util import which
+from gravity.util import wait_for, which, write_if_changed
+from gravity.util.procfs import process_tree_usage
 
-from supervisor import supervisorctl  # type: ignore
+from supervisor import xmlrpc  # type: ignore
+from supervisor.options import make_namespec, split_namespec  # type: ignore
 
 DEFAULT_SUPERVISOR_SOCKET_PATH = os.environ.get("SUPERVISORD_SOCKET", '%(here)s/supervisor.sock')
+# seconds to wait for supervisord to start or shut down
+DEFAULT_SUPERVISORD_TIMEOUT = float(os.environ.get("GRAVITY_SUPERVISORD_TIMEOUT", 60))
+# seconds to wait for each batch of a rolling restart to stop, and then to be running, longer than the stopwaitsecs and
+# startsecs of any service
+ROLLING_RESTART_TIMEOUT = 120
+# seconds to wait for each wave of a startup to be running, if not waiting for health checks
+STARTUP_WAVE_TIMEOUT = 120
+# maximum seconds by which the start of each service in a wave is randomly delayed, so that they don't all hit the database
+# and filesystem at the same moment
+STARTUP_JITTER = 1.0
 # Works around https://github.com/galaxyproject/galaxy/issues/11821
 OSX_DISABLE_FORK_SAFETY = ",OBJC_DISABLE_INITIALIZE_FORK_SAFETY=YES" if sys.platform == 'darwin' else ""
 
@@ -181,10 +202,74 @@ SUPERVISORD_GROUP_TEMPLATE = """;
 programs = {programs}
 """
 
+# result messages for RPC results, as output by supervisorctl
+RPC_SUCCESS_MESSAGES = {
+    "start": "started",
+    "stop": "stopped",
+    "signal": "signalled",
+}
+RPC_ERROR_MESSAGES = {
+    xmlrpc.Faults.BAD_NAME: "no such process",
+    xmlrpc.Faults.BAD_SIGNAL: "bad signal name",
+    xmlrpc.Faults.NO_FILE: "no such file",
+    xmlrpc.Faults.NOT_EXECUTABLE: "file is not executable",
+    xmlrpc.Faults.ALREADY_STARTED: "already started",
+    xmlrpc.Faults.NOT_RUNNING: "not running",
+    xmlrpc.Faults.SPAWN_ERROR: "spawn error",
+    xmlrpc.Faults.ABNORMAL_TERMINATION: "abnormal termination",
+    xmlrpc.Faults.STILL_RUNNING: "process group still running",
+    xmlrpc.Faults.ALREADY_ADDED: "process group already active",
+}
+# faults that do not cause an operation to be considered failed, as with supervisorctl
+RPC_IGNORED_FAULTS = {
+    "start": xmlrpc.Faults.ALREADY_STARTED,
+    "stop": xmlrpc.Faults.NOT_RUNNING,
+}
+
+
+class SupervisorRPCClient(object):
+    """Client for supervisord's XML-RPC interface.
+
+    A single connection is held open for the lifetime of the client, and :meth:`multicall` makes any number of calls in
+    one ``system.multicall`` round trip.
+    """
+
+    def __init__(self, serverurl):
+        self.transport = xmlrpc.SupervisorTransport(serverurl=serverurl)
+        # the host is not used by SupervisorTransport but ServerProxy requires an http(s) URL
+        self.proxy = xmlrpclib.ServerProxy("http://127.0.0.1", transport=self.transport)
+
+    @property
+    def supervisor(self):
+        return self.proxy.supervisor
+
+    def multicall(self, calls):
+        """Make ``calls``, a list of ``(method_name, params)`` tuples for methods in the ``supervisor`` namespace, in order.
+
+        supervisord runs the calls sequentially, waiting for each to complete before starting the next. Returns the list of
+        results, in which a failed call's result is an :class:`xmlrpc.client.Fault` rather than raising.
+        """
+        if not calls:
+            return []
+        results = self.proxy.system.multicall([{"methodName": f"supervisor.{name}", "params": list(params)} for name, params in calls])
+        return [
+            xmlrpclib.Fault(result["faultCode"], result["faultString"]) if isinstance(result, dict) and "faultCode" in result else result
+            for result in results
+        ]
+
+    def close(self):
+        self.transport.close()
+
 
 class SupervisorProcessManager(BaseProcessManager):
-    def __init__(self, state_dir=None, start_daemon=True, foreground=False):
-        super(SupervisorProcessManager, self).__init__(state_dir=state_dir)
+    def __init__(
+        self, state_dir=None, start_daemon=True, foreground=False, state_backend=None, parallel=1, batch_size=None, health_timeout=None,
+        wave_size=None,
+    ):
+        super(SupervisorProcessManager, self).__init__(
+            state_dir=state_dir, state_backend=state_backend, parallel=parallel, batch_size=batch_size, health_timeout=health_timeout,
+            wave_size=wave_size,
+        )
         self.supervisord_exe = which("supervisord")
         self.supervisor_state_dir = join(self.state_dir, "supervisor")
         self.supervisord_conf_path = join(self.supervisor_state_dir, "supervisord.conf")
@@ -192,7 +277,11 @@ class SupervisorProcessManager(BaseProcessManager):
         self.supervisord_pid_path = join(self.supervisor_state_dir, "supervisord.pid")
         self.supervisord_sock_path = os.environ.get("SUPERVISORD_SOCKET", join(self.supervisor_state_dir, "supervisor.sock"))
         self.__supervisord_popen = None
+        self.__rpc_client = None
+        # numbers of program and group configs written and skipped (as unchanged) by the current update
+        self.__conf_writes = {"written": 0, "skipped": 0}
         self.foreground = foreground
+        self.supervisord_timeout = DEFAULT_SUPERVISORD_TIMEOUT
 
         if not exists(self.supervisord_conf_dir):
             os.makedirs(self.supervisord_conf_dir)
@@ -217,6 +306,48 @@ class SupervisorProcessManager(BaseProcessManager):
         except Exception:
             return False
 
+    def __supervisord_is_ready(self):
+        """Check whether supervisord has started, failing if it exited before doing so"""
+        rc = self.__supervisord_popen.poll()
+        # unless running in the foreground, the process exits successfully once supervisord has daemonized
+        if rc is not None and (rc != 0 or self.foreground):
+            exception(f"supervisord exited with code {rc}, check {self.log_file} for details")
+        if not exists(self.supervisord_pid_path):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # a stale socket left by a supervisord that did not exit cleanly refuses connections
+            sock.connect(self.supervisord_sock_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def __wait_for_exit(self, pid):
+        """Wait for the process ``pid``, which need not be a child, to exit"""
+        try:
+            # a pidfd becomes readable when the process exits
+            pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            pidfd = None
+        if pidfd is None:
+            return wait_for(lambda: not self.__pid_exists(pid), self.supervisord_timeout)
+        try:
+            return bool(select.select([pidfd], [], [], self.supervisord_timeout)[0])
+        finally:
+            os.close(pidfd)
+
+    @staticmethod
+    def __pid_exists(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
     def __supervisord(self):
         format_vars = {"supervisor_state_dir": self.supervisor_state_dir, "supervisord_conf_dir": self.supervisord_conf_dir}
         supervisord_cmd = [self.supervisord_exe, "-c", self.supervisord_conf_path]
@@ -224,26 +355,33 @@ class SupervisorProcessManager(BaseProcessManager):
             supervisord_cmd.append('--nodaemon')
         if not self.__supervisord_is_running():
             # any time that supervisord is not running, let's rewrite supervisord.conf
-            open(self.supervisord_conf_path, "w").write(SUPERVISORD_CONF_TEMPLATE.format(**format_vars))
+            write_if_changed(self.supervisord_conf_path, SUPERVISORD_CONF_TEMPLATE.format(**format_vars))
             self.__supervisord_popen = subprocess.Popen(supervisord_cmd, env=os.environ)
-            rc = self.__supervisord_popen.poll()
-            if rc:
-                error("supervisord exited with code %d" % rc)
-            # FIXME: don't wait forever
-            while not exists(self.supervisord_pid_path) or not exists(self.supervisord_sock_path):
-                debug(f"Waiting for {self.supervisord_pid_path}")
-                time.sleep(0.5)
+            debug(f"Waiting for supervisord to accept connections on {self.supervisord_sock_path}")
+            if not wait_for(self.__supervisord_is_ready, self.supervisord_timeout):
+                exception(f"Timed out after {self.supervisord_timeout:g} seconds waiting for supervisord to start, check {self.log_file} for details")
+
+    @property
+    def rpc(self):
+        """The :class:`SupervisorRPCClient`, whose connection is reused for the lifetime of the process manager"""
+        if self.__rpc_client is None:
+            self.__rpc_client = self.__new_rpc_client()
+        return self.__rpc_client
+
+    def __new_rpc_client(self):
+        return SupervisorRPCClient(f"unix://{self.supervisord_sock_path}")
 
     def __get_supervisor(self):
-        """Return the supervisor proxy object
+        """Return the supervisor proxy object"""
+        return self.rpc.supervisor
 
-        Should probably use this more rather than supervisorctl directly
-        """
-        options = supervisorctl.ClientOptions()
-        options.realize(args=["-c", self.supervisord_conf_path])
-        return supervisorctl.Controller(options).get_supervisor()
+    def __close_rpc(self):
+        if self.__rpc_client is not None:
+            self.__rpc_client.close()
+            self.__rpc_client = None
 
     def terminate(self):
+        self.__close_rpc()
         if self.foreground:
             # if running in foreground, if terminate is called, then supervisord should've already received a SIGINT
             self.__supervisord_popen and self.__supervisord_popen.wait()
@@ -254,48 +392,41 @@ class SupervisorProcessManager(BaseProcessManager):
         else:
             return service["service_name"]
 
-    def __update_service(self, config_file, config, attribs, service, instance_conf_dir, instance_name):
+    def _service_group_name(self, instance_name, service, use_group=None):
+        # each instance is a group, unless only one instance is registered, in which case each of its programs is a group
+        # of its own, named after the program
+        if self.use_group if use_group is None else use_group:
+            return instance_name
+        else:
+            return service["service_name"]
+
+    def _service_namespec(self, instance_name, service):
+        # the name by which supervisord knows the service's process, programs in a group are named by their process_name
+        return make_namespec(self._service_group_name(instance_name, service), service["service_name"])
+
+    def __write_conf(self, conf, contents, force=False):
+        """Write ``contents`` to the supervisor config ``conf`` if they have changed (or ``force`` is set)"""
+        if write_if_changed(conf, contents, force=force):
+            self.__conf_writes["written"] += 1
+        else:
+            debug(f"Supervisor config unchanged: {conf}")
+            self.__conf_writes["skipped"] += 1
+
+    def __update_service(self, config_file, config, attribs, service, instance_conf_dir, instance_name, force=False):
         if self.use_group:
             process_name_opt = f"process_name    = {service['service_name']}"
         else:
             process_name_opt = ""
 
         program_name = self._service_program_name(instance_name, service)
-
-        # used by the "standalone" service type
-        attach_to_pool_opt = ""
-        server_pools = service.get("server_pools")
-        if server_pools:
-            _attach_to_pool_opt = " ".join(f"--attach-to-pool={server_pool}" for server_pool in server_pools)
-            # Insert a single leading space
-            attach_to_pool_opt = f" {_attach_to_pool_opt}"
-
-        virtualenv_dir = attribs.get("virtualenv")
-        virtualenv_bin = f'{os.path.join(virtualenv_dir, "bin")}{os.path.sep}' if virtualenv_dir else ""
-        gunicorn_options = attribs["gunicorn"].copy()
-        gunicorn_options["preload"] = "--preload" if gunicorn_options["preload"] else ""
-
-        format_vars = {
-            "log_dir": attribs["log_dir"],
-            "log_file": self._service_log_file(attribs["log_dir"], program_name),
-            "config_type": service["config_type"],
-            "server_name": service["service_name"],
-            "attach_to_pool_opt": attach_to_pool_opt,
-            "gunicorn": gunicorn_options,
-            "celery": attribs["celery"],
-            "galaxy_infrastructure_url": attribs["galaxy_infrastructure_url"],
-            "tusd": attribs["tusd"],
-            "gx_it_proxy": attribs["gx_it_proxy"],
-            "galaxy_umask": service.get("umask", "022"),
-            "program_name": program_name,
-            "process_name_opt": process_name_opt,
-            "galaxy_conf": config_file,
-            "galaxy_root": attribs["galaxy_root"],
-            "virtualenv_bin": virtualenv_bin,
-            "supervisor_state_dir": self.supervisor_state_dir,
-            "state_dir": self.state_dir,
-        }
-        format_vars["command"] = service.command_template.format(**format_vars)
+        format_vars = self._service_format_vars(config_file, attribs, service, program_name, self.supervisor_state_dir)
+        format_vars["process_name_opt"] = process_name_opt
+        wrappers = resource_control_wrappers(service.resources(attribs))
+        for wrapper in wrappers:
+            if not which(wrapper[0]):
+                warn(f"Resource controls of service {program_name} require '{wrapper[0]}', which was not found on $PATH")
+        if wrappers:
+            format_vars["command"] = " ".join(" ".join(wrapper) for wrapper in wrappers) + " " + format_vars["command"]
         conf = join(instance_conf_dir, f"{service['config_type']}_{service['service_type']}_{service['service_name']}.conf")
 
         if not exists(attribs["log_dir"]):
@@ -305,10 +436,10 @@ class SupervisorProcessManager(BaseProcessManager):
         if not template:
             raise Exception(f"Unknown service type: {service['service_type']}")
 
-        with open(conf, "w") as out:
-            out.write(template.format(**format_vars))
+        self.__write_conf(conf, template.format(**format_vars), force=force)
 
     def _process_config_changes(self, configs, meta_changes, force=False):
+        self.__conf_writes = {"written": 0, "skipped": 0}
         # remove the services of any configs which have been removed
         for config in meta_changes["remove_configs"].values():
             instance_name = config["instance_name"]
@@ -323,7 +454,7 @@ class SupervisorProcessManager(BaseProcessManager):
         for config_file, config in configs.items():
             instance_name = config["instance_name"]
             attribs = config["attribs"]
-            update_all_configs = False or force
+            update_all_configs = force or instance_name in meta_changes.get("regroup_instances", ())
 
             # config attribs have changed (galaxy_root, virtualenv, etc.)
             if "update_attribs" in config:
@@ -348,7 +479,7 @@ class SupervisorProcessManager(BaseProcessManager):
             if update_all_configs:
                 for service in config["services"]:
                     info("Updating service %s", self._service_program_name(instance_name, service))
-                    self.__update_service(config_file, config, attribs, service, instance_conf_dir, instance_name)
+                    self.__update_service(config_file, config, attribs, service, instance_conf_dir, instance_name, force=force)
 
             # new services
             if "update_services" in config:
@@ -365,9 +496,10 @@ class SupervisorProcessManager(BaseProcessManager):
                         os.unlink(conf)
 
             # sanity check, make sure everything that should exist does exist
+            remove_identities = {service.identity for service in config.get("remove_services", [])}
             for service in config["services"]:
                 conf = join(instance_conf_dir, f"{service['config_type']}_{service['service_type']}_{service['service_name']}.conf")
-                if service not in config.get("remove_services", []) and not exists(conf):
+                if service.identity not in remove_identities and not exists(conf):
                     self.__update_service(config_file, config, attribs, service, instance_conf_dir, instance_name)
                     warn(f"Missing service config recreated: {conf}")
 
@@ -386,32 +518,194 @@ class SupervisorProcessManager(BaseProcessManager):
         self.config_manager.register_config_changes(configs, meta_changes)
 
         # now we can create/update the instance group
+        instance_programs = {}
+        for service in self.config_manager.get_registered_services():
+            if service["instance_name"] in meta_changes["changed_instances"] and service["service_type"] != "uwsgi":
+                instance_name = service["instance_name"]
+                program_name = f"{instance_name}_{service['config_type']}_{service['service_type']}_{service['service_name']}"
+                instance_programs.setdefault(instance_name, []).append(program_name)
         for instance_name in meta_changes["changed_instances"]:
-            programs = []
-            for service in self.config_manager.get_registered_services():
-                if service["instance_name"] == instance_name and service["service_type"] != "uwsgi":
-                    programs.append(f"{instance_name}_{service['config_type']}_{service['service_type']}_{service['service_name']}")
+            programs = instance_programs.get(instance_name, [])
             conf = join(self.supervisord_conf_dir, f"group_{instance_name}.conf")
             if programs and self.use_group:
                 format_vars = {"instance_conf_dir": instance_conf_dir, "instance_name": instance_name, "programs": ",".join(programs)}
-                open(conf, "w").write(SUPERVISORD_GROUP_TEMPLATE.format(**format_vars))
+                self.__write_conf(conf, SUPERVISORD_GROUP_TEMPLATE.format(**format_vars), force=force)
             else:
                 # no programs for the group, so it should be removed
                 if exists(conf):
                     os.unlink(conf)
+        if self.__conf_writes["written"] or self.__conf_writes["skipped"]:
+            info(f"Supervisor configs: {self.__conf_writes['written']} written, {self.__conf_writes['skipped']} unchanged")
+
+    @staticmethod
+    def __op_calls(op, namespec):
+        """Return the RPC calls that perform ``op`` on ``namespec``, which is interpreted as by supervisorctl"""
+        if op == "restart":
+            return SupervisorProcessManager.__op_calls("stop", namespec) + SupervisorProcessManager.__op_calls("start", namespec)
+        if namespec == "all":
+            return [(f"{op}AllProcesses", ())]
+        group_name, process_name = split_namespec(namespec)
+        if process_name is None:
+            return [(f"{op}ProcessGroup", (group_name,))]
+        return [(f"{op}Process", (namespec,))]
+
+    @staticmethod
+    def __format_result(op, namespec, status, description, group=False):
+        if status == xmlrpc.Faults.SUCCESS:
+            return f"{namespec}: {RPC_SUCCESS_MESSAGES[op]}"
+        elif status == xmlrpc.Faults.BAD_NAME and group:
+            return f"{namespec}: ERROR (no such group)"
+        return f"{namespec}: ERROR ({RPC_ERROR_MESSAGES.get(status, description)})"
+
+    def __output_results(self, calls, results, failed):
+        """Output the results of ``calls``, adding the namespecs of those that failed to ``failed``"""
+        for (method, params), result in zip(calls, results):
+            op = re.match("[a-z]+", method).group()
+            namespec = params[0] if params else "all"
+            if isinstance(result, xmlrpclib.Fault):
+                results = [(namespec, result.faultCode, result.faultString)]
+            elif isinstance(result, list):
+                # a result for each process in a group
+                results = [(make_namespec(r["group"], r["name"]), r["status"], r["description"]) for r in result]
+            else:
+                results = [(namespec, xmlrpc.Faults.SUCCESS, "OK")]
+            for name, status, description in results:
+                click.echo(self.__format_result(op, name, status, description, group=method.endswith("ProcessGroup")))
+                if status not in (xmlrpc.Faults.SUCCESS, RPC_IGNORED_FAULTS.get(op)):
+                    failed.append(name)
+
+    def __run_tasks(self, tasks):
+        """Run ``tasks``, each a list of RPC calls operating on one instance or service, and output their results.
+
+        With a parallelism of 1 all of the calls are made in a single round trip. Otherwise, up to ``self.parallel`` tasks
+        are run at once, each worker holding its own connection, and the results of each task are output as it completes.
+        The calls of every task are made even if others fail, and an exception listing all of the failures is raised once
+        they have all completed.
+        """
+        if not self.__supervisord_is_running():
+            warn("supervisord is not running")
+            return
+        failed = []
+        if self.parallel == 1:
+            calls = [call for task in tasks for call in task]
+            self.__output_results(calls, self.rpc.multicall(calls), failed)
+        else:
+            local = threading.local()
+            clients = []
+
+            def run_task(task):
+                if not hasattr(local, "client"):
+                    local.client = self.__new_rpc_client()
+                    clients.append(local.client)
+                return local.client.multicall(task)
+
+            try:
+                with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+                    futures = {executor.submit(run_task, task): task for task in tasks}
+                    for future in as_completed(futures):
+                        task = futures[future]
+                        try:
+                            results = future.result()
+                        except Exception as exc:
+                            namespecs = list(dict.fromkeys(params[0] if params else "all" for method, params in task))
+                            error(f"{', '.join(namespecs)}: ERROR ({exc})")
+                            failed.extend(namespecs)
+                        else:
+                            self.__output_results(task, results, failed)
+            finally:
+                for client in clients:
+                    client.close()
+        if failed:
+            exception(f"Failed to control service(s): {', '.join(dict.fromkeys(failed))}")
 
     def __start_stop(self, op, instance_names):
         self.update()
         instance_names, service_names, registered_instance_names = self.get_instance_names(instance_names)
-        for instance_name in instance_names:
+        # instances are started in waves, unless running in the foreground, where logs are followed as soon as possible
+        waves = op in ("start", "restart") and not self.foreground
+        instance_op = {"start": None, "restart": "stop"}[op] if waves else op
+        tasks = []
+        for instance_name in instance_names if instance_op else ():
             target = f"{instance_name}:*" if self.use_group else "all"
-            self.supervisorctl(op, target)
+            tasks.append(self.__op_calls(instance_op, target))
             for service in self.config_manager.get_instance_services(instance_name):
                 if service["service_type"] == "uwsgi":
-                    self.supervisorctl(op, f"{instance_name}_{service['config_type']}_{service['service_name']}")
+                    tasks.append(self.__op_calls(instance_op, f"{instance_name}_{service['config_type']}_{service['service_name']}"))
         # shortcut for just passing service names directly
         for name in service_names:
-            self.supervisorctl(op, name)
+            tasks.append(self.__op_calls(op, name))
+        self.__run_tasks(tasks)
+        if waves and instance_names:
+            self.__start_waves(instance_names)
+        return instance_names, service_names
+
+    def __start_waves(self, instance_names):
+        """Start the services of ``instance_names`` in dependency-ordered waves, waiting for each wave to be ready before
+        starting the next.
+
+        The services in a wave are started at once, each after a random delay of up to ``STARTUP_JITTER`` seconds. A wave
+        is ready when its services have passed their health checks (if waiting for health checks) or else are RUNNING.
+        """
+        if not self.__supervisord_is_running():
+            warn("supervisord is not running")
+            return
+        instance_services = [
+            (self._service_namespec(instance_name, service), instance_name, service)
+            for instance_name in instance_names
+            for service in self.config_manager.get_instance_services(instance_name)
+        ]
+        waves = self._startup_waves(instance_services)
+        probes = self.__health_probes(instance_names) if self.health_timeout else {}
+        # as with startProcessGroup, processes that are already running (e.g. autostarted by supervisord when it was started
+        # or their group was added) are not started again, but are still waited for with the rest of their wave
+        running = {
+            make_namespec(proc_info["group"], proc_info["name"])
+            for proc_info in self.__get_supervisor().getAllProcessInfo()
+            if proc_info["statename"] in ("STARTING", "RUNNING", "BACKOFF")
+        }
+        start = time.monotonic()
+        for i, wave in enumerate(waves):
+            wave_start = time.monotonic()
+            calls = []
+            results = []
+            stopped = [namespec for namespec in wave if namespec not in running]
+            offsets = sorted((random.uniform(0, STARTUP_JITTER) if len(stopped) > 1 else 0, namespec) for namespec in stopped)
+            for offset, namespec in offsets:
+                time.sleep(max(0, wave_start + offset - time.monotonic()))
+                calls.append(("startProcess", (namespec, False)))
+                results.extend(self.rpc.multicall(calls[-1:]))
+            failed = []
+            self.__output_results(calls, results, failed)
+            if not failed:
+                failed.extend(self.__wait_for_ready(wave, probes))
+            if failed:
+                remaining = [namespec for later_wave in waves[i + 1:] for namespec in later_wave]
+                exception(f"Startup failed: {', '.join(failed)}" + (f", not started: {', '.join(remaining)}" if remaining else ""))
+            info(f"Wave {i + 1} of {len(waves)} ready in {time.monotonic() - wave_start:.1f}s: {', '.join(wave)}")
+        info(f"Started {len(instance_services)} service(s) in {len(waves)} wave(s) in {time.monotonic() - start:.1f}s")
+
+    def __wait_for_ready(self, namespecs, probes):
+        """Wait for the processes ``namespecs`` to pass their health check in ``probes``, or for those without one to be
+        RUNNING, stopping early if any stop. Returns a list of errors, which is empty if the processes were ready in time.
+        """
+        pending = list(namespecs)
+        errors = []
+
+        def ready():
+            proc_infos = self.rpc.multicall([("getProcessInfo", (namespec,)) for namespec in pending])
+            for namespec, proc_info in zip(list(pending), proc_infos):
+                if isinstance(proc_info, xmlrpclib.Fault):
+                    errors.append(f"{namespec}: ERROR ({RPC_ERROR_MESSAGES.get(proc_info.faultCode, proc_info.faultString)})")
+                elif proc_info["statename"] in ("STOPPED", "EXITED", "FATAL"):
+                    errors.append(f"{namespec}: ERROR ({proc_info['statename']}, {proc_info['description']})")
+                elif (probes[namespec].check()[0] if namespec in probes else proc_info["statename"] == "RUNNING"):
+                    pending.remove(namespec)
+            return errors or not pending
+
+        timeout = self.health_timeout or STARTUP_WAVE_TIMEOUT
+        if not wait_for(ready, timeout, initial_delay=0.05, max_delay=1):
+            errors.append(f"timed out after {timeout} seconds waiting for {', '.join(pending)} to be ready")
+        return errors
 
     def __reload_graceful(self, op, instance_names):
         self.update()
@@ -420,6 +714,8 @@ class SupervisorProcessManager(BaseProcessManager):
             instance_names = registered_instance_names
         known_services = []
         unknown_services = list(service_names)
+        tasks = []
+        rolling = []
         for instance_name in instance_names:
             for service in self.config_manager.get_instance_services(instance_name):
                 program_name = self._service_program_name(instance_name, service)
@@ -429,16 +725,105 @@ class SupervisorProcessManager(BaseProcessManager):
                         continue
                     else:
                         unknown_services.remove(program_name)
+                namespec = self._service_namespec(instance_name, service)
                 if service.graceful_method == GracefulMethod.SIGHUP:
-                    self.supervisorctl("signal", "SIGHUP", program_name)
+                    tasks.append([("signalProcess", (namespec, "HUP"))])
+                elif service.graceful_method == GracefulMethod.ROLLING:
+                    rolling.append((namespec, instance_name, service))
                 else:
-                    self.supervisorctl("restart", program_name)
+                    tasks.append(self.__op_calls("restart", namespec))
+        self.__run_tasks(tasks)
+        if rolling:
+            self.__rolling_restart(rolling)
         if unknown_services:
             exception(f'Invalid service(s): {", ".join(unknown_services)}. Known service(s) are {", ".join(known_services)}')
+        return instance_names, service_names
+
+    def __wait_for_states(self, namespecs, states, failed_states=()):
+        """Wait for the processes ``namespecs`` to all be in one of ``states``, stopping early if any enter
+        ``failed_states``. Returns a list of errors, which is empty if the processes reached ``states`` in time.
+        """
+        errors = []
+
+        def in_states():
+            proc_infos = self.rpc.multicall([("getProcessInfo", (namespec,)) for namespec in namespecs])
+            for namespec, proc_info in zip(namespecs, proc_infos):
+                if isinstance(proc_info, xmlrpclib.Fault):
+                    errors.append(f"{namespec}: ERROR ({RPC_ERROR_MESSAGES.get(proc_info.faultCode, proc_info.faultString)})")
+                elif proc_info["statename"] in failed_states:
+                    errors.append(f"{namespec}: ERROR ({proc_info['statename']}, {proc_info['description']})")
+            return errors or all(proc_info["statename"] in states for proc_info in proc_infos)
+
+        if not wait_for(in_states, ROLLING_RESTART_TIMEOUT, initial_delay=0.05, max_delay=1):
+            errors.append(f"timed out waiting for {', '.join(namespecs)} to be {' or '.join(states)}")
+        return errors
+
+    def __rolling_restart(self, rolling):
+        """Restart ``rolling``, a list of ``(namespec, instance_name, service)`` tuples, in batches that leave some of the
+        services of each server pool running, waiting for each batch to be running before restarting the next
+        """
+        if not self.__supervisord_is_running():
+            warn("supervisord is not running")
+            return
+        batches = self._rolling_batches(rolling)
+        for i, batch in enumerate(batches):
+            info(f"Restarting batch {i + 1} of {len(batches)}: {', '.join(batch)}")
+            failed = []
+            self.__output_results(
+                [("stopProcess", (namespec, False)) for namespec in batch],
+                self.rpc.multicall([("stopProcess", (namespec, False)) for namespec in batch]),
+                failed,
+            )
+            if not failed:
+                failed.extend(self.__wait_for_states(batch, ("STOPPED", "EXITED", "FATAL")))
+            if not failed:
+                self.__output_results(
+                    [("startProcess", (namespec, False)) for namespec in batch],
+                    self.rpc.multicall([("startProcess", (namespec, False)) for namespec in batch]),
+                    failed,
+                )
+            if not failed:
+                failed.extend(self.__wait_for_states(batch, ("RUNNING",), failed_states=("EXITED", "FATAL")))
+            if failed:
+                remaining = [namespec for later_batch in batches[i + 1:] for namespec in later_batch]
+                exception(
+                    f"Rolling restart failed: {', '.join(failed)}"
+                    + (f", not restarted: {', '.join(remaining)}" if remaining else "")
+                )
+
+    def __health_probes(self, instance_names=None, service_names=()):
+        """Return a dict of the namespecs and health probes of the services of ``instance_names`` (all instances if
+        ``None``) and the services named in ``service_names`` by program name or namespec
+        """
+        probes = {}
+        for instance_name, service, probe in self._health_probes():
+            namespec = self._service_namespec(instance_name, service)
+            if (
+                instance_names is None
+                or instance_name in instance_names
+                or namespec in service_names
+                or self._service_program_name(instance_name, service) in service_names
+            ):
+                probes[namespec] = probe
+        return probes
+
+    def __failed_processes(self, namespecs):
+        """Return errors for any of the processes ``namespecs`` that are no longer running or starting"""
+        proc_infos = self.rpc.multicall([("getProcessInfo", (namespec,)) for namespec in namespecs])
+        return [
+            f"{namespec} ({proc_info['statename']}, {proc_info['description']})"
+            for namespec, proc_info in zip(namespecs, proc_infos)
+            if not isinstance(proc_info, xmlrpclib.Fault) and proc_info["statename"] in ("STOPPED", "EXITED", "FATAL")
+        ]
+
+    def __wait_for_health(self, instance_names, service_names):
+        self._wait_for_health(self.__health_probes(instance_names, service_names), failed=self.__failed_processes)
 
     def start(self, instance_names):
-        self.__start_stop("start", instance_names)
-        self.supervisorctl("status")
+        _, service_names = self.__start_stop("start", instance_names)
+        self.status()
+        # the health of the services of instances is checked as they are started
+        self.__wait_for_health((), service_names)
 
     def stop(self, instance_names):
         self.__start_stop("stop", instance_names)
@@ -452,39 +837,169 @@ class SupervisorProcessManager(BaseProcessManager):
             info("Not all processes stopped, supervisord not shut down (hint: see `galaxyctl status`)")
 
     def restart(self, instance_names):
-        self.__start_stop("restart", instance_names)
+        _, service_names = self.__start_stop("restart", instance_names)
+        self.__wait_for_health((), service_names)
 
     def reload(self, instance_names):
         self.__reload_graceful("reload", instance_names)
 
     def graceful(self, instance_names):
-        self.__reload_graceful("graceful", instance_names)
+        instance_names, service_names = self.__reload_graceful("graceful", instance_names)
+        self.__wait_for_health(() if service_names else instance_names, service_names)
 
-    def status(self):
-        # TODO: create our own formatted output
-        # supervisor = self.get_supervisor()
-        # all_infos = supervisor.getAllProcessInfo()
-        self.supervisorctl("status")
+    def process_status(self):
+        """Return the state, resource usage and health of each supervised process.
+
+        Resource usage is the total of the process and all of its descendants (e.g. gunicorn workers or celery pool
+        processes), and is ``None`` for processes that aren't running or where ``/proc`` is unavailable. Health is the
+        result of the service's health probe, and is ``None`` for processes that aren't running or have no probe.
+        """
+        proc_infos = self.__get_supervisor().getAllProcessInfo()
+        usage = process_tree_usage([proc_info["pid"] for proc_info in proc_infos if proc_info["pid"]])
+        probes = self.__health_probes()
+        statuses = []
+        for proc_info in proc_infos:
+            pid = proc_info["pid"] or None
+            name = make_namespec(proc_info["group"], proc_info["name"])
+            health = None
+            if pid and name in probes:
+                healthy, detail = probes[name].check()
+                health = {"probe": str(probes[name]), "healthy": healthy, "detail": detail}
+            status = {
+                "name": name,
+                "group": proc_info["group"],
+                "state": proc_info["statename"],
+                "description": proc_info["description"],
+                "pid": pid,
+                "uptime": proc_info["now"] - proc_info["start"] if pid else None,
+                "exit_status": None if pid else proc_info["exitstatus"],
+                "rss": None,
+                "pss": None,
+                "cpu_time": None,
+                "threads": None,
+                "processes": None,
+                "health": health,
+            }
+            status.update(usage.get(pid, {}))
+            statuses.append(status)
+        return statuses
+
+    def status(self, json_output=False):
+        if not self.__supervisord_is_running():
+            warn("supervisord is not running")
+            if json_output:
+                click.echo("[]")
+            return
+        self._output_status(self.process_status(), json_output=json_output)
 
     def shutdown(self):
-        self.supervisorctl("shutdown")
-        while self.__supervisord_is_running():
+        if self.__supervisord_is_running():
+            pid = int(open(self.supervisord_pid_path).read())
+            self.__get_supervisor().shutdown()
+            self.__close_rpc()
+            click.echo("Shut down")
             debug("Waiting for supervisord to terminate")
-            time.sleep(0.5)
+            if not self.__wait_for_exit(pid):
+                exception(f"Timed out after {self.supervisord_timeout:g} seconds waiting for supervisord to terminate")
+        else:
+            warn("supervisord is not running")
         info("supervisord has terminated")
 
     def update(self, force=False):
-        """Add newly defined servers, remove any that are no longer present"""
-        configs, meta_changes = self.config_manager.determine_config_changes()
-        self._process_config_changes(configs, meta_changes, force)
+        """Add newly defined servers, remove any that are no longer present.
+
+        Only the process groups of changed and removed instances are reconfigured in supervisord, unless ``force`` is set,
+        in which case every group whose config differs from supervisord's is.
+        """
+        # hold the state lock from determining changes until they are persisted, so a concurrent update can't interleave
+        with self.config_manager.transaction():
+            configs, meta_changes = self.config_manager.determine_config_changes()
+            meta_changes["regroup_instances"] = self.__regroup_instances(configs, meta_changes)
+            meta_changes["changed_instances"] |= meta_changes["regroup_instances"]
+            # determined before the changes are processed, which consumes the service changes of configs
+            groups = None if force else self.__changed_groups(configs, meta_changes)
+            self._process_config_changes(configs, meta_changes, force)
         # only need to update if supervisord is running, otherwise changes will be picked up at next start
         if self.__supervisord_is_running():
-            self.supervisorctl("update")
+            self.__update_groups(groups)
+
+    def __regroup_instances(self, configs, meta_changes):
+        """Return the names of the instances in ``configs`` whose programs were written grouped while they are now
+        ungrouped, or vice versa, as happens when a second instance is registered or all but one are deregistered.
+        """
+        regroup = set()
+        for config in configs.values():
+            instance_name = config["instance_name"]
+            if instance_name in meta_changes["changed_instances"] or not config["services"]:
+                continue
+            if not exists(join(self.supervisord_conf_dir, f"{instance_name}.d")):
+                continue
+            if exists(join(self.supervisord_conf_dir, f"group_{instance_name}.conf")) != self.use_group:
+                regroup.add(instance_name)
+        return regroup
+
+    def __changed_groups(self, configs, meta_changes):
+        """Return the names of the process groups whose supervisor configs ``configs`` and ``meta_changes`` may add,
+        change or remove.
+
+        Whether instances are grouped can change with the number of registered instances, so the groups of the services
+        of changed and removed configs are named both ways.
+        """
+        instance_names = set(meta_changes["changed_instances"]) | set(meta_changes["remove_instances"])
+        groups = set()
+        changed_configs = [
+            config for config in configs.values()
+            if config["instance_name"] in instance_names or config.get("update_instance_name") in instance_names
+        ]
+        for config in changed_configs + list(meta_changes["remove_configs"].values()):
+            config_instance_names = {config["instance_name"], config.get("update_instance_name") or config["instance_name"]}
+            for service in config["services"] + config.get("update_services", []) + config.get("remove_services", []):
+                for instance_name in config_instance_names:
+                    groups.update(self._service_group_name(instance_name, service, use_group=use_group) for use_group in (True, False))
+        return groups | instance_names
+
+    def __update_groups(self, groups=None):
+        """Apply the changes to the supervisor configs of the process groups ``groups`` (all groups if ``None``), as
+        ``supervisorctl update GROUP...`` would.
+
+        supervisord compares the configs on disk with those of its groups, and only the added, changed and removed groups
+        that are in ``groups`` are then added, stopped and re-added, or stopped and removed, so that an update of one
+        instance never touches the groups of others.
+        """
+        added, changed, removed = self.__get_supervisor().reloadConfig()[0]
+        if groups is not None:
+            added, changed, removed = ([name for name in names if name in groups] for names in (added, changed, removed))
+        # (call, message output if it succeeds)
+        steps = []
+        for name in removed:
+            steps.extend([(("stopProcessGroup", (name,)), "stopped"), (("removeProcessGroup", (name,)), "removed process group")])
+        for name in changed:
+            steps.extend([
+                (("stopProcessGroup", (name,)), "stopped"),
+                (("removeProcessGroup", (name,)), None),
+                (("addProcessGroup", (name,)), "updated process group"),
+            ])
+        for name in added:
+            steps.append((("addProcessGroup", (name,)), "added process group"))
+        debug(f"Updating process groups: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+        failed = []
+        results = self.rpc.multicall([call for call, _ in steps])
+        for ((method, (name,)), message), result in zip(steps, results):
+            if isinstance(result, xmlrpclib.Fault):
+                click.echo(f"{name}: ERROR ({RPC_ERROR_MESSAGES.get(result.faultCode, result.faultString)})")
+                failed.append(name)
+            elif message:
+                click.echo(f"{name}: {message}")
+        if failed:
+            exception(f"Failed to update process group(s): {', '.join(dict.fromkeys(failed))}")
 
     def supervisorctl(self, *args, **kwargs):
         if not self.__supervisord_is_running():
             warn("supervisord is not running")
             return
+        # only imported for the supervisorctl command, the process manager itself talks to supervisord over RPC
+        from supervisor import supervisorctl  # type: ignore
+
         try:
             supervisorctl.main(args=["-c", self.supervisord_conf_path] + list(args))
         except SystemExit as e:
@@ -0,0 +1,508 @@
+""" systemd Process Manager
+
+Services are run as systemd units, written to the system unit directory if running as root or else to the user's unit
+directory, with a target per instance that all of the instance's units are part of.
+"""
+import os
+import shlex
+import subprocess
+import time
+from datetime import timedelta
+from os.path import exists, join
+
+import click
+
+from gravity.io import debug, exception, info, warn
+from gravity.process_manager import BaseProcessManager, DEFAULT_STOP_TIMEOUT, SERVICE_STOP_TIMEOUTS
+from gravity.state import GracefulMethod
+from gravity.util import which, write_if_changed
+from gravity.util.procfs import process_tree_usage
+
+SYSTEM_UNIT_DIR = "/etc/systemd/system"
+# exists if the system was booted with systemd
+SYSTEMD_RUNTIME_DIR = "/run/systemd/system"
+MANAGED_HEADER = "# This file is maintained by Galaxy - CHANGES WILL BE OVERWRITTEN"
+# where service output goes by default, "file" (the service's log file in the log dir) or "journal"
+DEFAULT_LOG_TARGET = "file"
+# unit properties read for status
+STATUS_PROPERTIES = ("Id", "ActiveState", "SubState", "Result", "MainPID", "ExecMainStartTimestampMonotonic", "ExecMainStatus")
+# ActiveStates of units that are not running and won't be unless started again
+STOPPED_STATES = ("inactive", "failed")
+
+
+def _escape(value):
+    """Escape specifiers in a unit file setting value"""
+    return str(value).replace("%", "%%")
+
+
+def _quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def render_unit(sections):
+    """Return the contents of a unit file with ``sections``, a list of ``(section_name, settings)`` tuples where
+    ``settings`` is a list of ``(key, value)`` tuples. Settings with a value of ``None`` are omitted.
+    """
+    lines = [MANAGED_HEADER]
+    for section_name, settings in sections:
+        lines.extend(["", f"[{section_name}]"])
+        lines.extend(f"{key}={value}" for key, value in settings if value is not None)
+    return "\n".join(lines) + "\n"
+
+
+def resource_control_settings(resources):
+    """Return the ``[Service]`` settings that apply ``resources``, a dict of process resource controls (see
+    :class:`gravity.settings.ResourceSettings`)
+    """
+    return [
+        ("CPUAffinity", resources.get("cpu_affinity")),
+        ("Nice", resources.get("nice")),
+        ("IOSchedulingClass", resources.get("ionice_class")),
+        ("IOSchedulingPriority", resources.get("ionice_priority")),
+        ("LimitAS", resources.get("rlimit_as")),
+        ("LimitNOFILE", resources.get("rlimit_nofile")),
+        ("OOMScoreAdjust", resources.get("oom_score_adj")),
+    ]
+
+
+def parse_show_output(output):
+    """Parse the output of ``systemctl show`` for one or more units into a list of dicts of their properties"""
+    units = []
+    for block in output.strip().split("\n\n"):
+        properties = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+        if properties:
+            units.append(properties)
+    return units
+
+
+class SystemdProcessManager(BaseProcessManager):
+    def __init__(
+        self, state_dir=None, start_daemon=True, foreground=False, state_backend=None, parallel=1, batch_size=None, health_timeout=None,
+        wave_size=None,
+    ):
+        # services are started in dependency order by systemd itself, so wave_size does not apply
+        super(SystemdProcessManager, self).__init__(
+            state_dir=state_dir, state_backend=state_backend, parallel=parallel, batch_size=batch_size, health_timeout=health_timeout,
+        )
+        self.user_mode = os.geteuid() != 0
+        default_unit_dir = join(os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "systemd", "user") if self.user_mode else SYSTEM_UNIT_DIR
+        self.unit_dir = os.environ.get("GRAVITY_SYSTEMD_UNIT_DIR") or default_unit_dir
+        self.log_target = os.environ.get("GRAVITY_SYSTEMD_LOG_TARGET") or DEFAULT_LOG_TARGET
+        if self.log_target not in ("file", "journal"):
+            exception(f"Invalid $GRAVITY_SYSTEMD_LOG_TARGET: {self.log_target} (must be 'file' or 'journal')")
+        # pid files written by services that write them
+        self.systemd_state_dir = join(self.state_dir, "systemd")
+        self.systemctl_exe = which("systemctl") or "systemctl"
+        self.foreground = foreground
+        # units started in the foreground, which are stopped again on termination
+        self.__foreground_units = []
+
+        for directory in (self.unit_dir, self.systemd_state_dir):
+            if not exists(directory):
+                os.makedirs(directory)
+
+    def _service_program_name(self, instance_name, service):
+        if self.config_manager.single_instance:
+            return service["service_name"]
+        return f"{instance_name}_{service['config_type']}_{service['service_type']}_{service['service_name']}"
+
+    def _service_unit_name(self, instance_name, service):
+        if self.config_manager.single_instance:
+            return f"{service['config_type']}-{service['service_name']}.service"
+        return f"{service['config_type']}-{instance_name}-{service['service_name']}.service"
+
+    def _instance_target_name(self, instance_name):
+        if self.config_manager.single_instance:
+            return "galaxy.target"
+        return f"galaxy-{instance_name}.target"
+
+    def __service_unit(self, config_file, attribs, service, instance_name, instance_services):
+        program_name = self._service_program_name(instance_name, service)
+        format_vars = self._service_format_vars(config_file, attribs, service, program_name, self.systemd_state_dir)
+        target = self._instance_target_name(instance_name)
+        # systemd does not search $PATH for the executable
+        args = shlex.split(format_vars["command"])
+        exe = args[0] if os.path.isabs(args[0]) else which(args[0])
+        if exe is None:
+            warn(f"Command of service {program_name} not found on $PATH: {args[0]}")
+            exe = args[0]
+        command = " ".join([shlex.quote(exe)] + format_vars["command"].split(None, 1)[1:]).rstrip()
+        after = [
+            self._service_unit_name(instance_name, other)
+            for other in instance_services
+            if other["service_type"] in service.start_after
+        ]
+        environment = self._service_environment(config_file, attribs, service)
+        if self.log_target == "file":
+            output = [("StandardOutput", _escape(f"append:{format_vars['log_file']}")), ("StandardError", "inherit")]
+        else:
+            output = [("StandardOutput", "journal"), ("StandardError", "inherit"), ("SyslogIdentifier", _escape(program_name))]
+        user = group = None
+        if not self.user_mode:
+            # system units would otherwise run Galaxy as root
+            user = attribs.get("galaxy_user")
+            group = attribs.get("galaxy_group")
+            if not user:
+                exception(f"Refusing to write system unit for {program_name} without a user to run it as: set galaxy_user in "
+                          f"the gravity section of {config_file}")
+        service_settings = [
+            ("Type", "simple"),
+            ("User", _escape(user) if user else None),
+            ("Group", _escape(group) if group else None),
+            ("WorkingDirectory", _escape(format_vars["galaxy_root"])),
+            ("UMask", format_vars["galaxy_umask"] if service["service_type"] != "standalone" else None),
+            ("ExecStart", _escape(command).replace("$", "$$")),
+            ("ExecReload", "/bin/kill -HUP $MAINPID" if service.graceful_method == GracefulMethod.SIGHUP else None),
+        ]
+        service_settings.extend(("Environment", _escape(_quote(f"{k}={v}"))) for k, v in sorted(environment.items()))
+        service_settings.extend([
+            ("Restart", "always"),
+            ("RestartSec", 5),
+            ("TimeoutStopSec", SERVICE_STOP_TIMEOUTS.get(service["service_type"], DEFAULT_STOP_TIMEOUT)),
+        ])
+        service_settings.extend(output)
+        service_settings.extend(resource_control_settings(service.resources(attribs)))
+        return render_unit([
+            ("Unit", [
+                ("Description", f"Galaxy {program_name}"),
+                ("After", " ".join(["network.target"] + after)),
+                ("PartOf", target),
+            ]),
+            ("Service", service_settings),
+            ("Install", [("WantedBy", target)]),
+        ])
+
+    def __instance_target(self, instance_name, units):
+        return render_unit([
+            ("Unit", [
+                ("Description", f"Galaxy instance {instance_name}"),
+                ("Wants", " ".join(units)),
+            ]),
+            ("Install", [("WantedBy", "default.target" if self.user_mode else "multi-user.target")]),
+        ])
+
+    def render_units(self):
+        """Return a dict of the file names and contents of the units of all registered services and instances"""
+        units = {}
+        instance_units = {}
+        for config_file, config in self.config_manager.get_registered_configs().items():
+            instance_name = config["instance_name"]
+            attribs = config["attribs"]
+            if not exists(attribs["log_dir"]):
+                os.makedirs(attribs["log_dir"])
+            for service in config["services"]:
+                unit_name = self._service_unit_name(instance_name, service)
+                units[unit_name] = self.__service_unit(config_file, attribs, service, instance_name, config["services"])
+                instance_units.setdefault(instance_name, []).append(unit_name)
+        for instance_name, unit_names in instance_units.items():
+            units[self._instance_target_name(instance_name)] = self.__instance_target(instance_name, unit_names)
+        return units
+
+    def __managed_units(self):
+        """Return the names of the unit files in the unit dir that were written by Gravity"""
+        names = []
+        for name in os.listdir(self.unit_dir):
+            path = join(self.unit_dir, name)
+            if not name.endswith((".service", ".target")) or not os.path.isfile(path):
+                continue
+            with open(path) as fh:
+                if fh.readline().rstrip("\n") == MANAGED_HEADER:
+                    names.append(name)
+        return names
+
+    def write_units(self, force=False):
+        """Write the units of all registered services and instances that have changed (all units, if ``force`` is set)
+        and remove those of services and instances that are no longer registered. Returns a tuple of the names of the
+        changed and removed units.
+        """
+        units = self.render_units()
+        changed = []
+        for name, contents in units.items():
+            path = join(self.unit_dir, name)
+            if write_if_changed(path, contents, force=force):
+                info(f"Wrote unit {path}")
+                changed.append(name)
+        removed = [name for name in self.__managed_units() if name not in units]
+        for name in removed:
+            info(f"Removing unit {join(self.unit_dir, name)}")
+            os.unlink(join(self.unit_dir, name))
+        return changed, removed
+
+    def _process_config_changes(self, configs, meta_changes, force=False):
+        # unit names depend on the registered instances, so all units are rendered once the changes are persisted, and
+        # only those whose contents differ are written
+        self.config_manager.register_config_changes(configs, meta_changes)
+        return self.write_units(force=force)
+
+    def __systemd_running(self):
+        return exists(SYSTEMD_RUNTIME_DIR)
+
+    def __systemctl_args(self, *args):
+        return [self.systemctl_exe] + (["--user"] if self.user_mode else []) + list(args)
+
+    def __systemctl(self, *args, check=True):
+        cmd = self.__systemctl_args(*args)
+        debug(f"Running: {' '.join(cmd)}")
+        rc = subprocess.call(cmd)
+        if rc and check:
+            exception(f"`{' '.join(cmd)}` failed with exit code {rc}")
+        return rc
+
+    def __show(self, units, properties=STATUS_PROPERTIES):
+        """Return a dict of the ``properties`` of ``units``, keyed by unit name"""
+        if not units:
+            return {}
+        output = subprocess.check_output(self.__systemctl_args("show", f"--property={','.join(properties)}", *units), universal_newlines=True)
+        return {props["Id"]: props for props in parse_show_output(output)}
+
+    def __require_systemd(self):
+        if not self.__systemd_running():
+            exception("systemd is not running")
+
+    def __registered_services(self, instance_names=None):
+        """Yield ``(instance_name, service, unit_name)`` for the services of ``instance_names`` (all if ``None``)"""
+        for config in self.config_manager.get_registered_configs(instances=instance_names).values():
+            for service in config["services"]:
+                yield config["instance_name"], service, self._service_unit_name(config["instance_name"], service)
+
+    def __service_units(self, service_names):
+        """Return the units of ``service_names``, which may be program names or unit names"""
+        units = {}
+        for instance_name, service, unit_name in self.__registered_services():
+            units[self._service_program_name(instance_name, service)] = unit_name
+            units[unit_name] = unit_name
+            units[unit_name[:-len(".service")]] = unit_name
+        unknown = [name for name in service_names if name not in units]
+        if unknown:
+            exception(f"Invalid service(s): {', '.join(unknown)}. Known service(s) are {', '.join(sorted(set(units.values())))}")
+        return [units[name] for name in service_names]
+
+    def __units(self, instance_names):
+        """Return the names of the instances named in ``instance_names``, their targets and the units of the services named
+        in ``instance_names``
+        """
+        instance_names, service_names, _ = self.get_instance_names(instance_names)
+        return instance_names, [self._instance_target_name(name) for name in instance_names], self.__service_units(service_names)
+
+    def __health_probes(self, instance_names, service_units):
+        """Return a dict of the unit names and health probes of the services of ``instance_names`` and ``service_units``"""
+        return {
+            self._service_unit_name(instance_name, service): probe
+            for instance_name, service, probe in self._health_probes()
+            if instance_name in instance_names or self._service_unit_name(instance_name, service) in service_units
+        }
+
+    def __failed_units(self, units):
+        """Return errors for any of ``units`` that have stopped"""
+        return [
+            f"{unit} ({props['ActiveState']}, {props['Result']})"
+            for unit, props in self.__show(units).items()
+            if props["ActiveState"] in STOPPED_STATES
+        ]
+
+    def __wait_for_health(self, instance_names, service_units):
+        self._wait_for_health(self.__health_probes(instance_names, service_units), failed=self.__failed_units)
+
+    def start(self, instance_names):
+        self.update()
+        self.__require_systemd()
+        instance_names, targets, service_units = self.__units(instance_names)
+        # targets pull in their services, which systemd starts in the order given by their After= dependencies
+        self.__systemctl("start", *(targets + service_units))
+        if self.foreground:
+            self.__foreground_units = targets + service_units
+        self.status()
+        self.__wait_for_health(instance_names, service_units)
+
+    def stop(self, instance_names):
+        self.__require_systemd()
+        _, targets, service_units = self.__units(instance_names)
+        # the services of a target are stopped with it as they are PartOf it
+        self.__systemctl("stop", *(targets + service_units))
+
+    def restart(self, instance_names):
+        self.update()
+        self.__require_systemd()
+        instance_names, targets, service_units = self.__units(instance_names)
+        self.__systemctl("restart", *(targets + service_units))
+        self.__wait_for_health(instance_names, service_units)
+
+    def reload(self, instance_names):
+        self.graceful(instance_names)
+
+    def graceful(self, instance_names):
+        self.update()
+        self.__require_systemd()
+        instance_names, service_names, registered_instance_names = self.get_instance_names(instance_names)
+        service_units = self.__service_units(service_names)
+        reload_units = []
+        restart_units = []
+        rolling = []
+        for instance_name, service, unit_name in self.__registered_services():
+            if unit_name not in service_units and instance_name not in instance_names:
+                continue
+            if service.graceful_method == GracefulMethod.SIGHUP:
+                reload_units.append(unit_name)
+            elif service.graceful_method == GracefulMethod.ROLLING:
+                rolling.append((unit_name, instance_name, service))
+            else:
+                restart_units.append(unit_name)
+        if reload_units:
+            self.__systemctl("reload-or-restart", *reload_units)
+        if restart_units:
+            self.__systemctl("restart", *restart_units)
+        if rolling:
+            self.__rolling_restart(rolling)
+        self.__wait_for_health(() if service_units else instance_names, service_units)
+
+    def __rolling_restart(self, rolling):
+        """Restart ``rolling``, a list of ``(unit_name, instance_name, service)`` tuples, in batches that leave some of the
+        services of each server pool running
+        """
+        batches = self._rolling_batches(rolling)
+        for i, batch in enumerate(batches):
+            info(f"Restarting batch {i + 1} of {len(batches)}: {', '.join(batch)}")
+            # restart waits for the units to have started
+            rc = self.__systemctl("restart", *batch, check=False)
+            failed = [
+                f"{unit}: ERROR ({props['ActiveState']}, {props['Result']})"
+                for unit, props in self.__show(batch).items()
+                if props["ActiveState"] != "active"
+            ]
+            if rc or failed:
+                remaining = [unit for later_batch in batches[i + 1:] for unit in later_batch]
+                exception(
+                    f"Rolling restart failed: {', '.join(failed) or ', '.join(batch)}"
+                    + (f", not restarted: {', '.join(remaining)}" if remaining else "")
+                )
+
+    def process_status(self):
+        """Return the state, resource usage and health of each service's unit, as the supervisor process manager's
+        ``process_status`` does for its processes.
+        """
+        services = list(self.__registered_services())
+        unit_props = self.__show([unit_name for _, _, unit_name in services])
+        usage = process_tree_usage([int(props["MainPID"]) for props in unit_props.values() if int(props.get("MainPID") or 0)])
+        probes = self.__health_probes([instance_name for instance_name, _, _ in services], ())
+        now = time.monotonic()
+        statuses = []
+        for instance_name, service, unit_name in services:
+            props = unit_props.get(unit_name, {})
+            pid = int(props.get("MainPID") or 0) or None
+            uptime = None
+            if pid and int(props.get("ExecMainStartTimestampMonotonic") or 0):
+                uptime = now - int(props["ExecMainStartTimestampMonotonic"]) / 1e6
+            if pid:
+                description = f"pid {pid}, uptime {timedelta(seconds=int(uptime or 0))}"
+            else:
+                description = f"{props.get('SubState', 'unknown')} ({props.get('Result', 'unknown')})"
+            health = None
+            if pid and unit_name in probes:
+                healthy, detail = probes[unit_name].check()
+                health = {"probe": str(probes[unit_name]), "healthy": healthy, "detail": detail}
+            status = {
+                "name": unit_name,
+                "group": instance_name,
+                "state": props.get("ActiveState", "unknown").upper(),
+                "description": description,
+                "pid": pid,
+                "uptime": uptime,
+                "exit_status": None if pid else int(props.get("ExecMainStatus") or 0),
+                "rss": None,
+                "pss": None,
+                "cpu_time": None,
+                "threads": None,
+                "processes": None,
+                "health": health,
+            }
+            status.update(usage.get(pid, {}))
+            statuses.append(status)
+        return statuses
+
+    def status(self, json_output=False):
+        if not self.__systemd_running():
+            warn("systemd is not running")
+            if json_output:
+                click.echo("[]")
+            return
+        self._output_status(self.process_status(), json_output=json_output)
+
+    def _log_files(self, instance_names, quiet=False):
+        # there is no process manager log, as supervisord's
+        if quiet:
+            return {}
+        return super(SystemdProcessManager, self)._log_files(instance_names)
+
+    def __journal_units(self, instance_names):
+        instance_names, _, service_units = self.__units(instance_names)
+        return [unit_name for instance_name, _, unit_name in self.__registered_services() if instance_name in instance_names] + service_units
+
+    def __journalctl(self, instance_names, *args):
+        cmd = ["journalctl"] + (["--user"] if self.user_mode else [])
+        for unit in self.__journal_units(instance_names):
+            cmd.extend(["--unit", unit])
+        cmd.extend(args)
+        debug(f"Running: {' '.join(cmd)}")
+        try:
+            subprocess.call(cmd)
+        except KeyboardInterrupt:
+            pass
+
+    def follow(self, instance_names, quiet=False, grep=None, since=None, rate=None):
+        if self.log_target == "file":
+            return super(SystemdProcessManager, self).follow(instance_names, quiet=quiet, grep=grep, since=since, rate=rate)
+        if quiet:
+            return
+        args = ["--follow"]
+        if grep:
+            args.extend(["--grep", grep])
+        if since:
+            args.extend(["--since", since.strftime("%Y-%m-%d %H:%M:%S")])
+        self.__journalctl(instance_names, *args)
+
+    def logs(self, instance_names, grep=None, since=None, until=None, lines=None):
+        if self.log_target == "file":
+            return super(SystemdProcessManager, self).logs(instance_names, grep=grep, since=since, until=until, lines=lines)
+        args = ["--no-pager"]
+        if grep:
+            args.extend(["--grep", grep])
+        if since:
+            args.extend(["--since", since.strftime("%Y-%m-%d %H:%M:%S")])
+        if until:
+            args.extend(["--until", until.strftime("%Y-%m-%d %H:%M:%S")])
+        if lines:
+            args.extend(["--lines", str(lines)])
+        self.__journalctl(instance_names, *args)
+
+    def shutdown(self):
+        self.__require_systemd()
+        targets = [self._instance_target_name(name) for name in self.config_manager.get_registered_instances()]
+        if targets:
+            self.__systemctl("stop", *targets)
+        click.echo("Shut down")
+
+    def terminate(self):
+        if self.__foreground_units:
+            info("Stopping services started in the foreground")
+            self.__systemctl("stop", *self.__foreground_units, check=False)
+            self.__foreground_units = []
+
+    def update(self, force=False):
+        """Write units for newly defined and changed services, remove those of services that are no longer present, and
+        restart any changed services that are running.
+        """
+        with self.config_manager.transaction():
+            configs, meta_changes = self.config_manager.determine_config_changes()
+            changed, removed = self._process_config_changes(configs, meta_changes, force)
+        if not (changed or removed):
+            return
+        if not self.__systemd_running():
+            debug("systemd is not running, units will be loaded when it is")
+            return
+        if removed:
+            self.__systemctl("stop", *removed, check=False)
+        self.__systemctl("daemon-reload")
+        changed_services = [name for name in changed if name.endswith(".service")]
+        if changed_services:
+            # as supervisord does on update, restart changed services that are running
+            self.__systemctl("try-restart", *changed_services)
@@ -3,10 +3,23 @@ from typing import (
     Any,
     Dict,
     Optional,
+    Union,
 )
 from pydantic import BaseModel, BaseSettings, Extra, Field, validator
 
 
+# value of settings that are sized automatically for the CPUs and memory available
+AUTO = "auto"
+
+
+def auto_or_at_least(minimum):
+    def validate(cls, v):
+        if v != AUTO and (not isinstance(v, int) or v < minimum):
+            raise ValueError(f"must be '{AUTO}' or an integer greater than or equal to {minimum}")
+        return v
+    return validate
+
+
 def none_to_default(cls, v, field):
     if all(
         (
@@ -41,6 +54,66 @@ class Pool(str, Enum):
     threads = "threads"
 
 
+class IONiceClass(str, Enum):
+    realtime = "realtime"
+    best_effort = "best-effort"
+    idle = "idle"
+
+
+class ResourceSettings(BaseModel):
+    cpu_affinity: Optional[str] = Field(
+        default=None,
+        regex=r"^\d+(-\d+)?(,\d+(-\d+)?)*$",
+        description="""
+List of CPUs the processes may run on, e.g. ``0-3,8``.
+""")
+    nice: Optional[int] = Field(
+        default=None,
+        ge=-20,
+        le=19,
+        description="""
+Niceness (CPU scheduling priority) of the processes, from -20 (highest priority) to 19 (lowest priority).
+Negative values require Gravity to run as root.
+""")
+    ionice_class: Optional[IONiceClass] = Field(
+        default=None,
+        description="""
+I/O scheduling class of the processes.
+``realtime`` requires Gravity to run as root.
+""")
+    ionice_priority: Optional[int] = Field(
+        default=None,
+        ge=0,
+        le=7,
+        description="""
+I/O scheduling priority of the processes within the ``realtime`` or ``best-effort`` class, from 0 (highest) to 7 (lowest).
+""")
+    rlimit_as: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="""
+Maximum size of the address space (virtual memory) of each process, in bytes.
+""")
+    rlimit_nofile: Optional[int] = Field(default=None, ge=0, description="Maximum number of open files of each process.")
+    oom_score_adj: Optional[int] = Field(
+        default=None,
+        ge=-1000,
+        le=1000,
+        description="""
+Adjustment of the likelihood of the processes being killed when the system is out of memory, from -1000 (never) to 1000.
+Negative values require Gravity to run as root.
+""")
+
+    class Config:
+        use_enum_values = True
+
+
+RESOURCES_DESCRIPTION = """
+Process resource controls, applied by running the service's command with ``taskset``, ``nice``, ``ionice``, ``prlimit`` and
+``choom`` (from util-linux and coreutils).
+"""
+
+
 class TusdSettings(BaseModel):
     enable: bool = Field(False, description="""
 Enable tusd server.
@@ -54,16 +127,27 @@ Directory to store uploads in.
 Must match ``tus_upload_store`` setting in ``galaxy:`` section.
 """)
     extra_args: str = Field(default="", description="Extra arguments to pass to tusd command line.")
+    resources: ResourceSettings = Field(default={}, description=RESOURCES_DESCRIPTION)
+
+    _normalize_resources = validator("resources", allow_reuse=True, pre=True, always=True)(none_to_default)
 
 
 class CelerySettings(BaseModel):
     enable: bool = Field(True, description="Enable Celery distributed task queue.")
     enable_beat: bool = Field(True, description="Enable Celery Beat periodic task runner.")
-    concurrency: int = Field(2, ge=0, description="Number of Celery Workers to start.")
+    concurrency: Union[int, str] = Field(2, description="""
+Number of Celery Workers to start.
+Set to ``auto`` to size for the CPUs and memory available (including cgroup limits).
+""")
     loglevel: LogLevel = Field(LogLevel.debug, description="Log Level to use for Celery Worker.")
     queues: str = Field("celery,galaxy.internal,galaxy.external", description="Queues to join")
     pool: Pool = Field(Pool.threads, description="Pool implementation")
     extra_args: str = Field(default="", description="Extra arguments to pass to Celery command line.")
+    resources: ResourceSettings = Field(default={}, description=RESOURCES_DESCRIPTION)
+
+    _normalize_resources = validator("resources", allow_reuse=True, pre=True, always=True)(none_to_default)
+
+    _validate_concurrency = validator("concurrency", allow_reuse=True)(auto_or_at_least(0))
 
     class Config:
         use_enum_values = True
@@ -75,14 +159,14 @@ class GunicornSettings(BaseModel):
         default="localhost:8080",
         description="The socket to bind. A string of the form: ``HOST``, ``HOST:PORT``, ``unix:PATH``, ``fd://FD``. An IP is a valid HOST.",
     )
-    workers: int = Field(
+    workers: Union[int, str] = Field(
         default=1,
-        ge=1,
         description="""
 Controls the number of Galaxy application processes Gunicorn will spawn.
 Increased web performance can be attained by increasing this value.
 If Gunicorn is the only application on the server, a good starting value is the number of CPUs * 2 + 1.
 4-12 workers should be able to handle hundreds if not thousands of requests per second.
+Set to ``auto`` to size for the CPUs and memory available (including cgroup limits).
 """)
     timeout: int = Field(
         default=300,
@@ -99,6 +183,18 @@ If you disable the ``preload`` option workers need to have finished booting with
 Use Gunicorn's --preload option to fork workers after loading the Galaxy Application.
 Consumes less memory when multiple processes are configured. Default is ``false`` if using unicornherder, else ``true``.
 """)
+    health_check_path: Optional[str] = Field(
+        default=None,
+        description="""
+Path to request to check that Galaxy is ready to serve requests after starting, restarting or reloading gunicorn.
+Any 2xx or 3xx response is considered healthy.
+Default is ``/api/version`` under ``galaxy_url_prefix`` in the ``galaxy:`` section.
+""")
+    resources: ResourceSettings = Field(default={}, description=RESOURCES_DESCRIPTION)
+
+    _normalize_resources = validator("resources", allow_reuse=True, pre=True, always=True)(none_to_default)
+
+    _validate_workers = validator("workers", allow_reuse=True)(auto_or_at_least(1))
 
 
 class GxItProxySettings(BaseModel):
@@ -129,6 +225,9 @@ This is an advanced option that is only needed when proxying to remote interacti
 Rewrite location blocks with proxy port.
 This is an advanced option that is only needed when proxying to remote interactive tool container that cannot be reached through the local network.
 """)
+    resources: ResourceSettings = Field(default={}, description=RESOURCES_DESCRIPTION)
+
+    _normalize_resources = validator("resources", allow_reuse=True, pre=True, always=True)(none_to_default)
 
 
 class Settings(BaseSettings):
@@ -163,6 +262,18 @@ similar to uWSGI Zerg Mode used in the past.
 """)
     instance_name: str = Field(default="_default_", description="""Override the default instance name.
 this is hidden from you when running a single instance.""")
+    galaxy_user: Optional[str] = Field(
+        None,
+        description="""
+User to run Galaxy as, required when using the systemd process manager as root.
+Ignored with supervisor or user-mode systemd.
+""")
+    galaxy_group: Optional[str] = Field(
+        None,
+        description="""
+Group to run Galaxy as, optional when using the systemd process manager as root.
+Ignored with supervisor or user-mode systemd.
+""")
     gunicorn: GunicornSettings = Field(default={}, description="Configuration for Gunicorn.")
     celery: CelerySettings = Field(default={}, description="Configuration for Celery Processes.")
     gx_it_proxy: GxItProxySettings = Field(default={}, description="Configuration for gx-it-proxy.")
@@ -177,6 +288,8 @@ The ``tusd`` binary must be installed manually and made available on PATH (e.g i
         description="""
 Configure dynamic handlers in this section.
 See https://docs.galaxyproject.org/en/latest/admin/scaling.html#dynamically-defined-handlers for details.
+``processes`` can be set to ``auto`` to size for the CPUs and memory available (including cgroup limits).
+``resources`` can be set to the same process resource controls as the ``resources`` of the ``gunicorn:`` section.
 """)
 
     # Use validators to turn None to default value
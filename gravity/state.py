@@ -1,13 +1,19 @@
 """ Classes to represent and manipulate gravity's stored configuration and
 state data.
 """
+import contextlib
 import enum
 import errno
+import fcntl
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABCMeta, abstractmethod
 from collections import defaultdict
 
-import yaml
-
+from gravity.health import ConnectProbe, HTTPProbe, parse_bind, tcp_address
 from gravity.util import AttributeDict
 
 
@@ -17,12 +23,16 @@ GALAXY_YML_SAMPLE_PATH = "lib/galaxy/config/sample/galaxy.yml.sample"
 class GracefulMethod(enum.Enum):
     DEFAULT = 0
     SIGHUP = 1
+    # restarted in batches, so that some of the services in each server pool are always running
+    ROLLING = 2
 
 
 class Service(AttributeDict):
     service_type = "service"
     service_name = "_default_"
     graceful_method = GracefulMethod.DEFAULT
+    # types of the services that must be ready before this service is started, if they are configured
+    start_after = ()
 
     def __init__(self, *args, **kwargs):
         super(Service, self).__init__(*args, **kwargs)
@@ -34,9 +44,33 @@ class Service(AttributeDict):
     def __eq__(self, other):
         return self["config_type"] == other["config_type"] and self["service_type"] == other["service_type"] and self["service_name"] == other["service_name"]
 
+    @property
+    def identity(self):
+        """Hashable key identifying the service, services are equal if their identities are equal"""
+        return (self["config_type"], self["service_type"], self["service_name"])
+
     def full_match(self, other):
         return set(self.keys()) == set(other.keys()) and all([self[k] == other[k] for k in self if not k.startswith("_")])
 
+    def health_probe(self, attribs):
+        """Return a :class:`gravity.health.Probe` that checks whether the service is ready, or ``None`` if the service
+        can't be probed.
+        """
+        return None
+
+    def resources(self, attribs):
+        """Return a dict of the process resource controls (see :class:`gravity.settings.ResourceSettings`) of the
+        service.
+        """
+        return {}
+
+
+def gunicorn_health_probe(attribs):
+    address = parse_bind(attribs["gunicorn"]["bind"])
+    if address is None:
+        return None
+    return HTTPProbe(address, attribs["gunicorn"].get("health_check_path") or "/api/version")
+
 
 class GalaxyGunicornService(Service):
     service_type = "gunicorn"
@@ -52,6 +86,12 @@ class GalaxyGunicornService(Service):
                        " {gunicorn[preload]}" \
                        " {gunicorn[extra_args]}"
 
+    def health_probe(self, attribs):
+        return gunicorn_health_probe(attribs)
+
+    def resources(self, attribs):
+        return attribs["gunicorn"].get("resources") or {}
+
 
 class GalaxyUnicornHerderService(Service):
     service_type = "unicornherder"
@@ -70,10 +110,17 @@ class GalaxyUnicornHerderService(Service):
                        " {gunicorn[preload]}" \
                        " {gunicorn[extra_args]}"
 
+    def health_probe(self, attribs):
+        return gunicorn_health_probe(attribs)
+
+    def resources(self, attribs):
+        return attribs["gunicorn"].get("resources") or {}
+
 
 class GalaxyCeleryService(Service):
     service_type = "celery"
     service_name = "celery"
+    start_after = ("gunicorn", "unicornherder")
     command_template = "{virtualenv_bin}celery" \
                        " --app galaxy.celery worker" \
                        " --concurrency {celery[concurrency]}" \
@@ -82,16 +129,23 @@ class GalaxyCeleryService(Service):
                        " --queues {celery[queues]}" \
                        " {celery[extra_args]}"
 
+    def resources(self, attribs):
+        return attribs["celery"].get("resources") or {}
+
 
 class GalaxyCeleryBeatService(Service):
     service_type = "celery-beat"
     service_name = "celery-beat"
+    start_after = ("celery",)
     command_template = "{virtualenv_bin}celery" \
                        " --app galaxy.celery" \
                        " beat" \
                        " --loglevel {celery[loglevel]}" \
                        " --schedule {state_dir}/celery-beat-schedule"
 
+    def resources(self, attribs):
+        return attribs["celery"].get("resources") or {}
+
 
 class GalaxyGxItProxyService(Service):
     service_type = "gx-it-proxy"
@@ -99,22 +153,40 @@ class GalaxyGxItProxyService(Service):
     command_template = "{virtualenv_bin}npx gx-it-proxy --ip {gx_it_proxy[ip]} --port {gx_it_proxy[port]}" \
                        " --sessions {gx_it_proxy[sessions]} {gx_it_proxy[verbose]}"
 
+    def health_probe(self, attribs):
+        return ConnectProbe(tcp_address(attribs["gx_it_proxy"]["ip"], attribs["gx_it_proxy"]["port"]))
+
+    def resources(self, attribs):
+        return attribs["gx_it_proxy"].get("resources") or {}
+
 
 class GalaxyTUSDService(Service):
     service_type = "tusd"
     service_name = "tusd"
+    start_after = ("gunicorn", "unicornherder")
     command_template = "{tusd[tusd_path]} -host={tusd[host]} -port={tusd[port]} -upload-dir={tusd[upload_dir]}" \
                        " -hooks-http={galaxy_infrastructure_url}/api/upload/hooks" \
                        " -hooks-http-forward-headers=X-Api-Key,Cookie {tusd[extra_args]}"
 
+    def health_probe(self, attribs):
+        return ConnectProbe(tcp_address(attribs["tusd"]["host"], attribs["tusd"]["port"]))
+
+    def resources(self, attribs):
+        return attribs["tusd"].get("resources") or {}
+
 
 class GalaxyStandaloneService(Service):
     service_type = "standalone"
     service_name = "standalone"
+    graceful_method = GracefulMethod.ROLLING
+    start_after = ("gunicorn", "unicornherder", "celery")
     # FIXME: supervisor-specific
     command_template = "{virtualenv_bin}python ./lib/galaxy/main.py -c {galaxy_conf} --server-name={server_name}{attach_to_pool_opt}" \
                        " --pid-file={supervisor_state_dir}/{program_name}.pid"
 
+    def resources(self, attribs):
+        return self.get("resources") or {}
+
 
 class ConfigFile(AttributeDict):
     def __init__(self, *args, **kwargs):
@@ -147,17 +219,25 @@ class GravityState(AttributeDict):
     @classmethod
     def open(cls, name):
         try:
-            s = cls.loads(open(name).read())
+            with open(name) as fh:
+                s = cls.loads(fh.read())
         except (OSError, IOError) as exc:
-            if exc.errno == errno.ENOENT:
-                yaml.dump({}, open(name, "w"))
+            if exc.errno != errno.ENOENT:
+                raise
+            with state_lock(os.path.dirname(name)):
+                if os.path.exists(name):
+                    # created by another process since
+                    return cls.open(name)
                 s = cls()
+                s._name = name
+                s.save()
         s._name = name
         return s
 
     def __init__(self, *args, **kwargs):
         super(GravityState, self).__init__(*args, **kwargs)
         normalized_state = defaultdict(dict)
+        self._normalization_paths = []
         for key in ("config_files",):
             if key not in self:
                 self[key] = {}
@@ -167,6 +247,7 @@ class GravityState(AttributeDict):
                 if config_file.endswith(GALAXY_YML_SAMPLE_PATH):
                     root_dir = config_dict['attribs']['galaxy_root']
                     non_sample_path = os.path.join(root_dir, 'config', 'galaxy.yml')
+                    self._normalization_paths.append(non_sample_path)
                     if os.path.exists(non_sample_path):
                         config_file = non_sample_path
                 normalized_state[key][config_file] = ConfigFile(config_dict)
@@ -176,12 +257,270 @@ class GravityState(AttributeDict):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        with open(self._name, "w") as fh:
-            self.dump(fh)
+        if exc_type is None:
+            self.save()
+
+    def save(self):
+        """Atomically replace the state file with the current state."""
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{os.path.basename(self._name)}.", dir=os.path.dirname(self._name))
+        try:
+            with os.fdopen(fd, "w") as fh:
+                self.dump(fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_name, self._name)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
 
     def set_name(self, name):
         self._name = name
 
+    @property
+    def normalization_paths(self):
+        """Paths whose existence affected normalization of the loaded state"""
+        return self._normalization_paths
+
+
+# paths locked by the current thread with ``state_lock``
+_held_state_locks = threading.local()
+
+
+@contextlib.contextmanager
+def state_lock(path):
+    """Hold an exclusive lock on ``path`` (the state dir) for the duration of the context.
+
+    The lock is reentrant within a thread, so that e.g. the state file can be created while a transaction holds the lock.
+    """
+    path = os.path.realpath(path)
+    if not hasattr(_held_state_locks, "paths"):
+        _held_state_locks.paths = set()
+    held = _held_state_locks.paths
+    if path in held:
+        yield
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+    finally:
+        # closing the descriptor releases the lock
+        os.close(fd)
+
+
+class StateStore(object, metaclass=ABCMeta):
+    """Persistent storage backend for :class:`GravityState`"""
+    name = None
+    filename = None
+    # whether :meth:`load_config` and :meth:`load_instance_config` read less than :meth:`load`
+    partial_loads = False
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, self.filename)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @abstractmethod
+    def load(self):
+        """Return the persisted state as a :class:`GravityState`"""
+
+    def load_config(self, path):
+        """Return the registered config ``path`` as a :class:`ConfigFile`, or ``None`` if it is not registered"""
+        return self.load().config_files.get(path)
+
+    def load_instance_config(self, instance_name):
+        """Return the first registered config of the instance ``instance_name``, or ``None`` if there is none"""
+        for config in self.load().config_files.values():
+            if config["instance_name"] == instance_name:
+                return config
+        return None
+
+    @abstractmethod
+    def save(self, state):
+        """Persist ``state``, which should have been returned by :meth:`load`"""
+
+    @abstractmethod
+    def signature(self):
+        """Return a value that changes whenever the persisted state is changed by another process"""
+
+    @abstractmethod
+    def remove(self):
+        """Remove the persisted state"""
+
+
+class YAMLStateStore(StateStore):
+    """Store the state in a single YAML file that is rewritten in full on every change"""
+    name = "yaml"
+    filename = "configstate.yaml"
+
+    def load(self):
+        return GravityState.open(self.path)
+
+    def save(self, state):
+        state.set_name(self.path)
+        state.save()
+
+    def signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+    def remove(self):
+        os.unlink(self.path)
+
+
+class SQLiteStateStore(StateStore):
+    """Store the state in a SQLite database in WAL mode with a row per config and per service
+
+    Only the configs and services that differ from the state as it was loaded are written on save, and a single config and
+    its services can be read without reading the rest of the state.
+    """
+    name = "sqlite"
+    filename = "configstate.sqlite"
+    partial_loads = True
+    schema = """
+        CREATE TABLE IF NOT EXISTS config_files (
+            section TEXT NOT NULL,
+            path TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (section, path)
+        );
+        CREATE TABLE IF NOT EXISTS services (
+            section TEXT NOT NULL,
+            path TEXT NOT NULL,
+            config_type TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            service_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (section, path, config_type, service_type, service_name)
+        );
+    """
+    # top-level state keys containing configs
+    sections = ("config_files", "remove_configs")
+
+    def __init__(self, state_dir):
+        super(SQLiteStateStore, self).__init__(state_dir)
+        self.__connection = None
+        # the rows as last loaded or saved over each connection, so that only changes need to be written on save
+        self.__rows = {}
+
+    @property
+    def connection(self):
+        if self.__connection is None:
+            # autocommit mode, transactions are started explicitly on save
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.schema)
+            self.__connection = connection
+        return self.__connection
+
+    @staticmethod
+    def _dumps(d):
+        return json.dumps({k: v for k, v in d.items() if not k.startswith("_")}, sort_keys=True)
+
+    def _rows(self, state):
+        """Flatten ``state`` to dicts of serialized config and service rows keyed by primary key"""
+        config_rows = {}
+        service_rows = {}
+        for section in self.sections:
+            for path, config in (state.get(section) or {}).items():
+                config_data = {k: v for k, v in config.items() if k != "services"}
+                config_rows[(section, path)] = self._dumps(config_data)
+                for position, service in enumerate(config.get("services") or []):
+                    key = (section, path, service["config_type"], service["service_type"], service["service_name"])
+                    service_rows[key] = (position, self._dumps(service))
+        return config_rows, service_rows
+
+    def load(self):
+        state = {"config_files": {}}
+        config_rows = {}
+        service_rows = {}
+        for section, path, data in self.connection.execute("SELECT section, path, data FROM config_files"):
+            config_rows[(section, path)] = data
+            config = json.loads(data)
+            config["services"] = []
+            state.setdefault(section, {})[path] = config
+        query = "SELECT section, path, config_type, service_type, service_name, position, data FROM services ORDER BY position"
+        for section, path, config_type, service_type, service_name, position, data in self.connection.execute(query):
+            service_rows[(section, path, config_type, service_type, service_name)] = (position, data)
+            state[section][path]["services"].append(json.loads(data))
+        self.__rows[self.connection] = (config_rows, service_rows)
+        return GravityState(state)
+
+    def load_config(self, path):
+        row = self.connection.execute("SELECT data FROM config_files WHERE section = 'config_files' AND path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        return self.__config(path, json.loads(row[0]))
+
+    def load_instance_config(self, instance_name):
+        # config rows are small, the services of only the matching config are read
+        for path, data in self.connection.execute("SELECT path, data FROM config_files WHERE section = 'config_files'"):
+            config = json.loads(data)
+            if config["instance_name"] == instance_name:
+                return self.__config(path, config)
+        return None
+
+    def __config(self, path, config):
+        query = "SELECT data FROM services WHERE section = 'config_files' AND path = ? ORDER BY position"
+        config["services"] = [json.loads(data) for (data,) in self.connection.execute(query, (path,))]
+        return ConfigFile(config)
+
+    def save(self, state):
+        connection = self.connection
+        old_config_rows, old_service_rows = self.__rows.get(connection, ({}, {}))
+        config_rows, service_rows = self._rows(state)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for key in old_config_rows.keys() - config_rows.keys():
+                connection.execute("DELETE FROM config_files WHERE section = ? AND path = ?", key)
+            for key in old_service_rows.keys() - service_rows.keys():
+                connection.execute(
+                    "DELETE FROM services WHERE section = ? AND path = ? AND config_type = ? AND service_type = ? AND service_name = ?", key)
+            connection.executemany(
+                "INSERT OR REPLACE INTO config_files (section, path, data) VALUES (?, ?, ?)",
+                [key + (data,) for key, data in config_rows.items() if old_config_rows.get(key) != data])
+            connection.executemany(
+                "INSERT OR REPLACE INTO services (section, path, config_type, service_type, service_name, position, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [key + row for key, row in service_rows.items() if old_service_rows.get(key) != row])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self.__rows[connection] = (config_rows, service_rows)
+
+    def signature(self):
+        if not self.exists():
+            return None
+        # changes when any other connection commits to the database
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def remove(self):
+        if self.__connection is not None:
+            self.__rows.pop(self.__connection, None)
+            self.__connection.close()
+            self.__connection = None
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+
+def state_store_for_backend(backend):
+    try:
+        return STATE_STORE_CLASS_MAP[backend]
+    except KeyError:
+        raise RuntimeError(f"Unknown state backend: {backend}")
+
 
 def service_for_service_type(service_type):
     try:
@@ -190,6 +529,12 @@ def service_for_service_type(service_type):
         raise RuntimeError(f"Unknown service type: {service_type}")
 
 
+STATE_STORE_CLASS_MAP = {
+    "yaml": YAMLStateStore,
+    "sqlite": SQLiteStateStore,
+}
+DEFAULT_STATE_BACKEND = "yaml"
+
 # TODO: better to pull this from __class__.service_type
 SERVICE_CLASS_MAP = {
     "gunicorn": GalaxyGunicornService,
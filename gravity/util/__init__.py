@@ -4,29 +4,36 @@ import collections.abc
 import copy
 import os
 import sys
+import tempfile
+import time
 
-import jsonref
-import ruamel.yaml
 import yaml
-from gravity.settings import Settings
 
 
 class SafeLoaderWithInclude(yaml.SafeLoader):
-    def __init__(self, stream):
+    def __init__(self, stream, on_include=None):
         self.__config_dir = os.path.dirname(stream.name)
+        self.__on_include = on_include
         super().__init__(stream)
 
     def include(self, node):
         included = os.path.join(self.__config_dir, self.construct_scalar(node))
+        if self.__on_include:
+            self.__on_include(included)
         with open(included) as fh:
-            return yaml.load(fh, SafeLoaderWithInclude)
+            return yaml_safe_load_with_include(fh, on_include=self.__on_include)
 
 
 SafeLoaderWithInclude.add_constructor('!include', SafeLoaderWithInclude.include)
 
 
-def yaml_safe_load_with_include(stream):
-    return yaml.load(stream, SafeLoaderWithInclude)
+def yaml_safe_load_with_include(stream, on_include=None):
+    """Load YAML from ``stream``, calling ``on_include`` with the path of each ``!include``d file before it is read."""
+    loader = SafeLoaderWithInclude(stream, on_include=on_include)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
 
 
 class AttributeDict(dict):
@@ -44,11 +51,6 @@ class AttributeDict(dict):
                 d[k] = node[k]
         return representer.represent_mapping(cls.yaml_tag, d)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._yaml = ruamel.yaml.YAML()
-        self._yaml.register_class(self.__class__)
-
     def __eq__(self, other):
         return all([other[k] == v for k, v in self.items() if not k.startswith("_")])
 
@@ -62,7 +64,13 @@ class AttributeDict(dict):
             raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
 
     def dump(self, fp, *args, **kwargs):
-        self._yaml.dump(self, fp)
+        # the dumper is created on demand, constructing one for every (nested) instance is expensive, and ruamel.yaml is
+        # only imported when it is needed
+        import ruamel.yaml
+
+        _yaml = ruamel.yaml.YAML()
+        _yaml.representer.add_multi_representer(AttributeDict, AttributeDict.to_yaml)
+        _yaml.dump(self, fp)
 
 
 def recursive_update(to_update, update_from):
@@ -90,7 +98,56 @@ def which(file):
     return None
 
 
+def wait_for(condition, timeout, initial_delay=0.001, max_delay=0.25):
+    """Call ``condition`` until it returns a true value or ``timeout`` seconds have passed.
+
+    The delay between calls starts at ``initial_delay`` and doubles up to ``max_delay``, so that conditions which are met
+    quickly are detected quickly without busy-waiting on those that aren't. Returns the last value returned by
+    ``condition``.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        rval = condition()
+        remaining = deadline - time.monotonic()
+        if rval or remaining <= 0:
+            return rval
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def write_if_changed(path, contents, force=False):
+    """Write ``contents`` to the file ``path``, unless it already contains them and ``force`` is not set. Returns whether
+    the file was written.
+
+    The contents are written to a temporary file in the same directory that is then renamed over ``path``, so that
+    readers never see a partially written file. A replaced file keeps its permissions.
+    """
+    mode = 0o644
+    try:
+        with open(path) as fh:
+            if not force and fh.read() == contents:
+                return False
+            mode = os.fstat(fh.fileno()).st_mode & 0o7777
+    except FileNotFoundError:
+        pass
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(contents)
+            os.fchmod(fh.fileno(), mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return True
+
+
 def settings_to_sample():
+    # only needed to generate the sample config, and slow to import
+    import jsonref
+    from gravity.settings import Settings
+
     schema = Settings.schema_json()
     # expand schema for easier processing
     data = jsonref.loads(schema)
@@ -116,8 +173,9 @@ def process_property(key, value, depth=0):
     description = "\n".join(f"{extra_white_space}# {desc}" for desc in value["description"].strip().split("\n"))
     allOff = value.get("allOf", [])
     if allOff and allOff[0].get("properties"):
-        # we've got a nested map, add key once
-        description = f"{description}\n{extra_white_space}{key}:\n"
+        # we've got a nested map, add key once (commented if it's within a section, so that the section's defaults apply)
+        nested_comment = "# " if depth > 1 else ""
+        description = f"{description}\n{extra_white_space}{nested_comment}{key}:\n"
     for item in allOff:
         if "enum" in item:
             description = f'{description}\n{extra_white_space}# Valid options are: {", ".join(item["enum"])}'
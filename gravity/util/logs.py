@@ -0,0 +1,496 @@
+""" Following and searching service log files
+"""
+import collections
+import ctypes
+import ctypes.util
+import heapq
+import mmap
+import os
+import re
+import select
+import struct
+import time
+from datetime import datetime, timedelta
+
+import click
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+READ_SIZE = 1024 * 1024
+TIMESTAMP_RE = re.compile(rb"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})")
+SINCE_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+SINCE_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+# the ISO 8601 forms accepted by ``parse_since`` (as ``datetime.fromisoformat`` would, which is not available on Python 3.6)
+ISO_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f")
+
+
+def parse_since(value, now=None):
+    """Parse ``value``, either a duration like ``30s``, ``10m``, ``2h`` or ``1d`` before ``now``, or an ISO 8601 date
+    and time, into a :class:`datetime.datetime`.
+    """
+    match = SINCE_RE.match(value.strip())
+    if match:
+        now = now or datetime.now()
+        return now - timedelta(**{SINCE_UNITS[match.group(2)]: float(match.group(1))})
+    value = value.strip()
+    # the date and time may be separated by a space rather than a T
+    if value[10:11] == " ":
+        value = f"{value[:10]}T{value[11:]}"
+    for fmt in ISO_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid duration or ISO 8601 date and time: {value}")
+
+
+def line_time(line):
+    """Return the first timestamp in the log line ``line`` (bytes), or ``None`` if it doesn't have one"""
+    match = TIMESTAMP_RE.search(line)
+    if match:
+        try:
+            return datetime.strptime(f"{match.group(1).decode()} {match.group(2).decode()}", "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    return None
+
+
+def decode_line(line):
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+def _line_start(mm, offset):
+    """Return the offset of the first line starting at or after ``offset``"""
+    if offset <= 0:
+        return 0
+    eol = mm.find(b"\n", offset - 1)
+    return len(mm) if eol == -1 else eol + 1
+
+
+def _next_timestamp(mm, offset, end):
+    """Return the timestamp and offset of the first line with a timestamp starting at or after ``offset`` and before
+    ``end``, or ``(None, end)`` if there isn't one
+    """
+    pos = _line_start(mm, offset)
+    while pos < end:
+        eol = mm.find(b"\n", pos)
+        eol = len(mm) if eol == -1 else eol
+        timestamp = line_time(mm[pos:eol])
+        if timestamp is not None:
+            return timestamp, pos
+        pos = eol + 1
+    return None, end
+
+
+def timestamp_offset(mm, predicate):
+    """Binary search the memory mapped log ``mm`` for the offset of the first line with a timestamp for which
+    ``predicate`` is true, assuming that timestamps are ascending. Returns ``len(mm)`` if there is no such line.
+
+    Lines without timestamps (e.g. tracebacks) belong to the preceding line with a timestamp, so are never the result.
+    """
+    lo, hi = 0, len(mm)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        timestamp, pos = _next_timestamp(mm, mid, hi)
+        if timestamp is None or predicate(timestamp):
+            hi = mid
+        else:
+            lo = pos + 1
+    timestamp, pos = _next_timestamp(mm, lo, len(mm))
+    return pos if timestamp is not None and predicate(timestamp) else len(mm)
+
+
+class LogFile(object):
+    """A memory mapped log file that can be read forwards or backwards from any offset, in records consisting of a line
+    with a timestamp and any lines without timestamps that follow it
+    """
+
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path
+        self.mm = None
+        try:
+            with open(path, "rb") as fh:
+                self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # missing or empty
+            pass
+
+    def __len__(self):
+        return len(self.mm) if self.mm is not None else 0
+
+    def offset(self, predicate):
+        return timestamp_offset(self.mm, predicate) if self.mm is not None else 0
+
+    def records(self, start, end):
+        """Generate ``(timestamp, lines)`` records between the offsets ``start`` and ``end``, in order. Lines before the
+        first line with a timestamp have a timestamp of ``datetime.min``.
+        """
+        timestamp = datetime.min
+        lines = []
+        pos = start
+        while pos < end:
+            eol = self.mm.find(b"\n", pos, end)
+            eol = end if eol == -1 else eol
+            line = self.mm[pos:eol]
+            line_timestamp = line_time(line)
+            if line_timestamp is not None:
+                if lines:
+                    yield timestamp, lines
+                timestamp, lines = line_timestamp, []
+            lines.append(line)
+            pos = eol + 1
+        if lines:
+            yield timestamp, lines
+
+    def records_reversed(self, start, end):
+        """Generate ``(timestamp, lines)`` records between the offsets ``start`` and ``end``, from last to first"""
+        lines = []
+        eol = end - 1 if end > start and self.mm[end - 1:end] == b"\n" else end
+        while eol > start:
+            pos = self.mm.rfind(b"\n", start, eol) + 1 or start
+            line = self.mm[pos:eol]
+            lines.append(line)
+            line_timestamp = line_time(line)
+            if line_timestamp is not None:
+                yield line_timestamp, lines[::-1]
+                lines = []
+            eol = pos - 1
+        if lines:
+            yield datetime.min, lines[::-1]
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+def _labeled(label, records):
+    for timestamp, lines in records:
+        yield timestamp, label, lines
+
+
+def search_logs(log_files, since=None, until=None, grep=None, lines=None):
+    """Generate the lines of ``log_files`` (a dict of label to path) logged between ``since`` and ``until``, merged in
+    timestamp order and prefixed with their labels.
+
+    The window of each log is found by binary search, so the time taken is proportional to the size of the window
+    rather than of the logs. If ``lines`` is set, only the last ``lines`` lines are output, and each log is read
+    backwards from the end of its window until that many lines matching ``grep`` are found.
+    """
+    grep = re.compile(grep.encode("utf-8")) if grep else None
+    width = max([len(label) for label in log_files] + [0])
+    files = [LogFile(label, path) for label, path in log_files.items()]
+    try:
+        streams = []
+        for f in files:
+            start = f.offset(lambda t: t >= since) if since else 0
+            end = f.offset(lambda t: t > until) if until else len(f)
+            if lines is None:
+                records = f.records(start, end)
+            else:
+                records = []
+                matched = 0
+                for record in f.records_reversed(start, end):
+                    records.append(record)
+                    matched += sum(1 for line in record[1] if grep is None or grep.search(line))
+                    if matched >= lines:
+                        break
+                records.reverse()
+            streams.append(_labeled(f.label, records))
+        output = collections.deque(maxlen=lines)
+        for timestamp, label, record_lines in heapq.merge(*streams, key=lambda record: record[0]):
+            for line in record_lines:
+                if grep is None or grep.search(line):
+                    line = f"{label:<{width}} | {decode_line(line)}"
+                    if lines is None:
+                        yield line
+                    else:
+                        output.append(line)
+        yield from output
+    finally:
+        for f in files:
+            f.close()
+
+
+class Inotify(object):
+    """Minimal ctypes binding of inotify(7), raises :class:`OSError` if it is unavailable"""
+
+    def __init__(self):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            inotify_init1 = self.libc.inotify_init1
+        except AttributeError as exc:
+            raise OSError(f"inotify is unavailable: {exc}")
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read(self, timeout):
+        """Wait up to ``timeout`` seconds for events, returning a list of ``(wd, mask, name)`` tuples"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            events.append((wd, mask, os.fsdecode(data[offset:offset + length].rstrip(b"\0"))))
+            offset += length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FollowedFile(object):
+    """A log file being followed, which may be truncated, rotated, removed or not exist yet"""
+
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path
+        self.fh = None
+        self.ino = None
+        self.partial = b""
+        # whether the lines being read are from after the --since time
+        self.after_since = False
+        # rate limiting state
+        self.window = None
+        self.count = 0
+        self.suppressed = 0
+
+    def __open(self, st):
+        self.fh = open(self.path, "rb")
+        self.ino = st.st_ino
+
+    def __close(self):
+        self.fh.close()
+        self.fh = None
+        if self.partial:
+            # the last line of a rotated file
+            return [self.__pop_partial()]
+        return []
+
+    def __pop_partial(self):
+        partial, self.partial = self.partial, b""
+        return partial
+
+    def __read(self):
+        lines = []
+        while True:
+            data = self.fh.read(READ_SIZE)
+            if not data:
+                return lines
+            lines.extend((self.partial + data).split(b"\n"))
+            self.partial = lines.pop()
+
+    def open_at(self, lines=None, since=None):
+        """Open the file, positioned to read the last ``lines`` lines, or from the first line logged at or after
+        ``since``, or from the start if neither is set
+        """
+        try:
+            st = os.stat(self.path)
+            self.__open(st)
+        except OSError:
+            return []
+        if since is not None:
+            log_file = LogFile(self.label, self.path)
+            try:
+                self.fh.seek(log_file.offset(lambda t: t >= since))
+            finally:
+                log_file.close()
+        elif lines is not None:
+            self.fh.seek(self.__tail_offset(st.st_size, lines))
+        return self.__read()
+
+    def __tail_offset(self, size, lines):
+        # read backwards from the end until lines + 1 newlines (the last of which may terminate the last line) are found
+        if lines == 0:
+            return size
+        offset = size
+        newlines = 0
+        while offset > 0:
+            chunk_size = min(8192, offset)
+            offset -= chunk_size
+            self.fh.seek(offset)
+            chunk = self.fh.read(chunk_size)
+            if offset + chunk_size == size and chunk.endswith(b"\n"):
+                chunk = chunk[:-1]
+            newlines += chunk.count(b"\n")
+            if newlines >= lines:
+                for _ in range(newlines - lines + 1):
+                    index = chunk.index(b"\n")
+                    offset += index + 1
+                    chunk = chunk[index + 1:]
+                return offset
+        return 0
+
+    def read_lines(self):
+        """Return any complete lines written since the last read, following rotation and truncation"""
+        lines = []
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            st = None
+        if self.fh is not None:
+            if st is None or st.st_ino != self.ino:
+                # rotated or removed: finish reading the old file before opening the new one, if any
+                lines.extend(self.__read())
+                lines.extend(self.__close())
+            elif st.st_size < self.fh.tell():
+                # truncated
+                self.fh.seek(0)
+                self.partial = b""
+        if self.fh is None and st is not None:
+            try:
+                self.__open(st)
+            except OSError:
+                return lines
+        if self.fh is not None:
+            lines.extend(self.__read())
+        return lines
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class LogFollower(object):
+    """Follow any number of log files in a single process, prefixing each line with the label of its file.
+
+    Files are watched with inotify where available, otherwise they are polled every ``poll_interval`` seconds. Lines can
+    be filtered by the regular expression ``grep`` and by timestamp (lines are assumed to be from at or after ``since``
+    once a line with a timestamp at or after ``since`` has been seen), and limited to ``rate`` lines per second per file.
+    """
+
+    def __init__(self, log_files, grep=None, since=None, rate=None, poll_interval=0.5):
+        self.files = [FollowedFile(label, path) for label, path in log_files.items()]
+        self.grep = re.compile(grep.encode("utf-8")) if grep else None
+        self.since = since
+        self.rate = rate
+        self.poll_interval = poll_interval
+        self.width = max([len(f.label) for f in self.files] + [0])
+        self.inotify = None
+        self.watches = {}
+        self.files_by_path = {}
+        for f in self.files:
+            self.files_by_path.setdefault(f.path, []).append(f)
+
+    def __watch(self):
+        try:
+            self.inotify = Inotify()
+            for log_dir in sorted(set(os.path.dirname(f.path) for f in self.files)):
+                # watching the directory rather than the file catches rotation and creation with a single watch per directory
+                self.watches[self.inotify.add_watch(log_dir, INOTIFY_WATCH_MASK)] = log_dir
+        except OSError:
+            if self.inotify is not None:
+                self.inotify.close()
+            self.inotify = None
+            self.watches = {}
+
+    def start(self, lines=10):
+        """Start following, returning the output for the last ``lines`` lines of each file (or all lines since
+        ``since``)
+        """
+        self.__watch()
+        output = []
+        for f in self.files:
+            output.extend(self.__filter(f, f.open_at(lines=lines, since=self.since)))
+        return output
+
+    def poll(self, timeout=None):
+        """Wait up to ``timeout`` seconds (default ``poll_interval``) for files to change, returning the new output"""
+        timeout = self.poll_interval if timeout is None else timeout
+        if self.inotify is not None:
+            changed = []
+            for wd, mask, name in self.inotify.read(timeout):
+                if mask & IN_Q_OVERFLOW:
+                    changed = self.files
+                    break
+                for f in self.files_by_path.get(os.path.join(self.watches.get(wd, ""), name), []):
+                    if f not in changed:
+                        changed.append(f)
+        else:
+            time.sleep(timeout)
+            changed = self.files
+        output = []
+        for f in changed:
+            output.extend(self.__filter(f, f.read_lines()))
+        output.extend(self.__flush_suppressed())
+        return output
+
+    def __format(self, f, line):
+        return f"{f.label:<{self.width}} | {line}"
+
+    def __filter(self, f, lines):
+        output = []
+        for line in lines:
+            if self.since is not None and not f.after_since:
+                timestamp = line_time(line)
+                if timestamp is None or timestamp < self.since:
+                    continue
+                f.after_since = True
+            if self.grep is not None and not self.grep.search(line):
+                continue
+            if self.rate is not None:
+                window = int(time.monotonic())
+                if window != f.window:
+                    output.extend(self.__flush_suppressed(f))
+                    f.window = window
+                    f.count = 0
+                if f.count >= self.rate:
+                    f.suppressed += 1
+                    continue
+                f.count += 1
+            output.append(self.__format(f, decode_line(line)))
+        return output
+
+    def __flush_suppressed(self, only=None):
+        # report lines suppressed in windows that have ended, or in the current window of ``only``
+        output = []
+        window = int(time.monotonic())
+        for f in [only] if only is not None else self.files:
+            if f.suppressed and (f is only or f.window != window):
+                output.append(self.__format(f, f"[{f.suppressed} lines suppressed]"))
+                f.suppressed = 0
+        return output
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def follow(self, lines=10, output=click.echo):
+        """Output the last ``lines`` lines of each file and then follow them until interrupted"""
+        try:
+            out = self.start(lines=lines)
+            while True:
+                if out:
+                    output("\n".join(out))
+                out = self.poll()
+        finally:
+            self.close()
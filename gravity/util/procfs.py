@@ -0,0 +1,91 @@
+""" Resource usage of process trees, read from /proc
+"""
+import os
+
+PROC_DIR = "/proc"
+
+
+def _sysconf(name, default):
+    try:
+        return os.sysconf(name)
+    except (AttributeError, ValueError, OSError):
+        return default
+
+
+CLOCK_TICKS = _sysconf("SC_CLK_TCK", 100)
+PAGE_SIZE = _sysconf("SC_PAGE_SIZE", 4096)
+
+
+def _read_stat(pid):
+    """Return the ``(ppid, cpu_time, threads, rss)`` of ``pid`` from ``/proc/<pid>/stat``"""
+    with open(os.path.join(PROC_DIR, str(pid), "stat"), "rb") as fh:
+        stat = fh.read()
+    # the command name is in parentheses and may itself contain spaces and parentheses
+    fields = stat[stat.rindex(b")") + 2:].split()
+    # field numbers as documented in proc(5), offset by the pid and comm fields
+    ppid = int(fields[1])
+    cpu_time = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    threads = int(fields[17])
+    rss = int(fields[21]) * PAGE_SIZE
+    return ppid, cpu_time, threads, rss
+
+
+def _read_pss(pid):
+    """Return the proportional set size of ``pid`` in bytes, or ``None`` if it can't be read"""
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "smaps_rollup"), "rb") as fh:
+            for line in fh:
+                if line.startswith(b"Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def process_table():
+    """Return ``{pid: (ppid, cpu_time, threads, rss)}`` for every process, in a single pass over ``/proc``"""
+    table = {}
+    try:
+        entries = os.listdir(PROC_DIR)
+    except OSError:
+        return table
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            table[int(entry)] = _read_stat(entry)
+        except (OSError, ValueError, IndexError):
+            # exited since the listing, or not readable
+            continue
+    return table
+
+
+def process_tree_usage(pids):
+    """Return the resource usage of each of ``pids`` and all of their descendants.
+
+    The result is a dict keyed by pid, whose values are dicts of the total ``rss``, ``pss`` (``None`` if unavailable for
+    any process in the tree) and ``cpu_time`` (user + system seconds) of the tree, its number of ``threads`` and number
+    of ``processes``. Pids that do not exist are omitted.
+    """
+    table = process_table()
+    children = {}
+    for pid, (ppid, _, _, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    usage = {}
+    for root in pids:
+        if root not in table:
+            continue
+        tree = {"rss": 0, "pss": 0, "cpu_time": 0.0, "threads": 0, "processes": 0}
+        stack = [root]
+        while stack:
+            pid = stack.pop()
+            _, cpu_time, threads, rss = table[pid]
+            pss = _read_pss(pid)
+            tree["rss"] += rss
+            tree["pss"] = None if pss is None or tree["pss"] is None else tree["pss"] + pss
+            tree["cpu_time"] += cpu_time
+            tree["threads"] += threads
+            tree["processes"] += 1
+            stack.extend(children.get(pid, []))
+        usage[root] = tree
+    return usage
@@ -0,0 +1,129 @@
+""" Effective CPU and memory limits of the host or container, for automatically sizing services
+"""
+import collections
+import functools
+import math
+import os
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PROC_SELF_CGROUP = "/proc/self/cgroup"
+# cgroup v1 memory limits at or above this are effectively unlimited
+CGROUP_V1_UNLIMITED = 2 ** 62
+
+Sizing = collections.namedtuple("Sizing", ["per_cpu", "extra", "memory_share", "process_memory"])
+
+# for each kind of automatically sized service: the number of processes per CPU, processes added to that, the share of
+# memory available to the service and the estimated memory used by each process (or, for celery, each pool worker)
+AUTO_SIZING = {
+    "gunicorn": Sizing(per_cpu=2, extra=1, memory_share=0.5, process_memory=1024 ** 3),
+    "celery": Sizing(per_cpu=2, extra=0, memory_share=0.2, process_memory=256 * 1024 ** 2),
+    "handlers": Sizing(per_cpu=0.5, extra=0, memory_share=0.3, process_memory=1024 ** 3),
+}
+
+
+def _cgroup_paths():
+    """Return a dict of the cgroup path of this process in each hierarchy, keyed by controller (``""`` for v2)"""
+    paths = {}
+    try:
+        with open(PROC_SELF_CGROUP) as fh:
+            for line in fh:
+                _, controllers, path = line.rstrip("\n").split(":", 2)
+                for controller in controllers.split(","):
+                    paths[controller] = path
+    except (OSError, ValueError):
+        pass
+    return paths
+
+
+def _cgroup_dirs(mount, path):
+    """Yield the directories of cgroup ``path`` and each of its ancestors that are visible under ``mount``"""
+    parts = [part for part in path.split("/") if part]
+    for i in range(len(parts), -1, -1):
+        cgroup_dir = os.path.join(mount, *parts[:i])
+        if os.path.isdir(cgroup_dir):
+            yield cgroup_dir
+
+
+def _read_fields(path):
+    try:
+        with open(path) as fh:
+            return fh.read().split()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(paths=None):
+    """Return the CPU quota of this process's cgroup and its ancestors in CPUs, or ``None`` if there is no quota"""
+    paths = _cgroup_paths() if paths is None else paths
+    limits = []
+    if "" in paths:
+        for cgroup_dir in _cgroup_dirs(CGROUP_ROOT, paths[""]):
+            fields = _read_fields(os.path.join(cgroup_dir, "cpu.max"))
+            if fields and fields[0] != "max":
+                limits.append(int(fields[0]) / int(fields[1]))
+    if not limits and "cpu" in paths:
+        for cgroup_dir in _cgroup_dirs(os.path.join(CGROUP_ROOT, "cpu"), paths["cpu"]):
+            quota = _read_fields(os.path.join(cgroup_dir, "cpu.cfs_quota_us"))
+            period = _read_fields(os.path.join(cgroup_dir, "cpu.cfs_period_us"))
+            if quota and period and int(quota[0]) > 0:
+                limits.append(int(quota[0]) / int(period[0]))
+    return min(limits) if limits else None
+
+
+def cgroup_memory_limit(paths=None):
+    """Return the memory limit of this process's cgroup and its ancestors in bytes, or ``None`` if there is no limit"""
+    paths = _cgroup_paths() if paths is None else paths
+    limits = []
+    if "" in paths:
+        for cgroup_dir in _cgroup_dirs(CGROUP_ROOT, paths[""]):
+            fields = _read_fields(os.path.join(cgroup_dir, "memory.max"))
+            if fields and fields[0] != "max":
+                limits.append(int(fields[0]))
+    if not limits and "memory" in paths:
+        for cgroup_dir in _cgroup_dirs(os.path.join(CGROUP_ROOT, "memory"), paths["memory"]):
+            fields = _read_fields(os.path.join(cgroup_dir, "memory.limit_in_bytes"))
+            if fields and int(fields[0]) < CGROUP_V1_UNLIMITED:
+                limits.append(int(fields[0]))
+    return min(limits) if limits else None
+
+
+def cpu_count():
+    """Return the number of CPUs available to this process, the lesser of its CPU affinity and its cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    return min(cpus, quota) if quota else cpus
+
+
+def memory_limit():
+    """Return the memory available to this process in bytes, the lesser of physical memory and its cgroup limit"""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        memory = None
+    limit = cgroup_memory_limit()
+    if memory is None or (limit is not None and limit < memory):
+        memory = limit
+    return memory
+
+
+@functools.lru_cache(maxsize=None)
+def host_resources():
+    """Return a tuple of the CPUs and memory (``None`` if unknown) available to this process.
+
+    Determined once per process, as it reads from cgroup and sysfs files.
+    """
+    return cpu_count(), memory_limit()
+
+
+def auto_size(kind, cpus, memory, share=1.0):
+    """Return the number of processes of ``kind`` (a key of ``AUTO_SIZING``) to run with ``cpus`` CPUs and ``memory``
+    bytes of memory available, of which the service gets ``share`` of its usual share. At least 1 is returned.
+    """
+    sizing = AUTO_SIZING[kind]
+    size = math.floor(cpus * sizing.per_cpu * share) + sizing.extra
+    if memory is not None:
+        size = min(size, int(memory * sizing.memory_share * share // sizing.process_memory))
+    return max(1, size)
@@ -37,10 +37,12 @@ setup(
     keywords="gravity galaxy",
     python_requires=">=3.6",
     install_requires=["Click", "supervisor", "pyyaml", "ruamel.yaml", "pydantic", "jsonref"],
-    entry_points={"console_scripts": [
-        "galaxy = gravity.cli:galaxy",
-        "galaxyctl = gravity.cli:galaxyctl",
-    ]},
+    entry_points={
+        "console_scripts": [
+            "galaxy = gravity.cli:galaxy",
+            "galaxyctl = gravity.cli:galaxyctl",
+        ],
+    },
     classifiers=[
         "Intended Audience :: System Administrators",
         "License :: OSI Approved :: MIT License",
@@ -66,7 +66,13 @@ def state_dir():
             os.kill(int(open(os.path.join(directory, 'supervisor', 'supervisord.pid')).read()), signal.SIGTERM)
         except Exception:
             pass
-        shutil.rmtree(directory)
+        shutil.rmtree(directory, onerror=_ignore_missing)
+
+
+def _ignore_missing(function, path, excinfo):
+    # supervisord may still be removing its pid file and socket as it exits
+    if not issubclass(excinfo[0], FileNotFoundError):
+        raise excinfo[1]
 
 
 @pytest.fixture
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from gravity import process_manager
+from gravity.process_manager import asyncio_manager
+from gravity.state import GracefulMethod
+
+
+class FakeService(dict):
+    graceful_method = GracefulMethod.DEFAULT
+
+
+def _spec(name, script, stop_timeout=5):
+    return asyncio_manager.ServiceSpec(
+        name=name,
+        instance_name='_default_',
+        service=FakeService(),
+        args=[sys.executable, '-c', script],
+        cwd=None,
+        env=None,
+        umask='022',
+        stop_timeout=stop_timeout,
+    )
+
+
+def _run(runner, after=None, action=None):
+    loop = asyncio.new_event_loop()
+    try:
+        if after is not None:
+            loop.call_later(after, action or runner.shutdown)
+        return loop.run_until_complete(runner.run())
+    finally:
+        loop.close()
+
+
+def test_process_manager_class():
+    assert process_manager.process_manager_class('asyncio') is asyncio_manager.AsyncioProcessManager
+
+
+def test_runner_output_and_shutdown(tmp_path):
+    lines = []
+    status_file = tmp_path / 'status.json'
+    runner = asyncio_manager.ServiceRunner(
+        [
+            _spec('web', "import time; print('serving', flush=True); time.sleep(60)"),
+            # ignores SIGTERM, so it is killed once its stop timeout expires
+            _spec('worker', "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('working', flush=True); time.sleep(60)",
+                  stop_timeout=0.5),
+        ],
+        output=lines.append,
+        status_file=str(status_file),
+    )
+    assert _run(runner, after=1) == 0
+    assert 'web    | serving' in lines
+    assert 'worker | working' in lines
+    status = json.loads(status_file.read_text())
+    assert status['pid'] is None
+    assert [(service['name'], service['state']) for service in status['services']] == [('web', 'STOPPED'), ('worker', 'STOPPED')]
+    assert status['services'][0]['exit_status'] == -15
+    assert status['services'][1]['exit_status'] == -9
+
+
+def test_runner_restart_backoff(monkeypatch):
+    monkeypatch.setattr(asyncio_manager, 'RESTART_BACKOFF_INITIAL', 0.01)
+    monkeypatch.setattr(asyncio_manager, 'START_RETRIES', 2)
+    lines = []
+    runner = asyncio_manager.ServiceRunner([_spec('crashy', "print('crashing'); raise SystemExit(3)")], output=lines.append)
+    # the runner exits with an error once all services have failed
+    assert _run(runner) == 1
+    # started once and then restarted START_RETRIES times
+    assert lines == ['crashy | crashing'] * 3
+    assert runner.processes['crashy'].state == 'FATAL'
+    assert runner.processes['crashy'].exit_status == 3
+
+
+def test_runner_graceful_restart():
+    lines = []
+    runner = asyncio_manager.ServiceRunner([_spec('web', "import time; print('started', flush=True); time.sleep(60)")], output=lines.append)
+
+    def graceful():
+        runner.graceful()
+        runner.loop.call_later(1, runner.shutdown)
+
+    assert _run(runner, after=0.5, action=graceful) == 0
+    assert lines == ['web | started'] * 2
+
+
+def test_runner_restart():
+    lines = []
+    runner = asyncio_manager.ServiceRunner([_spec('web', "import time; print('started', flush=True); time.sleep(60)")], output=lines.append)
+
+    def restart():
+        runner.restart()
+        runner.loop.call_later(1, runner.shutdown)
+
+    assert _run(runner, after=0.5, action=restart) == 0
+    assert lines == ['web | started'] * 2
+    # stopped and started again, rather than reloaded
+    assert runner.processes['web'].exit_status == -15
+
+
+def test_runner_reap_orphans():
+    runner = asyncio_manager.ServiceRunner([_spec('web', 'pass'), _spec('worker', 'pass')], output=None)
+    runner.reap_orphans = True
+    runner.loop = asyncio.new_event_loop()
+    try:
+        for proc in runner.processes.values():
+            runner._spawn(proc)
+        # started after the services, so waitid finds the exited services first
+        orphan = subprocess.Popen([sys.executable, '-c', 'pass'])
+        for pid in [proc.popen.pid for proc in runner.processes.values()] + [orphan.pid]:
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        runner._reap_orphans()
+        assert [(proc.popen, proc.exit_status) for proc in runner.processes.values()] == [(None, 0), (None, 0)]
+        with pytest.raises(ChildProcessError):
+            os.waitpid(orphan.pid, os.WNOHANG)
+    finally:
+        for proc in runner.processes.values():
+            proc.cancel_timer()
+        runner.loop.close()
@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize('modules, lazy', [
+    ('gravity.cli', ('pydantic', 'ruamel.yaml', 'jsonref', 'supervisor', 'yaml', 'http.client')),
+    ('gravity.cli, gravity.commands.cmd_configs', ('pydantic', 'ruamel.yaml', 'jsonref', 'supervisor', 'http.client')),
+    ('gravity.cli, gravity.commands.cmd_status, gravity.process_manager.supervisor_manager', ('pydantic', 'jsonref', 'supervisor.supervisorctl')),
+])
+def test_cli_lazy_imports(modules, lazy):
+    # in a fresh interpreter, as the tests themselves import everything
+    code = f"import sys, {modules}; print(' '.join(sys.modules))"
+    imported = set(subprocess.check_output([sys.executable, '-c', code], universal_newlines=True).split())
+    assert not imported.intersection(lazy)
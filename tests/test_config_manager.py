@@ -1,7 +1,11 @@
 import json
+import threading
 from pathlib import Path
 
+from gravity import config_manager, process_manager
+from gravity.config_manager import ConfigManager
 from gravity.settings import Settings
+from gravity.state import GravityState, service_for_service_type, state_lock
 
 
 def test_register_defaults(galaxy_yml, galaxy_root_dir, state_dir, default_config_manager):
@@ -64,6 +68,29 @@ def test_register_non_default(galaxy_yml, default_config_manager):
     assert celery_attributes['concurrency'] == concurrency
 
 
+def test_register_auto_sizes(galaxy_yml, default_config_manager, monkeypatch):
+    monkeypatch.setattr('gravity.config_manager.host_resources', lambda: (4, 16 * 1024 ** 3))
+    galaxy_yml.write(json.dumps({
+        'galaxy': None,
+        'gravity': {
+            'gunicorn': {'workers': 'auto'},
+            'celery': {'concurrency': 'auto'},
+            'handlers': {
+                'handler': {'processes': 'auto', 'pools': ['job-handlers']},
+                'workflow_scheduler': {'processes': 'auto', 'pools': ['workflow-schedulers']},
+            },
+        }
+    }))
+    default_config_manager.add([str(galaxy_yml)])
+    state = default_config_manager.state['config_files'][str(galaxy_yml)]
+    assert state['attribs']['gunicorn']['workers'] == 8
+    assert state['attribs']['celery']['concurrency'] == 8
+    # handlers share the CPUs and memory for handlers
+    config = default_config_manager.get_config(str(galaxy_yml))
+    services = [s['service_name'] for s in config['services'] if s['service_type'] == 'standalone']
+    assert services == ['handler_0', 'workflow_scheduler_0']
+
+
 def test_deregister(galaxy_yml, default_config_manager):
     default_config_manager.add([str(galaxy_yml)])
     assert str(galaxy_yml) in default_config_manager.state['config_files']
@@ -99,3 +126,220 @@ def test_register_sample_update_to_non_sample(galaxy_root_dir, state_dir, defaul
     galaxy_yml_sample.copy(galaxy_yml)
     default_config_manager.instance_count == 1
     assert default_config_manager.get_registered_config(str(galaxy_yml))
+
+
+def test_state_cached(galaxy_yml, default_config_manager):
+    state = default_config_manager.state
+    assert default_config_manager.state is state
+    default_config_manager.add([str(galaxy_yml)])
+    # invalidated by our own write
+    state = default_config_manager.state
+    assert str(galaxy_yml) in state['config_files']
+    assert default_config_manager.state is state
+    # invalidated by a write from elsewhere
+    with open(default_config_manager.config_state_path, 'w') as fh:
+        fh.write('config_files: {}\n')
+    assert default_config_manager.state is not state
+    assert not default_config_manager.is_registered(str(galaxy_yml))
+
+
+def test_transaction_single_write(galaxy_yml, default_config_manager):
+    default_config_manager.add([str(galaxy_yml)])
+    config = default_config_manager.get_registered_config(str(galaxy_yml))
+    with default_config_manager.transaction() as state:
+        state.config_files['/a/galaxy.yml'] = config
+        with default_config_manager.transaction():
+            default_config_manager._register_config_file('/b/galaxy.yml', config)
+        # changes are visible inside the transaction but not committed until the outermost transaction exits
+        assert default_config_manager.is_registered('/b/galaxy.yml')
+        assert '/a/galaxy.yml' not in open(default_config_manager.config_state_path).read()
+    assert default_config_manager.is_registered('/a/galaxy.yml')
+    assert default_config_manager.is_registered('/b/galaxy.yml')
+
+
+def test_transaction_rollback(galaxy_yml, default_config_manager):
+    default_config_manager.add([str(galaxy_yml)])
+    try:
+        with default_config_manager.transaction() as state:
+            state.config_files.clear()
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert default_config_manager.is_registered(str(galaxy_yml))
+
+
+def test_transaction_concurrent(galaxy_root_dir, state_dir):
+    config_files = []
+    for i in range(8):
+        config_file = galaxy_root_dir / 'config' / f'galaxy_concurrent{i}.yml'
+        config_file.write(json.dumps({'gravity': {'instance_name': f'concurrent{i}'}}))
+        config_files.append(str(config_file))
+    managers = [ConfigManager(state_dir=state_dir) for _ in config_files]
+    threads = [threading.Thread(target=cm.add, args=([cf],)) for cm, cf in zip(managers, config_files)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cm = ConfigManager(state_dir=state_dir)
+    assert all(cm.is_registered(cf) for cf in config_files)
+
+
+def test_state_file_created(state_dir):
+    path = str(state_dir / 'configstate.yaml')
+    # created under the state lock, which is reentrant so that it can be created by a transaction
+    with state_lock(str(state_dir)):
+        state = GravityState.open(path)
+    assert state == {'config_files': {}}
+    assert GravityState.open(path) == state
+    assert [p.name for p in state_dir.iterdir()] == ['configstate.yaml']
+
+
+def test_sqlite_state_backend(galaxy_yml, state_dir):
+    cm = ConfigManager(state_dir=state_dir, state_backend='sqlite')
+    cm.add([str(galaxy_yml)])
+    assert Path(cm.config_state_path).name == 'configstate.sqlite'
+    assert not (Path(state_dir) / 'configstate.yaml').exists()
+    with process_manager.process_manager(state_dir=state_dir, start_daemon=False) as pm:
+        pm.update()
+        assert pm.config_manager.state_store.name == 'sqlite'
+        services = pm.config_manager.get_instance_services('_default_')
+    assert [s['service_type'] for s in services] == ['gunicorn', 'celery', 'celery-beat']
+    cm.remove([str(galaxy_yml)])
+    assert not cm.is_registered(str(galaxy_yml))
+    assert str(galaxy_yml) in cm.get_remove_configs()
+
+
+def test_sqlite_state_backend_writes_changes_only(galaxy_yml, state_dir):
+    cm = ConfigManager(state_dir=state_dir, state_backend='sqlite')
+    cm.add([str(galaxy_yml)])
+    with process_manager.process_manager(state_dir=state_dir, start_daemon=False) as pm:
+        pm.update()
+    changes = cm.state_store.connection.total_changes
+    with cm.transaction() as state:
+        state.config_files[str(galaxy_yml)]['services'][0]['umask'] = '027'
+    assert cm.state_store.connection.total_changes == changes + 1
+    assert cm.get_instance_services('_default_')[0]['umask'] == '027'
+    # the rows as loaded are not part of the state
+    assert '_rows' not in cm.state
+
+
+def test_sqlite_state_backend_partial_load(galaxy_yml, state_dir, monkeypatch):
+    cm = ConfigManager(state_dir=state_dir, state_backend='sqlite')
+    cm.add([str(galaxy_yml)])
+    config = cm.get_registered_config(str(galaxy_yml))
+    cm = ConfigManager(state_dir=state_dir, state_backend='sqlite')
+
+    def fail():
+        raise AssertionError("whole state loaded")
+
+    monkeypatch.setattr(cm.state_store, 'load', fail)
+    assert cm.get_registered_config(str(galaxy_yml)) == config
+    assert [s['service_type'] for s in cm.get_instance_services('_default_')] == [s['service_type'] for s in config['services']]
+
+
+def test_convert_state_backend(galaxy_yml, state_dir):
+    ConfigManager(state_dir=state_dir).add([str(galaxy_yml)])
+    yaml_state = ConfigManager(state_dir=state_dir).state
+    cm = ConfigManager(state_dir=state_dir, state_backend='sqlite')
+    assert cm.state_store.name == 'sqlite'
+    assert not (Path(state_dir) / 'configstate.yaml').exists()
+    assert cm.state == yaml_state
+    # the existing backend is used if none is specified
+    assert ConfigManager(state_dir=state_dir).state_store.name == 'sqlite'
+    cm = ConfigManager(state_dir=state_dir, state_backend='yaml')
+    assert not (Path(state_dir) / 'configstate.sqlite').exists()
+    assert cm.is_registered(str(galaxy_yml))
+
+
+def test_config_cache(galaxy_root_dir, default_config_manager, monkeypatch):
+    gravity_yml = galaxy_root_dir / 'config' / 'gravity_cached.yml'
+    gravity_yml.write(json.dumps({'gunicorn': {'bind': 'localhost:8082'}}))
+    galaxy_yml = galaxy_root_dir / 'config' / 'galaxy_cached.yml'
+    galaxy_yml.write('galaxy: {}\ngravity: !include gravity_cached.yml\n')
+    config = default_config_manager.get_config(str(galaxy_yml))
+    assert config['attribs']['gunicorn']['bind'] == 'localhost:8082'
+
+    def fail(*args, **kwargs):
+        raise AssertionError("config parsed despite cache hit")
+
+    with monkeypatch.context() as m:
+        m.setattr('gravity.config_manager.yaml_safe_load_with_include', fail)
+        cached_config = default_config_manager.get_config(str(galaxy_yml))
+    assert cached_config == config
+    assert [s['service_type'] for s in cached_config['services']] == [s['service_type'] for s in config['services']]
+    # changing an included file invalidates the cached config
+    gravity_yml.write(json.dumps({'gunicorn': {'bind': 'localhost:8083'}}))
+    config = default_config_manager.get_config(str(galaxy_yml))
+    assert config['attribs']['gunicorn']['bind'] == 'localhost:8083'
+    # as does changing the environment
+    monkeypatch.setenv('GRAVITY_CELERY.CONCURRENCY', '7')
+    config = default_config_manager.get_config(str(galaxy_yml))
+    assert config['attribs']['celery']['concurrency'] == 7
+
+
+def test_config_cache_resources(galaxy_root_dir, default_config_manager, monkeypatch):
+    auto_yml = galaxy_root_dir / 'config' / 'galaxy_auto.yml'
+    auto_yml.write(json.dumps({'galaxy': None, 'gravity': {'gunicorn': {'workers': 'auto'}}}))
+    fixed_yml = galaxy_root_dir / 'config' / 'galaxy_fixed.yml'
+    fixed_yml.write(json.dumps({'galaxy': None, 'gravity': {'gunicorn': {'workers': 2}}}))
+
+    def set_resources(cpus):
+        monkeypatch.setattr('gravity.config_manager.host_resources', lambda: (cpus, 16 * 1024 ** 3))
+        monkeypatch.setattr('gravity.cache.host_resources', lambda: (cpus, 16 * 1024 ** 3))
+
+    set_resources(4)
+    default_config_manager.get_config(str(auto_yml))
+    default_config_manager.get_config(str(fixed_yml))
+    parsed = []
+    load = config_manager.yaml_safe_load_with_include
+
+    def recording_load(fh, **kwargs):
+        parsed.append(fh.name)
+        return load(fh, **kwargs)
+
+    monkeypatch.setattr('gravity.config_manager.yaml_safe_load_with_include', recording_load)
+    default_config_manager.get_config(str(auto_yml))
+    default_config_manager.get_config(str(fixed_yml))
+    assert parsed == []
+    # only configs with auto sizes depend on the host's resources
+    set_resources(2)
+    assert default_config_manager.get_config(str(auto_yml))['attribs']['gunicorn']['workers'] == 5
+    default_config_manager.get_config(str(fixed_yml))
+    assert parsed == [str(auto_yml)]
+
+
+def test_config_cache_pruned(galaxy_yml, default_config_manager):
+    default_config_manager.add([str(galaxy_yml)])
+    cache_dir = Path(default_config_manager.state_dir) / 'cache' / 'configs'
+    assert len(list(cache_dir.iterdir())) == 1
+    default_config_manager.remove([str(galaxy_yml)])
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_unchanged_instance_not_changed(galaxy_yml, default_config_manager):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'instance_name': 'one'}}))
+    default_config_manager.add([str(galaxy_yml)])
+    with process_manager.process_manager(state_dir=default_config_manager.state_dir, start_daemon=False) as pm:
+        pm.update()
+    # a change that misses the config cache without changing the config
+    galaxy_yml.write(galaxy_yml.read() + '\n# a comment\n')
+    configs, meta_changes = default_config_manager.determine_config_changes()
+    assert not meta_changes['skipped_configs']
+    assert not meta_changes['changed_instances']
+
+
+def test_diff_services():
+    stored_services = [
+        service_for_service_type('gunicorn')(config_type='galaxy'),
+        service_for_service_type('standalone')(config_type='galaxy', service_name='handler0', server_pools=['job-handlers']),
+        service_for_service_type('standalone')(config_type='galaxy', service_name='handler1'),
+    ]
+    services = [
+        service_for_service_type('gunicorn')(config_type='galaxy'),
+        service_for_service_type('standalone')(config_type='galaxy', service_name='handler0', server_pools=['workflow-schedulers']),
+        service_for_service_type('standalone')(config_type='galaxy', service_name='handler2'),
+    ]
+    update_services, remove_services = ConfigManager.diff_services(stored_services, services)
+    assert [s['service_name'] for s in update_services] == ['handler0', 'handler2']
+    assert update_services[0]['server_pools'] == ['workflow-schedulers']
+    assert [s['service_name'] for s in remove_services] == ['handler1']
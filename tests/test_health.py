@@ -0,0 +1,122 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import UnixStreamServer
+
+import pytest
+from click import ClickException
+from gravity import process_manager
+from gravity.health import ConnectProbe, HTTPProbe, parse_bind
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200 if self.path == "/api/version" else 500)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class UnixHTTPServer(UnixStreamServer):
+    def get_request(self):
+        request, _ = super(UnixHTTPServer, self).get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("localhost", 0)
+
+
+@pytest.fixture
+def http_server():
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_parse_bind():
+    assert parse_bind("localhost:8080") == ("tcp", "localhost", 8080)
+    assert parse_bind("0.0.0.0:8080") == ("tcp", "127.0.0.1", 8080)
+    assert parse_bind("[::]:8080") == ("tcp", "::1", 8080)
+    assert parse_bind("[::1]:8080") == ("tcp", "::1", 8080)
+    assert parse_bind("example.org") == ("tcp", "example.org", 8000)
+    assert parse_bind("unix:/srv/galaxy/gunicorn.sock") == ("unix", "/srv/galaxy/gunicorn.sock")
+    assert parse_bind("fd://3") is None
+
+
+def test_connect_probe(http_server):
+    healthy, detail = ConnectProbe(("tcp", "127.0.0.1", http_server.server_port)).check()
+    assert healthy, detail
+    healthy, detail = ConnectProbe(("tcp", "127.0.0.1", _closed_port()), timeout=1).check()
+    assert not healthy
+    assert "refused" in detail.lower()
+
+
+def test_http_probe(http_server):
+    address = ("tcp", "127.0.0.1", http_server.server_port)
+    healthy, detail = HTTPProbe(address, "/api/version").check()
+    assert healthy
+    assert detail.startswith("HTTP 200")
+    healthy, detail = HTTPProbe(address, "/broken").check()
+    assert not healthy
+    assert detail.startswith("HTTP 500")
+
+
+def test_http_probe_unix_socket(tmpdir):
+    path = str(tmpdir / "gunicorn.sock")
+    server = UnixHTTPServer(path, Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        healthy, detail = HTTPProbe(parse_bind(f"unix:{path}"), "/api/version").check()
+        assert healthy, detail
+    finally:
+        server.shutdown()
+        server.server_close()
+    healthy, detail = HTTPProbe(parse_bind(f"unix:{path}"), "/api/version").check()
+    assert not healthy
+
+
+def test_service_health_probes(galaxy_yml, default_config_manager):
+    galaxy_yml.write(json.dumps({
+        "galaxy": {"galaxy_url_prefix": "/galaxy/", "galaxy_infrastructure_url": "http://localhost:8081/galaxy"},
+        "gravity": {"gunicorn": {"bind": "0.0.0.0:8081"}, "tusd": {"enable": True, "upload_dir": "/tmp"}},
+    }))
+    default_config_manager.add([str(galaxy_yml)])
+    with process_manager.process_manager(state_dir=default_config_manager.state_dir, start_daemon=False) as pm:
+        pm.update()
+        probes = {service["service_type"]: probe for _, service, probe in pm._health_probes()}
+    assert set(probes) == {"gunicorn", "tusd"}
+    assert str(probes["gunicorn"]) == "GET http://127.0.0.1:8081/galaxy/api/version"
+    assert str(probes["tusd"]) == "connect localhost:1080"
+
+
+def test_wait_for_health(state_dir, http_server):
+    healthy_probe = HTTPProbe(("tcp", "127.0.0.1", http_server.server_port), "/api/version")
+    unhealthy_probe = ConnectProbe(("tcp", "127.0.0.1", _closed_port()))
+    with process_manager.process_manager(state_dir=state_dir, start_daemon=False, health_timeout=1) as pm:
+        pm._wait_for_health({"gunicorn": healthy_probe})
+        with pytest.raises(ClickException) as excinfo:
+            pm._wait_for_health({"gunicorn": healthy_probe, "tusd": unhealthy_probe})
+        assert "tusd" in str(excinfo.value)
+        assert "gunicorn" not in str(excinfo.value)
+        # a failed service stops waiting early
+        start = time.monotonic()
+        with pytest.raises(ClickException) as excinfo:
+            pm._wait_for_health({"tusd": unhealthy_probe}, failed=lambda names: [f"{name} (FATAL, Exited too quickly)" for name in names])
+        assert "tusd (FATAL" in str(excinfo.value)
+        assert time.monotonic() - start < 1
+    # not waiting at all if the timeout is unset
+    with process_manager.process_manager(state_dir=state_dir, start_daemon=False) as pm:
+        pm._wait_for_health({"tusd": unhealthy_probe})
@@ -0,0 +1,113 @@
+import os
+from datetime import datetime
+
+import pytest
+from gravity.util import logs
+from gravity.util.logs import LogFollower, parse_since, search_logs
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def follower_factory(request, tmp_path, monkeypatch):
+    if request.param == "poll":
+        def no_inotify():
+            raise OSError("inotify disabled")
+        monkeypatch.setattr(logs, "Inotify", no_inotify)
+    followers = []
+
+    def factory(**kwargs):
+        follower = LogFollower({"handler0": str(tmp_path / "handler0.log"), "web": str(tmp_path / "web.log")}, poll_interval=0.01, **kwargs)
+        followers.append(follower)
+        return follower
+    yield factory
+    for follower in followers:
+        follower.close()
+
+
+def append(path, data):
+    with open(path, "a") as fh:
+        fh.write(data)
+
+
+def poll_until(follower, count):
+    output = []
+    for _ in range(100):
+        output.extend(follower.poll(timeout=0.05))
+        if len(output) >= count:
+            break
+    return output
+
+
+def test_follow(follower_factory, tmp_path):
+    handler_log = tmp_path / "handler0.log"
+    append(handler_log, "".join(f"line {i}\n" for i in range(20)))
+    follower = follower_factory()
+    assert follower.start(lines=2) == ["handler0 | line 18", "handler0 | line 19"]
+    # web.log does not exist yet
+    append(tmp_path / "web.log", "started\npartial")
+    append(handler_log, "line 20\n")
+    assert sorted(poll_until(follower, 2)) == ["handler0 | line 20", "web      | started"]
+    append(tmp_path / "web.log", " line\n")
+    assert poll_until(follower, 1) == ["web      | partial line"]
+    # truncation
+    handler_log.write_text("")
+    append(handler_log, "after truncate\n")
+    assert poll_until(follower, 1) == ["handler0 | after truncate"]
+    # rotation, lines written to the old file after it was moved are still output
+    os.rename(handler_log, tmp_path / "handler0.log.1")
+    append(tmp_path / "handler0.log.1", "before rotate\n")
+    append(handler_log, "after rotate\n")
+    assert poll_until(follower, 2) == ["handler0 | before rotate", "handler0 | after rotate"]
+
+
+def test_follow_filters(follower_factory, tmp_path):
+    append(tmp_path / "web.log", "2022-01-01 10:00:00 old\nold traceback\n2022-01-01 12:00:00 new\nnew traceback\nmatch\n")
+    follower = follower_factory(since=datetime(2022, 1, 1, 11), grep="new|match")
+    assert follower.start() == ["web      | 2022-01-01 12:00:00 new", "web      | new traceback", "web      | match"]
+    follower = follower_factory(rate=2)
+    follower.start(lines=0)
+    append(tmp_path / "web.log", "".join(f"line {i}\n" for i in range(5)))
+    output = poll_until(follower, 2)
+    assert output[:2] == ["web      | line 0", "web      | line 1"]
+    for _ in range(40):
+        if len(output) > 2:
+            break
+        output.extend(follower.poll(timeout=0.05))
+    assert output[2:] == ["web      | [3 lines suppressed]"]
+
+
+def test_parse_since():
+    now = datetime(2022, 1, 1, 12)
+    assert parse_since("90m", now=now) == datetime(2022, 1, 1, 10, 30)
+    assert parse_since("2022-01-01T11:00:00") == datetime(2022, 1, 1, 11)
+    assert parse_since("2022-01-01 11:30") == datetime(2022, 1, 1, 11, 30)
+    assert parse_since("2022-01-01") == datetime(2022, 1, 1)
+    with pytest.raises(ValueError):
+        parse_since("yesterday")
+
+
+def write_log(path, start_minute, count, step=2):
+    with open(path, "w") as fh:
+        for i in range(count):
+            minute = start_minute + i * step
+            fh.write(f"galaxy INFO 2022-01-01 {minute // 60:02d}:{minute % 60:02d}:00,000 [p:1] event {minute}\n")
+            if minute % 10 == 0:
+                fh.write("Traceback (most recent call last):\n  error\n")
+
+
+def test_search_logs(tmp_path):
+    write_log(tmp_path / "a.log", 0, 300)
+    write_log(tmp_path / "b.log", 1, 300)
+    log_files = {"a": str(tmp_path / "a.log"), "b": str(tmp_path / "b.log"), "missing": str(tmp_path / "missing.log")}
+    output = list(search_logs(log_files, since=datetime(2022, 1, 1, 1, 29), until=datetime(2022, 1, 1, 1, 31)))
+    assert output == [
+        "b       | galaxy INFO 2022-01-01 01:29:00,000 [p:1] event 89",
+        "a       | galaxy INFO 2022-01-01 01:30:00,000 [p:1] event 90",
+        "a       | Traceback (most recent call last):",
+        "a       |   error",
+        "b       | galaxy INFO 2022-01-01 01:31:00,000 [p:1] event 91",
+    ]
+    # last lines, read backwards
+    output = list(search_logs(log_files, grep="event", lines=3))
+    assert [line.split()[-1] for line in output] == ["597", "598", "599"]
+    assert list(search_logs(log_files, since=datetime(2022, 1, 2))) == []
+    assert len(list(search_logs(log_files, until=datetime(2022, 1, 1, 0, 1)))) == 4
@@ -53,7 +53,8 @@ def wait_for_gxit_proxy(state_dir):
 def start_instance(state_dir, free_port):
     runner = CliRunner()
     result = runner.invoke(galaxyctl, ['--state-dir', state_dir, 'start'])
-    assert re.search(r"gunicorn\s*STARTING", result.output)
+    # services are started in waves, so gunicorn may already be running by the time status is output
+    assert re.search(r"gunicorn\s*(STARTING|RUNNING)", result.output)
     assert result.exit_code == 0, result.output
     startup_done = wait_for_startup(state_dir, free_port)
     assert startup_done is True, f"Startup failed. Application startup logs:\n {startup_done}"
@@ -1,8 +1,15 @@
 import json
+import os
+import shutil
+import time
 from pathlib import Path
 
 import pytest
+from click import ClickException
+from click.testing import CliRunner
 from gravity import process_manager
+from gravity.cli import galaxyctl
+from supervisor.xmlrpc import Faults
 from yaml import safe_load
 
 
@@ -85,6 +92,83 @@ def test_update_force(galaxy_yml, default_config_manager):
     assert gunicorn_conf_path.stat().st_mtime != update_time
 
 
+def test_update_unchanged_configs_skipped(galaxy_yml, default_config_manager, capsys):
+    default_config_manager.add([str(galaxy_yml)])
+    with process_manager.process_manager(state_dir=default_config_manager.state_dir) as pm:
+        pm.update()
+    instance_conf_dir = Path(default_config_manager.state_dir) / 'supervisor' / 'supervisord.conf.d' / '_default_.d'
+    gunicorn_inode = (instance_conf_dir / "galaxy_gunicorn_gunicorn.conf").stat().st_ino
+    celery_inode = (instance_conf_dir / "galaxy_celery_celery.conf").stat().st_ino
+    capsys.readouterr()
+    # changes the attribs of the config, so the configs of all of its services are regenerated
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'gunicorn': {'workers': 3}}}))
+    with process_manager.process_manager(state_dir=default_config_manager.state_dir) as pm:
+        pm.update()
+    assert "Supervisor configs: 1 written, 2 unchanged" in capsys.readouterr().out
+    # changed configs are replaced rather than rewritten in place, unchanged ones are not touched
+    assert (instance_conf_dir / "galaxy_gunicorn_gunicorn.conf").stat().st_ino != gunicorn_inode
+    assert "--workers=3" in (instance_conf_dir / "galaxy_gunicorn_gunicorn.conf").read_text()
+    assert (instance_conf_dir / "galaxy_celery_celery.conf").stat().st_ino == celery_inode
+    assert sorted(path.name for path in instance_conf_dir.iterdir()) == [
+        "galaxy_celery-beat_celery-beat.conf", "galaxy_celery_celery.conf", "galaxy_gunicorn_gunicorn.conf"
+    ]
+
+
+def test_update_only_changed_groups(galaxy_root_dir, galaxy_yml, default_config_manager, capsys):
+    other_yml = galaxy_root_dir / 'config' / 'galaxy456.yml'
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'instance_name': 'one'}}))
+    other_yml.write(json.dumps({'galaxy': None, 'gravity': {'instance_name': 'two', 'gunicorn': {'bind': 'localhost:8081'}}}))
+    try:
+        default_config_manager.add([str(galaxy_yml), str(other_yml)])
+        with process_manager.process_manager(state_dir=default_config_manager.state_dir) as pm:
+            pm.update()
+            assert {'one: added process group', 'two: added process group'} <= set(capsys.readouterr().out.splitlines())
+        # changed behind Gravity's back, so supervisord sees a change to group two that is not Gravity's to apply
+        group_conf = Path(default_config_manager.state_dir) / 'supervisor' / 'supervisord.conf.d' / 'group_two.conf'
+        group_conf.write_text(group_conf.read_text() + "priority = 1\n")
+        galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'instance_name': 'one', 'gunicorn': {'workers': 3}}}))
+        with process_manager.process_manager(state_dir=default_config_manager.state_dir) as pm:
+            pm.update()
+            output = capsys.readouterr().out.splitlines()
+            assert 'one: updated process group' in output
+            assert not [line for line in output if line.startswith('two:')]
+            # a forced update reconciles every group
+            pm.update(force=True)
+            output = capsys.readouterr().out.splitlines()
+            assert 'two: updated process group' in output
+            assert not [line for line in output if line.startswith('one:')]
+            pm.shutdown()
+    finally:
+        other_yml.remove()
+
+
+def test_update_groups_second_instance(galaxy_root_dir, galaxy_yml, default_config_manager, capsys):
+    other_yml = galaxy_root_dir / 'config' / 'galaxy456.yml'
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'instance_name': 'one', 'celery': {'enable': False, 'enable_beat': False}}}))
+    other_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'instance_name': 'two', 'gunicorn': {'bind': 'localhost:8081'}, 'celery': {'enable': False, 'enable_beat': False},
+    }}))
+    try:
+        default_config_manager.add([str(galaxy_yml)])
+        with process_manager.process_manager(state_dir=default_config_manager.state_dir) as pm:
+            pm.update()
+            # a single instance's programs are groups of their own
+            assert 'gunicorn: added process group' in capsys.readouterr().out.splitlines()
+            default_config_manager.add([str(other_yml)])
+            pm.update()
+            output = capsys.readouterr().out.splitlines()
+            # once there are two, the programs of the first move to its instance's group
+            assert {'gunicorn: removed process group', 'one: added process group', 'two: added process group'} <= set(output)
+            # and back once the second is deregistered
+            default_config_manager.remove([str(other_yml)])
+            pm.update()
+            output = capsys.readouterr().out.splitlines()
+            assert {'one: removed process group', 'two: removed process group', 'gunicorn: added process group'} <= set(output)
+            pm.shutdown()
+    finally:
+        other_yml.remove()
+
+
 def test_disable_services(galaxy_yml, default_config_manager):
     default_config_manager.add([str(galaxy_yml)])
     galaxy_yml.write(json.dumps(
@@ -103,6 +187,30 @@ def test_disable_services(galaxy_yml, default_config_manager):
     assert not celery_beat_conf_path.exists()
 
 
+def test_resource_controls(galaxy_yml, default_config_manager):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'gunicorn': {'resources': {'cpu_affinity': '0-1', 'oom_score_adj': -500}},
+        'celery': {'resources': {'nice': 10, 'ionice_class': 'idle', 'ionice_priority': 7}},
+        'handlers': {'handler': {'processes': 1, 'resources': {'ionice_priority': 4, 'rlimit_as': 8589934592, 'rlimit_nofile': 4096}}},
+    }}))
+    default_config_manager.add([str(galaxy_yml)])
+    with process_manager.process_manager(state_dir=default_config_manager.state_dir) as pm:
+        pm.update()
+    instance_conf_dir = Path(default_config_manager.state_dir) / 'supervisor' / 'supervisord.conf.d' / '_default_.d'
+    gunicorn_conf = (instance_conf_dir / 'galaxy_gunicorn_gunicorn.conf').open().read()
+    assert 'command         = taskset -c 0-1 choom -n -500 -- gunicorn ' in gunicorn_conf
+    # the idle I/O scheduling class has no priorities
+    for service_type in ('celery', 'celery-beat'):
+        celery_conf = (instance_conf_dir / f'galaxy_{service_type}_{service_type}.conf').open().read()
+        assert 'command         = nice -n 10 ionice -c idle celery ' in celery_conf
+    handler_conf = (instance_conf_dir / 'galaxy_standalone_handler_0.conf').open().read()
+    assert 'command         = ionice -c best-effort -n 4 prlimit --as=8589934592 --nofile=4096 python ' in handler_conf
+    # invalid resource controls are rejected
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'gunicorn': {'resources': {'cpu_affinity': 'all'}}}}))
+    with pytest.raises(ValueError):
+        default_config_manager.get_config(str(galaxy_yml))
+
+
 @pytest.mark.parametrize('job_conf', [[JOB_CONF_XML_DYNAMIC_HANDLERS]], indirect=True)
 def test_dynamic_handlers(default_config_manager, galaxy_yml, job_conf):
     galaxy_yml.write(DYNAMIC_HANDLER_CONFIG)
@@ -206,3 +314,188 @@ def test_tusd_process(default_config_manager, galaxy_yml, tusd_config):
         tusd_config_path = instance_conf_dir / 'galaxy_tusd_tusd.conf'
         assert tusd_config_path.exists()
         assert "tusd -host" in tusd_config_path.read_text()
+
+
+def test_update_skips_unchanged_configs(galaxy_yml, default_config_manager, monkeypatch):
+    default_config_manager.add([str(galaxy_yml)])
+    with process_manager.process_manager(state_dir=default_config_manager.state_dir, start_daemon=False) as pm:
+        pm.update()
+        get_config = pm.config_manager.get_config
+
+        def fail(*args, **kwargs):
+            raise AssertionError("unchanged config parsed")
+
+        monkeypatch.setattr(pm.config_manager, 'get_config', fail)
+        configs, meta_changes = pm.config_manager.determine_config_changes()
+        assert meta_changes['skipped_configs'] == {str(galaxy_yml)}
+        # skipped configs are copies, changing them doesn't change the registered config
+        configs[str(galaxy_yml)]['services'].clear()
+        assert pm.config_manager.get_registered_config(str(galaxy_yml))['services']
+        # touching the config changes its stat signature but not its contents
+        os.utime(str(galaxy_yml), ns=(0, 0))
+        configs, meta_changes = pm.config_manager.determine_config_changes()
+        assert meta_changes['skipped_configs'] == {str(galaxy_yml)}
+        monkeypatch.setattr(pm.config_manager, 'get_config', get_config)
+        galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'gunicorn': {'bind': 'localhost:8081'}}}))
+        configs, meta_changes = pm.config_manager.determine_config_changes()
+        assert not meta_changes['skipped_configs']
+        assert configs[str(galaxy_yml)]['update_attribs']['gunicorn']['bind'] == 'localhost:8081'
+
+
+def test_supervisor_rpc_multicall(state_dir):
+    with process_manager.process_manager(state_dir=state_dir) as pm:
+        with open(os.path.join(pm.supervisord_conf_dir, "sleep.conf"), "w") as fh:
+            fh.write("[program:sleep]\ncommand = sleep 60\nautostart = false\nstartsecs = 0\nstopsignal = KILL\n")
+        pm.supervisorctl("update")
+        results = pm.rpc.multicall([
+            ("startProcess", ("sleep",)),
+            ("startProcess", ("sleep",)),
+            ("stopProcess", ("missing",)),
+            ("stopProcessGroup", ("sleep",)),
+        ])
+        assert results[0] is True
+        assert results[1].faultCode == Faults.ALREADY_STARTED
+        assert results[2].faultCode == Faults.BAD_NAME
+        assert [(r["name"], r["status"]) for r in results[3]] == [("sleep", Faults.SUCCESS)]
+        pm.shutdown()
+
+
+def test_supervisord_exit_fails_fast(state_dir, monkeypatch):
+    from gravity.process_manager import supervisor_manager
+    monkeypatch.setattr(supervisor_manager, "which", lambda name: shutil.which("false"))
+    start = time.monotonic()
+    with pytest.raises(ClickException, match="supervisord exited with code 1"):
+        supervisor_manager.SupervisorProcessManager(state_dir=state_dir)
+    assert time.monotonic() - start < supervisor_manager.DEFAULT_SUPERVISORD_TIMEOUT
+
+
+def test_process_status(state_dir):
+    with process_manager.process_manager(state_dir=state_dir) as pm:
+        for name, command in (("sleep", "sleep 60"), ("false", "false")):
+            with open(os.path.join(pm.supervisord_conf_dir, f"{name}.conf"), "w") as fh:
+                fh.write(f"[program:{name}]\ncommand = {command}\nstartsecs = 0\nautorestart = false\nstopsignal = KILL\n")
+        pm.supervisorctl("update")
+        time.sleep(0.5)
+        statuses = {status["name"]: status for status in pm.process_status()}
+        assert statuses["sleep"]["state"] == "RUNNING"
+        assert statuses["sleep"]["pid"]
+        assert statuses["sleep"]["exit_status"] is None
+        if os.path.isdir("/proc"):
+            assert statuses["sleep"]["rss"] > 0
+            assert statuses["sleep"]["processes"] == 1
+        assert statuses["false"]["state"] == "EXITED"
+        assert statuses["false"]["pid"] is None
+        assert statuses["false"]["exit_status"] == 1
+        assert statuses["false"]["rss"] is None
+        pm.shutdown()
+
+
+def test_output_status_empty_description(state_dir, capsys):
+    with process_manager.process_manager(state_dir=state_dir, start_daemon=False) as pm:
+        pm._output_status([{
+            "name": "gunicorn", "state": "STARTING", "description": "", "rss": 7.4 * 1024 * 1024, "pss": None, "cpu_time": None,
+            "health": None,
+        }])
+    assert capsys.readouterr().out.split(None, 2)[2] == "rss 7.4M\n"
+
+
+def test_rolling_batches():
+    members = [
+        ("handler0", ["job-handlers"]),
+        ("handler1", ["job-handlers"]),
+        ("handler2", ["job-handlers", "workflow-schedulers"]),
+        ("handler3", ["job-handlers", "workflow-schedulers"]),
+        ("special0", ["special"]),
+    ]
+    assert process_manager.rolling_batches(members, 4) == [
+        ["handler0", "handler1", "handler2", "special0"],
+        ["handler3"],
+    ]
+    batches = process_manager.rolling_batches(members, 2)
+    assert batches == [["handler0", "handler1"], ["handler2", "special0"], ["handler3"]]
+    for batch in process_manager.rolling_batches(members, 5):
+        # every pool of more than one handler keeps a running handler
+        assert not {"handler2", "handler3"} <= set(batch)
+        assert len([m for m in batch if m.startswith("handler")]) < 4
+
+
+def test_startup_waves():
+    members = [
+        ("handler0", "standalone", ("gunicorn", "unicornherder", "celery")),
+        ("handler1", "standalone", ("gunicorn", "unicornherder", "celery")),
+        ("handler2", "standalone", ("gunicorn", "unicornherder", "celery")),
+        ("celery-beat", "celery-beat", ("celery",)),
+        ("celery", "celery", ("gunicorn", "unicornherder")),
+        ("gunicorn", "gunicorn", ()),
+        ("gx-it-proxy", "gx-it-proxy", ()),
+    ]
+    assert process_manager.startup_waves(members) == [
+        ["gunicorn", "gx-it-proxy"],
+        ["celery"],
+        ["handler0", "handler1", "handler2", "celery-beat"],
+    ]
+    assert process_manager.startup_waves(members, wave_size=2) == [
+        ["gunicorn", "gx-it-proxy"],
+        ["celery"],
+        ["handler0", "handler1"],
+        ["handler2", "celery-beat"],
+    ]
+    # dependencies on services that aren't configured are ignored
+    assert process_manager.startup_waves([m for m in members if m[1] != "celery"]) == [
+        ["celery-beat", "gunicorn", "gx-it-proxy"],
+        ["handler0", "handler1", "handler2"],
+    ]
+    with pytest.raises(ValueError):
+        process_manager.startup_waves([("a", "a", ("b",)), ("b", "b", ("a",))])
+
+
+class FakeEntryPoint(object):
+    def __init__(self, name, value, obj):
+        self.name = name
+        self.value = value
+        self.obj = obj
+
+    def load(self):
+        return self.obj
+
+
+def test_process_manager_entry_points(monkeypatch):
+    class ThirdPartyProcessManager(process_manager.BaseProcessManager):
+        pass
+
+    entry_points = {
+        'thirdparty': FakeEntryPoint('thirdparty', 'thirdparty.pm:ThirdPartyProcessManager', ThirdPartyProcessManager),
+        'broken': FakeEntryPoint('broken', 'thirdparty.pm:not_a_process_manager', object()),
+    }
+    monkeypatch.setattr(process_manager, '_process_manager_entry_points', lambda: entry_points)
+    assert process_manager.available_process_managers() == ['asyncio', 'broken', 'supervisor', 'systemd', 'thirdparty']
+    assert process_manager.process_manager_class('thirdparty') is ThirdPartyProcessManager
+    with pytest.raises(ClickException, match='not a subclass'):
+        process_manager.process_manager_class('broken')
+    with pytest.raises(ClickException, match='Unknown process manager: launchd'):
+        process_manager.process_manager_class('launchd')
+
+
+def test_process_manager_entry_points_builtin_names(monkeypatch, capsys):
+    metadata = pytest.importorskip('importlib.metadata')
+
+    class ThirdPartyProcessManager(process_manager.BaseProcessManager):
+        pass
+
+    entry_points = [
+        FakeEntryPoint('thirdparty', 'thirdparty.pm:ThirdPartyProcessManager', ThirdPartyProcessManager),
+        FakeEntryPoint('systemd', 'thirdparty.pm:ThirdPartyProcessManager', ThirdPartyProcessManager),
+    ]
+    monkeypatch.setattr(metadata, 'entry_points', lambda: {process_manager.PROCESS_MANAGER_ENTRY_POINT_GROUP: entry_points})
+    # entry points can't replace built-in process managers
+    assert list(process_manager._process_manager_entry_points()) == ['thirdparty']
+    assert 'Ignoring process manager systemd (thirdparty.pm:ThirdPartyProcessManager)' in capsys.readouterr().err
+    assert process_manager.process_manager_class('systemd').__name__ == 'SystemdProcessManager'
+
+
+def test_process_manager_option(state_dir, monkeypatch):
+    monkeypatch.delenv('GRAVITY_PROCESS_MANAGER', raising=False)
+    runner = CliRunner()
+    result = runner.invoke(galaxyctl, ['--state-dir', state_dir, '--process-manager', 'launchd', 'status'])
+    assert result.exit_code == 1
+    assert 'Unknown process manager: launchd' in result.output
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from gravity.util.procfs import process_tree_usage
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="requires /proc")
+def test_process_tree_usage():
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        usage = process_tree_usage([os.getpid(), child.pid, 2 ** 22 + 1])
+        assert set(usage) == {os.getpid(), child.pid}
+        tree = usage[os.getpid()]
+        assert tree["processes"] >= 2
+        assert tree["rss"] > usage[child.pid]["rss"] > 0
+        assert tree["threads"] >= 2
+        assert tree["cpu_time"] > 0
+    finally:
+        child.kill()
+        child.wait()
@@ -0,0 +1,47 @@
+import pytest
+from gravity.util import resources
+
+
+@pytest.fixture
+def cgroup_root(tmpdir, monkeypatch):
+    monkeypatch.setattr(resources, 'CGROUP_ROOT', str(tmpdir))
+    return tmpdir
+
+
+def test_auto_size():
+    assert resources.auto_size('gunicorn', 4, None) == 9
+    # limited by memory
+    assert resources.auto_size('gunicorn', 4, 4 * 1024 ** 3) == 2
+    assert resources.auto_size('celery', 4, 16 * 1024 ** 3) == 8
+    assert resources.auto_size('handlers', 4, 16 * 1024 ** 3) == 2
+    assert resources.auto_size('handlers', 4, 16 * 1024 ** 3, share=0.5) == 1
+    # never less than one
+    assert resources.auto_size('gunicorn', 0.5, 256 * 1024 ** 2) == 1
+
+
+def test_cgroup_v2_limits(cgroup_root):
+    paths = {'': '/system.slice/galaxy.service'}
+    cgroup_root.join('system.slice', 'galaxy.service', 'cpu.max').write('max 100000\n', ensure=True)
+    cgroup_root.join('system.slice', 'galaxy.service', 'memory.max').write('max\n')
+    assert resources.cgroup_cpu_limit(paths) is None
+    assert resources.cgroup_memory_limit(paths) is None
+    # the most restrictive of the cgroup and its ancestors applies
+    cgroup_root.join('system.slice', 'galaxy.service', 'cpu.max').write('150000 100000\n')
+    cgroup_root.join('system.slice', 'cpu.max').write('400000 100000\n')
+    cgroup_root.join('system.slice', 'galaxy.service', 'memory.max').write(f'{8 * 1024 ** 3}\n')
+    cgroup_root.join('system.slice', 'memory.max').write(f'{2 * 1024 ** 3}\n')
+    assert resources.cgroup_cpu_limit(paths) == 1.5
+    assert resources.cgroup_memory_limit(paths) == 2 * 1024 ** 3
+
+
+def test_cgroup_v1_limits(cgroup_root):
+    paths = {'cpu': '/galaxy', 'cpuacct': '/galaxy', 'memory': '/galaxy'}
+    cgroup_root.join('cpu', 'galaxy', 'cpu.cfs_quota_us').write('-1\n', ensure=True)
+    cgroup_root.join('cpu', 'galaxy', 'cpu.cfs_period_us').write('100000\n')
+    cgroup_root.join('memory', 'galaxy', 'memory.limit_in_bytes').write('9223372036854771712\n', ensure=True)
+    assert resources.cgroup_cpu_limit(paths) is None
+    assert resources.cgroup_memory_limit(paths) is None
+    cgroup_root.join('cpu', 'galaxy', 'cpu.cfs_quota_us').write('200000\n')
+    cgroup_root.join('memory', 'galaxy', 'memory.limit_in_bytes').write(f'{4 * 1024 ** 3}\n')
+    assert resources.cgroup_cpu_limit(paths) == 2
+    assert resources.cgroup_memory_limit(paths) == 4 * 1024 ** 3
@@ -0,0 +1,116 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from click import ClickException
+from gravity import process_manager
+from gravity.process_manager import systemd_manager
+
+
+@pytest.fixture
+def unit_dir(tmp_path, monkeypatch):
+    unit_dir = tmp_path / 'units'
+    monkeypatch.setenv('GRAVITY_PROCESS_MANAGER', 'systemd')
+    monkeypatch.setenv('GRAVITY_SYSTEMD_UNIT_DIR', str(unit_dir))
+    # never touch the systemd instance of the host running the tests
+    monkeypatch.setattr(systemd_manager, 'SYSTEMD_RUNTIME_DIR', str(tmp_path / 'no-systemd'))
+    # write user units unless a test asks for system units
+    monkeypatch.setattr(systemd_manager.os, 'geteuid', lambda: 1000)
+    return unit_dir
+
+
+def _update(state_dir):
+    with process_manager.process_manager(state_dir=state_dir) as pm:
+        assert isinstance(pm, systemd_manager.SystemdProcessManager)
+        pm.update()
+
+
+def test_process_manager_class(monkeypatch):
+    monkeypatch.delenv('GRAVITY_PROCESS_MANAGER', raising=False)
+    assert process_manager.process_manager_class().__name__ == 'SupervisorProcessManager'
+    assert process_manager.process_manager_class('systemd') is systemd_manager.SystemdProcessManager
+    monkeypatch.setenv('GRAVITY_PROCESS_MANAGER', 'systemd')
+    assert process_manager.process_manager_class() is systemd_manager.SystemdProcessManager
+    with pytest.raises(ClickException):
+        process_manager.process_manager_class('launchd')
+
+
+def test_render_units(galaxy_yml, default_config_manager, unit_dir):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'virtualenv': '/srv/galaxy/venv',
+        'gunicorn': {'resources': {'cpu_affinity': '0-1', 'oom_score_adj': -500}},
+        'handlers': {'handler': {'processes': 1, 'pools': ['job-handlers']}},
+    }}))
+    default_config_manager.add([str(galaxy_yml)])
+    _update(default_config_manager.state_dir)
+    assert sorted(os.listdir(unit_dir)) == [
+        'galaxy-celery-beat.service', 'galaxy-celery.service', 'galaxy-gunicorn.service', 'galaxy-handler_0.service', 'galaxy.target',
+    ]
+    gunicorn_unit = (unit_dir / 'galaxy-gunicorn.service').read_text()
+    assert gunicorn_unit.startswith(systemd_manager.MANAGED_HEADER)
+    assert "ExecStart=/srv/galaxy/venv/bin/gunicorn 'galaxy.webapps.galaxy.fast_factory:factory()'" in gunicorn_unit
+    assert 'ExecReload=/bin/kill -HUP $MAINPID' in gunicorn_unit
+    assert 'PartOf=galaxy.target' in gunicorn_unit
+    assert 'CPUAffinity=0-1\n' in gunicorn_unit
+    assert 'OOMScoreAdjust=-500\n' in gunicorn_unit
+    assert 'Nice=' not in gunicorn_unit
+    assert f'StandardOutput=append:{default_config_manager.state_dir}/log/gunicorn.log' in gunicorn_unit
+    handler_unit = (unit_dir / 'galaxy-handler_0.service').read_text()
+    assert 'After=network.target galaxy-gunicorn.service galaxy-celery.service\n' in handler_unit
+    assert '--server-name=handler_0 --attach-to-pool=job-handlers' in handler_unit
+    assert 'ExecReload' not in handler_unit
+    target = (unit_dir / 'galaxy.target').read_text()
+    assert 'Wants=galaxy-gunicorn.service galaxy-celery.service galaxy-celery-beat.service galaxy-handler_0.service\n' in target
+
+
+def test_update_units(galaxy_yml, default_config_manager, unit_dir):
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'handlers': {'handler': {'processes': 1}}}}))
+    default_config_manager.add([str(galaxy_yml)])
+    _update(default_config_manager.state_dir)
+    unmanaged_unit = unit_dir / 'other.service'
+    unmanaged_unit.write_text('[Service]\nExecStart=/bin/true\n')
+    mtimes = {path.name: path.stat().st_mtime_ns for path in unit_dir.iterdir()}
+    # unchanged units are not rewritten
+    _update(default_config_manager.state_dir)
+    assert {path.name: path.stat().st_mtime_ns for path in unit_dir.iterdir()} == mtimes
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'celery': {'enable': False, 'enable_beat': False},
+        'handlers': {'handler': {'processes': 2}},
+    }}))
+    _update(default_config_manager.state_dir)
+    assert sorted(os.listdir(unit_dir)) == [
+        'galaxy-gunicorn.service', 'galaxy-handler_0.service', 'galaxy-handler_1.service', 'galaxy.target', 'other.service',
+    ]
+    assert (unit_dir / 'galaxy-gunicorn.service').stat().st_mtime_ns == mtimes['galaxy-gunicorn.service']
+    assert 'galaxy-celery.service' not in (unit_dir / 'galaxy-handler_0.service').read_text()
+    assert Path(unmanaged_unit).read_text() == '[Service]\nExecStart=/bin/true\n'
+    # removing the config removes all of its units
+    default_config_manager.remove([str(galaxy_yml)])
+    _update(default_config_manager.state_dir)
+    assert os.listdir(unit_dir) == ['other.service']
+
+
+def test_parse_show_output():
+    output = 'Id=galaxy-gunicorn.service\nActiveState=active\nMainPID=42\n\nId=galaxy-celery.service\nActiveState=failed\nMainPID=0\n'
+    assert systemd_manager.parse_show_output(output) == [
+        {'Id': 'galaxy-gunicorn.service', 'ActiveState': 'active', 'MainPID': '42'},
+        {'Id': 'galaxy-celery.service', 'ActiveState': 'failed', 'MainPID': '0'},
+    ]
+
+
+def test_system_units_user(galaxy_yml, default_config_manager, unit_dir, monkeypatch):
+    monkeypatch.setattr(systemd_manager.os, 'geteuid', lambda: 0)
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {'celery': {'enable': False, 'enable_beat': False}}}))
+    default_config_manager.add([str(galaxy_yml)])
+    # system units are not written without a user to run them as
+    with pytest.raises(ClickException, match='galaxy_user'):
+        _update(default_config_manager.state_dir)
+    assert not unit_dir.exists() or os.listdir(unit_dir) == []
+    galaxy_yml.write(json.dumps({'galaxy': None, 'gravity': {
+        'galaxy_user': 'galaxy', 'galaxy_group': 'galaxy', 'celery': {'enable': False, 'enable_beat': False},
+    }}))
+    _update(default_config_manager.state_dir)
+    gunicorn_unit = (unit_dir / 'galaxy-gunicorn.service').read_text()
+    assert 'User=galaxy\nGroup=galaxy\n' in gunicorn_unit
+    assert 'WantedBy=multi-user.target' in (unit_dir / 'galaxy.target').read_text()